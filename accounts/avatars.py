@@ -0,0 +1,134 @@
+"""
+Avatar renditions.
+
+The uploaded avatar is kept as is and square renditions (AVATAR_RENDITION_SIZES)
+are generated from it, EXIF orientation applied, by a background thread
+once the upload is committed. Their paths are stored in
+User.avatar_renditions, so templates never load the original, and
+User.avatar_source records which upload they come from: a user is
+processed again only when the avatar file changes.
+"""
+
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMAT = 'JPEG'
+RENDITION_QUALITY = 85
+RENDITIONS_DIR = 'avatars/renditions'
+
+_executor = None
+
+
+def rendition_sizes():
+    return sorted(getattr(settings, 'AVATAR_RENDITION_SIZES', (300, 96, 48)), reverse=True)
+
+
+def render(image, size):
+    """Square crop of `size` pixels, as JPEG bytes."""
+    rendition = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    rendition.save(buffer, RENDITION_FORMAT, quality=RENDITION_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def load_image(field):
+    """Open the uploaded avatar upright and in RGB (transparency on white)."""
+    with field.storage.open(field.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def process_avatar(user):
+    """
+    Build the renditions of the current avatar of `user` and store their paths.
+    Returns False if the avatar changed meanwhile (the newer upload gets its own run).
+    """
+    from .models import User
+
+    field = user.avatar
+    source = field.name or ''
+    storage = field.storage
+    renditions = {}
+
+    if source:
+        try:
+            image = load_image(field)
+        except (OSError, ValueError) as error:
+            logger.warning('Avatar of user %s cannot be processed: %s', user.pk, error)
+            image = None
+        if image is not None:
+            stem = os.path.splitext(os.path.basename(source))[0]
+            for size in rendition_sizes():
+                name = f'{RENDITIONS_DIR}/{user.pk}/{stem}_{size}.jpg'
+                renditions[str(size)] = storage.save(name, ContentFile(render(image, size)))
+
+    # Only if the avatar is still the processed one
+    current = Q(avatar=source) if source else Q(avatar='') | Q(avatar__isnull=True)
+    updated = User.objects.filter(current, pk=user.pk).update(
+        avatar_renditions=renditions,
+        avatar_source=source
+    )
+    if updated:
+        stale = set(user.avatar_renditions.values()) - set(renditions.values())
+        user.avatar_renditions, user.avatar_source = renditions, source
+    else:
+        stale = set(renditions.values())
+    for name in stale:
+        storage.delete(name)
+    return bool(updated)
+
+
+def _run(user_id):
+    from .models import User
+
+    close_old_connections()
+    try:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None and user.avatar_pending():
+            process_avatar(user)
+    except Exception:
+        logger.exception('Avatar processing failed for user %s', user_id)
+    finally:
+        connection.close()
+
+
+def schedule(user_id):
+    """Process the avatar of a user in the background (inline if AVATAR_ASYNC is off)."""
+    global _executor
+    if not getattr(settings, 'AVATAR_ASYNC', True):
+        from .models import User
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None and user.avatar_pending():
+            process_avatar(user)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+            thread_name_prefix='avatars'
+        )
+    _executor.submit(_run, user_id)
+
+
+def pending_users(queryset):
+    """Users whose renditions do not match their avatar."""
+    return queryset.filter(
+        (~Q(avatar='') & Q(avatar__isnull=False) & ~Q(avatar=F('avatar_source')))
+        | ((Q(avatar='') | Q(avatar__isnull=True)) & ~Q(avatar_source=''))
+    )
@@ -41,8 +41,9 @@ def purchase_ready_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        if not request.user.is_purchase_ready():
-            missing_fields = request.user.get_missing_profile_fields()
+        readiness = request.user.profile_readiness
+        if not readiness.is_purchase_ready:
+            missing_fields = readiness.missing_fields
             
             if 'address' in missing_fields:
                 messages.warning(
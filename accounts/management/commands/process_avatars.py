@@ -0,0 +1,34 @@
+"""
+Build the avatar renditions of the users whose renditions do not match
+their avatar: existing avatars uploaded before renditions were introduced,
+or uploads whose background processing was lost (e.g. a restart).
+
+Example:
+    python manage.py process_avatars
+    python manage.py process_avatars --all
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.avatars import pending_users, process_avatar
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Build the missing avatar renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild the renditions of every avatar')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['all']:
+            users = users.exclude(avatar='').exclude(avatar__isnull=True)
+        else:
+            users = pending_users(users)
+
+        count = 0
+        for user in users.iterator():
+            if process_avatar(user):
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f'Avatar elaborati: {count}'))
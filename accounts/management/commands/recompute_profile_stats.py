@@ -0,0 +1,20 @@
+"""
+Rebuild total_orders and total_spent of every user profile from the orders
+with a completed payment, in a single set-based UPDATE. The payment signals
+keep them up to date; run this after imports or bulk payment changes.
+
+Example:
+    python manage.py recompute_profile_stats
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the order statistics of all user profiles'
+
+    def handle(self, *args, **options):
+        count = UserProfile.recompute_all_stats()
+        self.stdout.write(self.style.SUCCESS(f'Statistiche ricalcolate per {count} profili'))
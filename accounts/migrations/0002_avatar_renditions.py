@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Paths of the resized avatars by size in pixels', verbose_name='avatar renditions'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_source',
+            field=models.CharField(blank=True, editable=False, help_text='Avatar file the renditions were built from', max_length=255, verbose_name='avatar source'),
+        ),
+    ]
@@ -4,10 +4,14 @@ Modern Django 5.0 implementation with custom User model.
 """
 
 from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
-from PIL import Image
+from core.tracking import DirtyFieldsMixin
+from dataclasses import dataclass
+from decimal import Decimal
 import os
 
 
@@ -77,6 +81,20 @@ class User(AbstractUser):
         null=True,
         help_text=_('Upload a profile picture')
     )
+    avatar_renditions = models.JSONField(
+        _('avatar renditions'),
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text=_('Paths of the resized avatars by size in pixels')
+    )
+    avatar_source = models.CharField(
+        _('avatar source'),
+        max_length=255,
+        blank=True,
+        editable=False,
+        help_text=_('Avatar file the renditions were built from')
+    )
     
     # Preferences
     newsletter_subscription = models.BooleanField(
@@ -133,72 +151,123 @@ class User(AbstractUser):
             self.email
         ])
     
+    @cached_property
+    def profile_readiness(self):
+        """
+        ProfileReadiness snapshot, computed once per instance: request.user
+        is loaded on every request, so this is once per request.
+        """
+        return ProfileReadiness.for_user(self)
+    
+    def forget_profile_readiness(self):
+        self.__dict__.pop('profile_readiness', None)
+    
     def is_purchase_ready(self):
         """Check if user profile is complete for making purchases."""
-        basic_complete = self.is_profile_complete()
-        has_phone = bool(self.phone)
-        has_address = self.addresses.filter(is_active=True).exists()
-        
-        return basic_complete and has_phone and has_address
+        return self.profile_readiness.is_purchase_ready
     
     def get_profile_completion_percentage(self):
         """Get profile completion percentage."""
-        total_fields = 6
-        completed_fields = 0
-        
-        # Basic required fields
-        if self.first_name:
-            completed_fields += 1
-        if self.last_name:
-            completed_fields += 1
-        if self.email:
-            completed_fields += 1
-        
-        # Purchase-ready fields
-        if self.phone:
-            completed_fields += 1
-        if self.addresses.filter(is_active=True).exists():
-            completed_fields += 1
-        if self.avatar:
-            completed_fields += 1
-            
-        return int((completed_fields / total_fields) * 100)
+        return self.profile_readiness.completion_percentage
     
     def get_missing_profile_fields(self):
         """Get list of missing profile fields for purchase readiness."""
-        missing = []
+        return self.profile_readiness.missing_fields
+    
+    def avatar_pending(self):
+        """Check if the avatar renditions do not match the current avatar."""
+        return (self.avatar.name or '') != self.avatar_source
+    
+    def get_avatar_url(self, size=300):
+        """
+        Return the URL of the smallest avatar rendition of at least `size` pixels
+        (the largest one if none is big enough), None while not processed yet.
+        """
+        if not self.avatar_renditions or self.avatar_pending():
+            return None
+        sizes = sorted(int(key) for key in self.avatar_renditions)
+        best = next((value for value in sizes if value >= size), sizes[-1])
+        return self.avatar.storage.url(self.avatar_renditions[str(best)])
+    
+    def save(self, *args, **kwargs):
+        """Override save to schedule the avatar renditions when the avatar file changed."""
+        super().save(*args, **kwargs)
+        self.forget_profile_readiness()
         
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'avatar' in update_fields) and self.avatar_pending():
+            from .avatars import schedule
+            user_id = self.pk
+            transaction.on_commit(lambda: schedule(user_id))
+
+
+@dataclass(frozen=True)
+class ProfileReadiness:
+    """
+    Profile completion state of a user, read with one query
+    (user fields and active address count) by User.profile_readiness.
+    """
+    first_name: str
+    last_name: str
+    email: str
+    phone: str
+    has_avatar: bool
+    active_addresses: int
+    
+    TOTAL_FIELDS = 6
+    
+    @classmethod
+    def for_user(cls, user):
+        row = User.objects.filter(pk=user.pk).annotate(
+            active_addresses=models.Count('addresses', filter=models.Q(addresses__is_active=True))
+        ).values('first_name', 'last_name', 'email', 'phone', 'avatar', 'active_addresses').first()
+        if row is None:
+            # Not saved yet
+            row = {
+                'first_name': user.first_name, 'last_name': user.last_name, 'email': user.email,
+                'phone': user.phone, 'avatar': user.avatar.name, 'active_addresses': 0,
+            }
+        return cls(
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            email=row['email'],
+            phone=row['phone'],
+            has_avatar=bool(row['avatar']),
+            active_addresses=row['active_addresses'],
+        )
+    
+    @property
+    def has_address(self):
+        return self.active_addresses > 0
+    
+    @property
+    def is_profile_complete(self):
+        return all([self.first_name, self.last_name, self.email])
+    
+    @property
+    def is_purchase_ready(self):
+        return self.is_profile_complete and bool(self.phone) and self.has_address
+    
+    @property
+    def completion_percentage(self):
+        completed_fields = sum(map(bool, [
+            self.first_name, self.last_name, self.email,
+            self.phone, self.has_address, self.has_avatar,
+        ]))
+        return int((completed_fields / self.TOTAL_FIELDS) * 100)
+    
+    @property
+    def missing_fields(self):
+        missing = []
         if not self.first_name:
             missing.append('first_name')
         if not self.last_name:
             missing.append('last_name')
         if not self.phone:
             missing.append('phone')
-        if not self.addresses.filter(is_active=True).exists():
+        if not self.has_address:
             missing.append('address')
-            
         return missing
-    
-    def save(self, *args, **kwargs):
-        """Override save to resize avatar image."""
-        super().save(*args, **kwargs)
-        
-        if self.avatar:
-            self._resize_avatar()
-    
-    def _resize_avatar(self):
-        """Resize avatar to 300x300 pixels."""
-        try:
-            img = Image.open(self.avatar.path)
-            
-            # Resize if larger than 300x300
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size, Image.Resampling.LANCZOS)
-                img.save(self.avatar.path)
-        except (OSError, IOError):
-            # Handle cases where image cannot be processed
-            pass
 
 
 class Address(models.Model):
@@ -284,9 +353,20 @@ class Address(models.Model):
             ).exclude(pk=self.pk).update(is_default=False)
         
         super().save(*args, **kwargs)
+        
+        # The active address count of the readiness snapshot may have changed
+        if Address.user.is_cached(self):
+            self.user.forget_profile_readiness()
+    
+    def delete(self, *args, **kwargs):
+        """Override delete to drop the readiness snapshot, like save."""
+        result = super().delete(*args, **kwargs)
+        if Address.user.is_cached(self):
+            self.user.forget_profile_readiness()
+        return result
 
 
-class UserProfile(models.Model):
+class UserProfile(DirtyFieldsMixin, models.Model):
     """
     Extended user profile with additional e-commerce related fields.
     """
@@ -363,9 +443,46 @@ class UserProfile(models.Model):
         return f"{self.user.email} - Profile"
     
     def update_stats(self):
-        """Update user statistics from orders."""
-        # This will be implemented when we add the Order model
-        pass
+        """Rebuild the statistics of this profile from the paid orders."""
+        UserProfile.objects.filter(pk=self.pk).update(**UserProfile.stats_expressions())
+        self.refresh_from_db(fields=['total_orders', 'total_spent'])
+    
+    @classmethod
+    def recompute_all_stats(cls):
+        """
+        Rebuild the statistics of every profile in a single UPDATE, with the
+        order count and amount of each user computed by grouped subqueries.
+        """
+        return cls.objects.update(**cls.stats_expressions())
+    
+    @staticmethod
+    def stats_expressions():
+        """Orders with a completed payment and their paid amount, per profile user."""
+        from core.models import Order
+        
+        paid_orders = Order.objects.filter(
+            user=models.OuterRef('user_id'),
+            payment__payment_status='completed'
+        ).order_by().values('user')
+        return {
+            'total_orders': Coalesce(models.Subquery(
+                paid_orders.annotate(count=models.Count('id')).values('count')
+            ), 0),
+            'total_spent': Coalesce(models.Subquery(
+                paid_orders.annotate(amount=models.Sum('payment__amount')).values('amount')
+            ), Decimal('0.00'), output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+        }
+    
+    @classmethod
+    def record_payment(cls, user_id, amount, orders=1):
+        """
+        Add a completed payment (or remove it, with negative `orders` and
+        `amount`) with a single F() update, never going below zero.
+        """
+        cls.objects.filter(user_id=user_id).update(
+            total_orders=Greatest(models.F('total_orders') + orders, 0),
+            total_spent=Greatest(models.F('total_spent') + amount, Decimal('0.00')),
+        )
 
 
 # Signal to create profile when user is created
@@ -379,9 +496,19 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save UserProfile when User is saved."""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-    else:
-        UserProfile.objects.create(user=instance)
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Save the UserProfile loaded with the user (only its changed fields), or
+    create it if missing on a full save. Partial saves such as the login
+    `last_login` update touch no profile.
+    """
+    if created:
+        return
+    if User.profile.is_cached(instance):
+        try:
+            instance.profile.save()
+            return
+        except UserProfile.DoesNotExist:
+            pass
+    if update_fields is None:
+        UserProfile.objects.get_or_create(user=instance)
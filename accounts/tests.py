@@ -1,3 +1,105 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from core.models import Order, Payment
+
+from .models import Address, ProfileReadiness, User, UserProfile
+
+
+class ProfileStatsTests(TestCase):
+    """The payment signals keep the profile statistics equal to a full recompute."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cliente@example.com', 'secret', first_name='Anna', last_name='Rossi')
+
+    def order(self, amount, payment_status='pending'):
+        order = Order.objects.create(
+            user=self.user,
+            email=self.user.email,
+            full_name='Anna Rossi',
+            phone='3331234567',
+            shipping_address='Via Roma 1',
+            shipping_city='Roma',
+            shipping_state='RM',
+            shipping_postal_code='00100',
+        )
+        return Payment.objects.create(
+            order=order, payment_method='cash_on_delivery', amount=Decimal(amount), payment_status=payment_status
+        )
+
+    def stats(self):
+        return UserProfile.objects.values_list('total_orders', 'total_spent').get(user=self.user)
+
+    def assertStats(self, orders, spent):
+        """Check the incremental statistics, then that a full recompute agrees."""
+        self.assertEqual(self.stats(), (orders, Decimal(spent)))
+        UserProfile.recompute_all_stats()
+        self.assertEqual(self.stats(), (orders, Decimal(spent)))
+
+    def test_payment_lifecycle(self):
+        payment = self.order('30.00')
+        self.order('12.50', payment_status='completed')
+        self.assertStats(1, '12.50')
+
+        for status, orders, spent in (
+            ('completed', 2, '42.50'),
+            ('refunded', 1, '12.50'),
+            ('completed', 2, '42.50'),
+            ('completed', 2, '42.50'),
+        ):
+            payment.payment_status = status
+            payment.save()
+            self.assertStats(orders, spent)
+
+        # Saved from an instance that was not loaded: the previous status is queried
+        Payment(
+            pk=payment.pk, order=payment.order, payment_method='cash_on_delivery',
+            amount=payment.amount, payment_status='refunded', created_at=payment.created_at,
+        ).save()
+        self.assertStats(1, '12.50')
+        payment = Payment.objects.get(pk=payment.pk)
+        payment.payment_status = 'completed'
+        payment.save()
+
+        Payment.objects.get(pk=payment.pk).delete()
+        self.assertStats(1, '12.50')
+
+    def test_never_below_zero(self):
+        UserProfile.record_payment(self.user.pk, Decimal('5.00'))
+        UserProfile.record_payment(self.user.pk, Decimal('-20.00'), orders=-3)
+        self.assertEqual(self.stats(), (0, Decimal('0.00')))
+
+
+class ProfileReadinessTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'cliente@example.com', 'secret', first_name='Anna', last_name='Rossi', phone='3331234567'
+        )
+
+    def address(self, **values):
+        return Address.objects.create(
+            user=self.user, full_name='Anna Rossi', street_address='Via Roma 1', city='Roma',
+            state_province='RM', postal_code='00100', **values
+        )
+
+    def test_for_user(self):
+        self.address(address_type='billing')
+        self.address(address_type='shipping')
+        self.address(is_active=False)
+
+        with self.assertNumQueries(1):
+            readiness = ProfileReadiness.for_user(self.user)
+        self.assertEqual(readiness.active_addresses, 2)
+        self.assertTrue(readiness.is_purchase_ready)
+        self.assertEqual(readiness.missing_fields, [])
+        self.assertEqual(readiness.completion_percentage, 83)
+
+    def test_address_changes_forget_the_snapshot(self):
+        self.assertFalse(self.user.is_purchase_ready())
+        self.address()
+        self.assertTrue(self.user.is_purchase_ready())
+
+        self.user.addresses.get().delete()
+        self.assertFalse(self.user.is_purchase_ready())
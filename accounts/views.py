@@ -132,7 +132,9 @@ class ProfileView(LoginRequiredMixin, TemplateView):
             'addresses': user.addresses.filter(is_active=True)[:3],
             'title': 'Il Mio Profilo',
             'page_title': 'Pannello',
-            # 'recent_orders': user.orders.all()[:5],  # Will be added when we create orders
+            # Kept up to date by the payment signals, no query on orders
+            'total_orders': user.profile.total_orders,
+            'total_spent': user.profile.total_spent,
         })
         
         return context
@@ -400,35 +402,34 @@ class ProfileCompletionView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         user = self.request.user
-        missing_fields = user.get_missing_profile_fields()
-        completion_percentage = user.get_profile_completion_percentage()
+        readiness = user.profile_readiness
         
         # Determine next step
         next_step = None
         next_step_url = None
         
-        if not user.first_name or not user.last_name:
+        if not readiness.first_name or not readiness.last_name:
             next_step = 'Completa le informazioni base'
             next_step_url = reverse('accounts:profile-edit')
-        elif not user.phone:
+        elif not readiness.phone:
             next_step = 'Aggiungi numero di telefono'
             next_step_url = reverse('accounts:profile-edit')
-        elif not user.addresses.filter(is_active=True).exists():
+        elif not readiness.has_address:
             next_step = 'Aggiungi indirizzo di consegna'
             next_step_url = reverse('accounts:address-create')
         
         context.update({
-            'missing_fields': missing_fields,
-            'completion_percentage': completion_percentage,
-            'is_profile_complete': user.is_profile_complete(),
-            'is_purchase_ready': user.is_purchase_ready(),
+            'missing_fields': readiness.missing_fields,
+            'completion_percentage': readiness.completion_percentage,
+            'is_profile_complete': readiness.is_profile_complete,
+            'is_purchase_ready': readiness.is_purchase_ready,
             'next_step': next_step,
             'next_step_url': next_step_url,
             'title': 'Completa il Tuo Profilo',
             'page_title': 'Configurazione Profilo',
             # Additional context for template
-            'profile_complete': user.first_name and user.last_name and user.phone,
-            'has_address': user.addresses.filter(is_active=True).exists(),
+            'profile_complete': readiness.first_name and readiness.last_name and readiness.phone,
+            'has_address': readiness.has_address,
             'preferences_set': user.profile.email_notifications or user.profile.sms_notifications,
             'newsletter_subscribed': user.newsletter_subscription,
         })
@@ -440,11 +441,11 @@ class ProfileCompletionView(LoginRequiredMixin, TemplateView):
 def profile_completion_status(request):
     """AJAX endpoint for profile completion status."""
     
-    user = request.user
+    readiness = request.user.profile_readiness
     
     return JsonResponse({
-        'completion_percentage': user.get_profile_completion_percentage(),
-        'is_profile_complete': user.is_profile_complete(),
-        'is_purchase_ready': user.is_purchase_ready(),
-        'missing_fields': user.get_missing_profile_fields()
+        'completion_percentage': readiness.completion_percentage,
+        'is_profile_complete': readiness.is_profile_complete,
+        'is_purchase_ready': readiness.is_purchase_ready,
+        'missing_fields': readiness.missing_fields
     })
@@ -4,7 +4,7 @@ Admin configuration for core e-commerce models.
 
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Cart, CartItem, Order, OrderItem, Payment, Wishlist, Review
+from .models import Cart, CartItem, Order, OrderItem, Payment, Promotion, Wishlist, Review, ShippingZone, ShippingBand
 
 
 class CartItemInline(admin.TabularInline):
@@ -51,9 +51,12 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('get_total',)
-    fields = ('product', 'product_title', 'product_sku', 'quantity', 'price', 'get_total')
+    fields = ('product', 'product_title', 'product_sku', 'quantity', 'price', 'discount', 'get_total')
     
     def get_total(self, obj):
+        # Empty form of the "add another" row
+        if obj.price is None:
+            return '-'
         return f"€{obj.get_total():.2f}"
     get_total.short_description = 'Totale'
 
@@ -66,6 +69,7 @@ class OrderAdmin(admin.ModelAdmin):
         'full_name', 
         'email', 
         'get_total_display', 
+        'item_count',
         'order_status_badge',
         'created_at'
     )
@@ -75,8 +79,11 @@ class OrderAdmin(admin.ModelAdmin):
         'order_id', 
         'created_at', 
         'updated_at', 
-        'get_total_items',
+        'item_count',
+        'line_count',
         'subtotal',
+        'discount',
+        'coupon_code',
         'shipping_cost',
         'tax',
         'total'
@@ -108,13 +115,24 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Totali', {
-            'fields': ('subtotal', 'shipping_cost', 'tax', 'total')
+            'fields': ('item_count', 'line_count', 'subtotal', 'discount', 'coupon_code', 'shipping_cost', 'tax', 'total')
         }),
         ('Timestamp', {
             'fields': ('created_at', 'updated_at')
         }),
     )
     inlines = [OrderItemInline]
+    actions = ['recalculate_totals']
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Items or shipping address changed
+        form.instance.calculate_totals()
+    
+    @admin.action(description='Ricalcola i totali con le regole attuali')
+    def recalculate_totals(self, request, queryset):
+        count = queryset.recalculate_totals()
+        self.message_user(request, f'Totali ricalcolati per {count} ordini.')
     
     def get_total_display(self, obj):
         return f"€{obj.total:.2f}"
@@ -141,16 +159,76 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     """Admin for OrderItem model."""
-    list_display = ('order', 'product_title', 'product_sku', 'quantity', 'price', 'get_total_display')
+    list_display = ('order', 'product_title', 'product_sku', 'quantity', 'price', 'discount', 'get_total_display')
     list_filter = ('order__created_at',)
     search_fields = ('order__order_id', 'product_title', 'product_sku')
     readonly_fields = ('get_total',)
     
+    def save_model(self, request, obj, form, change):
+        previous = form.initial.get('order')
+        super().save_model(request, obj, form, change)
+        Order.objects.filter(pk__in=[obj.order_id, previous]).recalculate_totals()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Order.objects.filter(pk=obj.order_id).recalculate_totals()
+    
+    def delete_queryset(self, request, queryset):
+        order_ids = list(queryset.values_list('order_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        Order.objects.filter(pk__in=order_ids).recalculate_totals()
+    
     def get_total_display(self, obj):
         return f"€{obj.get_total():.2f}"
     get_total_display.short_description = 'Totale'
 
 
+class ShippingBandInline(admin.TabularInline):
+    """Inline admin for the weight bands of a shipping zone."""
+    model = ShippingBand
+    extra = 1
+    fields = ('max_weight', 'price', 'free_over')
+
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    """Admin for ShippingZone model."""
+    list_display = ('name', 'countries', 'postal_code_prefixes', 'priority', 'is_active')
+    list_filter = ('is_active',)
+    list_editable = ('priority', 'is_active')
+    search_fields = ('name', 'countries', 'postal_code_prefixes')
+    inlines = [ShippingBandInline]
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    """Admin for Promotion model."""
+    list_display = ('name', 'kind', 'value', 'code', 'starts_at', 'ends_at', 'is_active', 'uses')
+    list_filter = ('kind', 'is_active', 'starts_at', 'ends_at')
+    list_editable = ('is_active',)
+    search_fields = ('name', 'code')
+    readonly_fields = ('uses', 'created_at')
+    filter_horizontal = ('products', 'categories', 'tags')
+    fieldsets = (
+        ('Promozione', {
+            'fields': ('name', 'kind', 'value', 'buy_quantity', 'get_quantity', 'is_active')
+        }),
+        ('Prodotti', {
+            'fields': ('products', 'categories', 'tags'),
+            'description': 'Nessuna selezione: tutto il catalogo'
+        }),
+        ('Periodo', {
+            'fields': ('starts_at', 'ends_at')
+        }),
+        ('Codice Sconto', {
+            'fields': ('code', 'min_subtotal', 'max_uses', 'uses')
+        }),
+        ('Timestamp', {
+            'fields': ('created_at',)
+        }),
+    )
+
+
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     """Admin for Payment model."""
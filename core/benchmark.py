@@ -0,0 +1,904 @@
+"""
+Benchmark suite for the storefront and the back office.
+
+`build_dataset` fills the database with a synthetic catalog, customers,
+orders and stock movements at a configurable scale. `run_benchmark` replays
+the main pages and AJAX endpoints in-process with the Django test client
+from a pool of threads, measuring latency percentiles and query counts.
+`run_pool_check` exercises the Postgres connection pool,
+`run_pricing_benchmark` prices random baskets with core.pricing and
+`run_promotion_benchmark` evaluates large carts under many promotions.
+
+Used by the `bench_dataset`, `benchmark`, `db_pool_check`,
+`benchmark_pricing` and `benchmark_promotions` management commands.
+"""
+
+import math
+import platform
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from accounts.models import User
+from ordini.models import StockMovement
+from products.models import Category, Product, ProductImages
+from .cookie_cart import CookieCart, cookie_cart_enabled, cookie_name
+from .instrumentation import QueryRecorder, pool_stats
+from .pricing import price_lines, pricing_rules
+from .promotions import CompiledPromotion, PromotionIndex, discount_lines
+from .models import CartItem, Cart, Order, OrderItem, Payment, PAYMENT_METHOD
+from .sessions import SESSION_STRATEGIES
+
+# Identifiers of the synthetic rows: real ids never use these prefixes
+BENCH_PREFIX = 'bench'
+BENCH_EMAIL_DOMAIN = 'bench.example.com'
+BENCH_STAFF_EMAIL = f'staff@{BENCH_EMAIL_DOMAIN}'
+BENCH_CUSTOMER_EMAIL = f'customer@{BENCH_EMAIL_DOMAIN}'
+
+WORDS = [
+    'confetti', 'bomboniera', 'scatola', 'sacchetto', 'nastro', 'battesimo',
+    'comunione', 'cresima', 'matrimonio', 'laurea', 'nascita', 'argento',
+    'cristallo', 'porcellana', 'legno', 'tulle', 'pizzo', 'fiori', 'cuore',
+    'angelo', 'albero', 'vita', 'candela', 'profumatore', 'segnaposto',
+    'bianco', 'rosa', 'azzurro', 'oro', 'avorio', 'classico', 'moderno',
+]
+
+
+def ean13(number):
+    """Return a valid EAN-13 code for a 12 digit number (check digit appended)."""
+    digits = f'{number:012d}'
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create store the given created/updated dates instead of now()."""
+    fields = [
+        field for model in models for field in model._meta.fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _batches(total, size):
+    """Yield (start, stop) ranges covering `total` rows."""
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+
+def dataset_exists():
+    """Check if a synthetic dataset is already loaded."""
+    return Product.objects.filter(pid__startswith=BENCH_PREFIX).exists()
+
+
+def build_dataset(products=5000, orders=20000, movements=50000, customers=500,
+                  categories=20, tags=200, images=2, batch_size=5000, seed=42, log=print):
+    """
+    Create the synthetic dataset with batched bulk inserts.
+    The same seed always produces the same data.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    # Users
+    staff = User.objects.create_user(
+        email=BENCH_STAFF_EMAIL, password=None,
+        first_name='Bench', last_name='Staff', is_staff=True
+    )
+    customer = User.objects.create_user(
+        email=BENCH_CUSTOMER_EMAIL, password=None,
+        first_name='Bench', last_name='Customer', phone='000000000'
+    )
+    User.objects.bulk_create([
+        User(email=f'user{i}@{BENCH_EMAIL_DOMAIN}', first_name='Bench', last_name=f'User {i}', password='!')
+        for i in range(customers)
+    ], batch_size=batch_size)
+    user_ids = [customer.pk] + list(
+        User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}', is_staff=False)
+        .exclude(pk=customer.pk).values_list('pk', flat=True)
+    )
+    log(f'Users: {len(user_ids) + 1}')
+
+    # Categories and tags
+    Category.objects.bulk_create([
+        Category(cid=f'{BENCH_PREFIX}{i:05d}', title=f'{rng.choice(WORDS).title()} {i}')
+        for i in range(categories)
+    ])
+    category_ids = list(Category.objects.filter(cid__startswith=BENCH_PREFIX).values_list('pk', flat=True))
+    Tag.objects.bulk_create([
+        Tag(name=f'{BENCH_PREFIX}-{rng.choice(WORDS)}-{i}', slug=f'{BENCH_PREFIX}-tag-{i}')
+        for i in range(tags)
+    ])
+    tag_ids = list(Tag.objects.filter(slug__startswith=f'{BENCH_PREFIX}-tag-').values_list('pk', flat=True))
+    log(f'Categories: {len(category_ids)}, tags: {len(tag_ids)}')
+
+    # Products with tags and images
+    product_ct = ContentType.objects.get_for_model(Product)
+    product_rows = []  # (id, pid, sku, title, price, weight)
+    with explicit_timestamps(Product, ProductImages):
+        for start, stop in _batches(products, batch_size):
+            batch = []
+            for i in range(start, stop):
+                price = Decimal(rng.randint(100, 20000)) / 100
+                discounted = rng.random() < 0.2
+                batch.append(Product(
+                    pid=f'{BENCH_PREFIX}{i:010d}',
+                    sku=f'b{i:07d}',
+                    ean=ean13(200000000000 + i),
+                    user_id=staff.pk,
+                    category_id=rng.choice(category_ids),
+                    title=f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+                    description=' '.join(rng.choice(WORDS) for _ in range(30)),
+                    price=price,
+                    old_price=(price * Decimal('1.25')).quantize(Decimal('0.01')) if discounted else Decimal('0.00'),
+                    stock_count=rng.randint(100, 100000),
+                    weight=Decimal(rng.randint(5, 500)) / 100,
+                    product_status='published' if rng.random() < 0.95 else 'draft',
+                    featured=rng.random() < 0.05,
+                    date=now - timedelta(days=rng.randint(0, 730)),
+                    updated=now - timedelta(days=rng.randint(0, 30)),
+                ))
+            Product.objects.bulk_create(batch)
+
+            ids = dict(Product.objects.filter(pid__in=[p.pid for p in batch]).values_list('pid', 'pk'))
+            tagged, product_images = [], []
+            for product in batch:
+                product.pk = ids[product.pid]
+                product_rows.append((product.pk, product.pid, product.sku, product.title, product.price, product.weight))
+                for tag_id in rng.sample(tag_ids, min(len(tag_ids), rng.randint(1, 5))):
+                    tagged.append(TaggedItem(content_type=product_ct, object_id=product.pk, tag_id=tag_id))
+                for n in range(images):
+                    product_images.append(ProductImages(product_id=product.pk, date=product.date))
+            TaggedItem.objects.bulk_create(tagged)
+            ProductImages.objects.bulk_create(product_images)
+            log(f'Products: {stop}/{products}')
+
+    # Orders with items and payments
+    methods = [method for method, label in PAYMENT_METHOD]
+    order_ids = []
+    rules = pricing_rules.get()
+    with explicit_timestamps(Order, Payment):
+        for start, stop in _batches(orders, batch_size):
+            batch, lines = [], {}
+            for i in range(start, stop):
+                created_at = now - timedelta(seconds=rng.randint(0, 730 * 24 * 3600))
+                items = [rng.choice(product_rows) for _ in range(rng.randint(1, 4))]
+                quantities = [rng.randint(1, 50) for _ in items]
+                postal_code = f'{rng.randint(10, 98)}100'
+                quote = price_lines(
+                    [(row[4], qty, row[5], None, False, Decimal('0.00')) for row, qty in zip(items, quantities)],
+                    'Italia', postal_code, rules
+                )
+                order_id = f'BENCH{i:010d}'
+                lines[order_id] = list(zip(items, quantities))
+                batch.append(Order(
+                    order_id=order_id,
+                    user_id=rng.choice(user_ids),
+                    email=f'order{i}@{BENCH_EMAIL_DOMAIN}',
+                    full_name=f'Cliente {i}',
+                    phone='000000000',
+                    shipping_address='Via Roma 1',
+                    shipping_city='Napoli',
+                    shipping_state='NA',
+                    shipping_postal_code=postal_code,
+                    subtotal=quote.subtotal,
+                    shipping_cost=quote.shipping,
+                    tax=quote.tax,
+                    total=quote.total,
+                    item_count=quote.item_count,
+                    line_count=quote.line_count,
+                    order_status=rng.choice(['pending', 'processing', 'shipped', 'delivered', 'delivered', 'cancelled']),
+                    created_at=created_at,
+                    updated_at=created_at,
+                ))
+            Order.objects.bulk_create(batch)
+
+            ids = dict(Order.objects.filter(order_id__in=list(lines)).values_list('order_id', 'pk'))
+            items, payments = [], []
+            for order in batch:
+                pk = ids[order.order_id]
+                order_ids.append(pk)
+                for (product_id, pid, sku, title, price, weight), quantity in lines[order.order_id]:
+                    items.append(OrderItem(
+                        order_id=pk, product_id=product_id, product_title=title,
+                        product_sku=sku, quantity=quantity, price=price,
+                    ))
+                completed = order.order_status not in ('pending', 'cancelled')
+                payments.append(Payment(
+                    payment_id=f'BPAY{pk:010d}',
+                    order_id=pk,
+                    payment_method=rng.choice(methods),
+                    payment_status='completed' if completed else 'pending',
+                    amount=order.total,
+                    created_at=order.created_at,
+                    updated_at=order.created_at,
+                    paid_at=order.created_at if completed else None,
+                ))
+            OrderItem.objects.bulk_create(items)
+            Payment.objects.bulk_create(payments)
+            log(f'Orders: {stop}/{orders}')
+
+    # Stock movements
+    with explicit_timestamps(StockMovement):
+        for start, stop in _batches(movements, batch_size):
+            batch = []
+            for i in range(start, stop):
+                product_id = rng.choice(product_rows)[0]
+                movement_type = rng.choice(['out', 'out', 'out', 'in', 'adjustment'])
+                quantity = rng.randint(1, 50)
+                if movement_type == 'out':
+                    quantity = -quantity
+                stock_before = rng.randint(100, 100000)
+                batch.append(StockMovement(
+                    product_id=product_id,
+                    order_id=rng.choice(order_ids) if order_ids and movement_type != 'adjustment' else None,
+                    movement_type=movement_type,
+                    quantity=quantity,
+                    stock_before=stock_before,
+                    stock_after=stock_before + quantity,
+                    created_by_id=staff.pk,
+                    created_at=now - timedelta(seconds=rng.randint(0, 730 * 24 * 3600)),
+                ))
+            StockMovement.objects.bulk_create(batch)
+            log(f'Stock movements: {stop}/{movements}')
+
+
+class Worker:
+    """State of one driver thread: its own clients and random generator."""
+
+    def __init__(self, fixtures, seed, index=0):
+        self.fixtures = fixtures
+        self.random = random.Random(seed)
+        self.iteration = 0
+        self.guest = Client()
+        # A customer per thread: concurrent get_or_create of the same user cart would duplicate it
+        self.customer_user = fixtures['customers'][index % len(fixtures['customers'])]
+        self.customer = Client()
+        self.customer.force_login(self.customer_user)
+        self.staff = Client()
+        self.staff.force_login(fixtures['staff'])
+
+    def pid(self):
+        return self.random.choice(self.fixtures['pids'])
+
+    def guest_cookie_cart(self):
+        cookie = self.guest.cookies.get(cookie_name())
+        return CookieCart.from_cookie(cookie.value if cookie else None)
+
+    def guest_item_id(self):
+        """Return the id of an item of the guest cart, adding one if needed."""
+        if cookie_cart_enabled():
+            cart = self.guest_cookie_cart()
+            if not cart.lines:
+                self.guest.post(reverse('core:add-to-cart', args=[self.pid()]), {'quantity': 1})
+                cart = self.guest_cookie_cart()
+            return next(iter(cart.lines))
+
+        cart = Cart.objects.filter(session_key=self.guest.session.session_key).first()
+        if cart is None or not cart.items.exists():
+            self.guest.post(reverse('core:add-to-cart', args=[self.pid()]), {'quantity': 1})
+            cart = Cart.objects.get(session_key=self.guest.session.session_key)
+        return cart.items.first().pk
+
+    def empty_guest_cart(self):
+        if cookie_cart_enabled():
+            self.guest.cookies.pop(cookie_name(), None)
+        else:
+            CartItem.objects.filter(cart__session_key=self.guest.session.session_key).delete()
+
+
+# Each scenario prepares its request (not measured) and returns
+# (client, method, path, data) for the request to be timed.
+
+def home(worker):
+    return worker.guest, 'get', reverse('core:home'), None
+
+
+def catalog(worker):
+    page = worker.random.randint(1, worker.fixtures['catalog_pages'])
+    return worker.guest, 'get', reverse('products:catalog'), {'page': page}
+
+
+def catalog_category(worker):
+    cid = worker.random.choice(worker.fixtures['cids'])
+    return worker.guest, 'get', reverse('products:catalog'), {'category': cid}
+
+
+def api_catalog(worker):
+    """Same page as catalog_category from the JSON API."""
+    cid = worker.random.choice(worker.fixtures['cids'])
+    return worker.guest, 'get', reverse('api:product-list'), {'category': cid, 'limit': 12}
+
+
+def api_product_detail(worker):
+    return worker.guest, 'get', reverse('api:product-detail', args=[worker.pid()]), None
+
+
+def search(worker):
+    return worker.guest, 'get', reverse('products:search'), {'q': worker.random.choice(WORDS)}
+
+
+def product_detail(worker):
+    return worker.guest, 'get', reverse('products:product-detail', args=[worker.pid()]), None
+
+
+def browse_with_cart(worker):
+    """Page views of a guest with a cart: the database load of its session and cart."""
+    worker.guest_item_id()
+    if worker.random.random() < 0.5:
+        return worker.guest, 'get', reverse('products:product-detail', args=[worker.pid()]), None
+    page = worker.random.randint(1, worker.fixtures['catalog_pages'])
+    return worker.guest, 'get', reverse('products:catalog'), {'page': page}
+
+
+def cart_add(worker):
+    worker.iteration += 1
+    if worker.iteration % 20 == 0:
+        worker.empty_guest_cart()
+    return worker.guest, 'post', reverse('core:add-to-cart', args=[worker.pid()]), {'quantity': 1}
+
+
+def cart_update(worker):
+    item_id = worker.guest_item_id()
+    quantity = worker.random.randint(1, 5)
+    return worker.guest, 'post', reverse('core:update-cart-item', args=[item_id]), {'quantity': quantity}
+
+
+def cart_remove(worker):
+    item_id = worker.guest_item_id()
+    return worker.guest, 'post', reverse('core:remove-from-cart', args=[item_id]), None
+
+
+def checkout(worker):
+    for _ in range(3):
+        worker.customer.post(reverse('core:add-to-cart', args=[worker.pid()]), {'quantity': 1})
+    return worker.customer, 'post', reverse('core:checkout-process'), {
+        'full_name': 'Bench Customer',
+        'email': worker.customer_user.email,
+        'phone': '000000000',
+        'shipping_address': 'Via Roma 1',
+        'shipping_city': 'Napoli',
+        'shipping_state': 'NA',
+        'shipping_postal_code': '80100',
+        'payment_method': 'cash_on_delivery',
+    }
+
+
+def checkout_succeeded(response):
+    """A checkout ends on the page of the new order; back to the checkout is a failure."""
+    if response.status_code != 302:
+        return False
+    try:
+        return resolve(response.url).view_name == 'core:order-detail'
+    except Resolver404:
+        return False
+
+
+def ordini_dashboard(worker):
+    return worker.staff, 'get', reverse('ordini:dashboard'), None
+
+
+def order_list(worker):
+    return worker.staff, 'get', reverse('ordini:order-list'), None
+
+
+SCENARIOS = {
+    'home': home,
+    'catalog': catalog,
+    'catalog_category': catalog_category,
+    'api_catalog': api_catalog,
+    'api_product_detail': api_product_detail,
+    'search': search,
+    'product_detail': product_detail,
+    'browse_with_cart': browse_with_cart,
+    'cart_add': cart_add,
+    'cart_update': cart_update,
+    'cart_remove': cart_remove,
+    'checkout': checkout,
+    'ordini_dashboard': ordini_dashboard,
+    'order_list': order_list,
+}
+
+# Scenarios whose responses must pass a check to count as successful,
+# the others fail on 5xx only
+SUCCESS_CHECKS = {
+    'checkout': checkout_succeeded,
+}
+
+
+def load_fixtures(sample=1000, threads=1):
+    """Load the ids the scenarios pick from."""
+    pids = list(
+        Product.objects.filter(pid__startswith=BENCH_PREFIX, product_status='published')
+        .order_by('?').values_list('pid', flat=True)[:sample]
+    )
+    published = Product.objects.filter(product_status='published', status=True, in_stock=True).count()
+    return {
+        'pids': pids,
+        'catalog_pages': max(1, published // 12),
+        'cids': list(Category.objects.values_list('cid', flat=True)) or [''],
+        'staff': User.objects.get(email=BENCH_STAFF_EMAIL),
+        'customer': User.objects.get(email=BENCH_CUSTOMER_EMAIL),
+        'customers': list(
+            User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}', is_staff=False).order_by('pk')[:threads]
+        ),
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(values))
+    return values[max(0, rank - 1)]
+
+
+def summarize(samples, elapsed):
+    """Latency and query statistics of a scenario (latencies in ms)."""
+    latencies = sorted(sample['ms'] for sample in samples)
+    queries = [sample['queries'] for sample in samples]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if not sample['ok']),
+        'status_codes': statuses,
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        'queries': {
+            'mean': round(statistics.fmean(queries), 2) if queries else 0.0,
+            'max': max(queries) if queries else 0,
+        },
+        'db_time_ms': round(statistics.fmean(sample['db_ms'] for sample in samples), 3) if samples else 0.0,
+    }
+
+
+def run_scenario(scenario, fixtures, requests, threads, warmup, seed, check=None):
+    """
+    Run one scenario from `threads` threads, `requests` timed requests in total.
+    A request is an error on a 5xx status or when `check(response)` is false.
+    """
+    samples = []
+    lock = threading.Lock()
+
+    def drive(index, count):
+        worker = Worker(fixtures, seed + index, index)
+        local = []
+        try:
+            for n in range(warmup + count):
+                client, method, path, data = scenario(worker)
+                recorder = QueryRecorder()
+                with connection.execute_wrapper(recorder):
+                    start = time.perf_counter()
+                    try:
+                        response = getattr(client, method)(path, data)
+                        status = response.status_code
+                        ok = status < 500 and (check is None or check(response))
+                    except Exception:
+                        status, ok = 599, False
+                    elapsed = time.perf_counter() - start
+                if n >= warmup:
+                    local.append({
+                        'ms': elapsed * 1000,
+                        'status': status,
+                        'ok': ok,
+                        'queries': recorder.count,
+                        'db_ms': recorder.duration * 1000,
+                    })
+        finally:
+            connections.close_all()
+        with lock:
+            samples.extend(local)
+
+    shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(drive, range(threads), shares))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def run_benchmark(names, requests=200, threads=4, warmup=5, seed=42, session_strategy=None, log=print):
+    """
+    Run the given scenarios and return the JSON-serializable results.
+    `session_strategy` (a SESSION_STRATEGIES key) overrides the configured one.
+    """
+    fixtures = load_fixtures(threads=threads)
+    results = {}
+    session_strategy = session_strategy or settings.SESSION_STRATEGY
+
+    with override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        QUERY_BUDGET_RAISE=False,
+        SESSION_STRATEGY=session_strategy,
+        **SESSION_STRATEGIES[session_strategy],
+    ):
+        for name in names:
+            results[name] = run_scenario(
+                SCENARIOS[name], fixtures, requests, threads, warmup, seed, SUCCESS_CHECKS.get(name)
+            )
+            latency = results[name]['latency_ms']
+            log(f"{name}: p50 {latency['p50']} ms, p99 {latency['p99']} ms, "
+                f"{results[name]['queries']['mean']} queries, {results[name]['rps']} req/s")
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'threads': threads,
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed,
+            'session_strategy': session_strategy,
+            'dataset': {
+                'products': Product.objects.count(),
+                'orders': Order.objects.count(),
+                'stock_movements': StockMovement.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def pool_round(threads, iterations, hold_ms):
+    """
+    Run `iterations` checkouts per thread: take a connection, hold it in a
+    query for `hold_ms`, give it back. Return the wait and error numbers.
+    """
+    waits = []
+    errors = []
+    lock = threading.Lock()
+
+    def drive(index):
+        local_waits, local_errors = [], 0
+        for n in range(iterations):
+            start = time.perf_counter()
+            try:
+                connection.ensure_connection()
+                waited = time.perf_counter() - start
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(%s)', [hold_ms / 1000])
+                local_waits.append(waited * 1000)
+            except Exception:
+                local_errors += 1
+            finally:
+                # Back to the pool
+                connection.close()
+        with lock:
+            waits.extend(local_waits)
+            errors.append(local_errors)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(drive, range(threads)))
+    elapsed = time.perf_counter() - start
+    waits.sort()
+    return {
+        'checkouts': len(waits),
+        'errors': sum(errors),
+        'checkouts_per_s': round(len(waits) / elapsed, 2) if elapsed else 0.0,
+        'wait_ms': {
+            'p50': round(percentile(waits, 50), 3),
+            'p99': round(percentile(waits, 99), 3),
+            'max': round(waits[-1], 3) if waits else 0.0,
+        },
+    }
+
+
+def kill_idle_connections():
+    """Terminate the idle connections of the pool from the server side."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(pg_terminate_backend(pid)) FROM pg_stat_activity "
+            "WHERE datname = current_database() AND pid <> pg_backend_pid() "
+            "AND usename = current_user AND state = 'idle'"
+        )
+        killed = cursor.fetchone()[0]
+    connection.close()
+    return killed
+
+
+def run_pool_check(threads=16, iterations=100, hold_ms=5, kill_idle=False, log=print):
+    """
+    Exercise the connection pool of the default database: a round with more
+    threads than connections, so that checkouts queue, then optionally a
+    second round after killing the idle connections, which the health
+    checks must replace without errors.
+    """
+    database = connections['default']
+    options = database.settings_dict['OPTIONS']['pool']
+    rounds = {}
+
+    rounds['load'] = pool_round(threads, iterations, hold_ms)
+    log(f"load: {rounds['load']['checkouts_per_s']} checkouts/s, "
+        f"wait p99 {rounds['load']['wait_ms']['p99']} ms, {rounds['load']['errors']} errors")
+
+    if kill_idle:
+        killed = kill_idle_connections()
+        rounds['after_kill'] = dict(pool_round(threads, iterations, hold_ms), killed=killed)
+        log(f"after killing {killed} idle connections: {rounds['after_kill']['errors']} errors")
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'database': database.vendor,
+            'server_mode': settings.SERVER_MODE,
+            'pool': {key: value for key, value in options.items() if isinstance(value, (int, float))},
+            'threads': threads,
+            'iterations': iterations,
+            'hold_ms': hold_ms,
+        },
+        'rounds': rounds,
+        'pool_stats': pool_stats().get('default', {}),
+    }
+
+
+# Destinations of the priced baskets (country, postal code)
+PRICING_DESTINATIONS = [
+    ('Italia', '20121'),
+    ('Italia', '00184'),
+    ('Italia', '09124'),
+    ('Italia', '90133'),
+    ('San Marino', '47890'),
+    ('France', '75001'),
+]
+
+
+def run_pricing_benchmark(baskets=10000, max_lines=20, orders=1000, seed=42, log=print):
+    """
+    Price `baskets` random baskets of up to `max_lines` catalog products with
+    core.pricing, after compiling the rules, then reprice `orders` orders
+    with Order.objects.recalculate_totals (rolled back). Reports baskets/s,
+    latency percentiles per basket and the queries run.
+    """
+    rng = random.Random(seed)
+    rows = list(
+        Product.objects.filter(product_status='published')
+        .values_list('price', 'weight', 'vat_class_id', 'digital')[:5000]
+    )
+    if not rows:
+        raise ValueError('No published products to build the baskets from')
+
+    start = time.perf_counter()
+    rules = pricing_rules.build()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # Basket lines in the pricing layout: (price, quantity, weight, VAT class, digital, discount)
+    baskets_lines = []
+    for n in range(baskets):
+        lines = [
+            (price, rng.randint(1, 5), weight, vat_class_id, digital, Decimal('0.00'))
+            for price, weight, vat_class_id, digital in rng.sample(rows, min(len(rows), rng.randint(1, max_lines)))
+        ]
+        baskets_lines.append((lines, rng.choice(PRICING_DESTINATIONS)))
+
+    recorder = QueryRecorder()
+    latencies = []
+    totals = Decimal('0.00')
+    with connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        for lines, (country, postal_code) in baskets_lines:
+            basket_start = time.perf_counter()
+            quote = price_lines(lines, country, postal_code, rules=rules)
+            latencies.append((time.perf_counter() - basket_start) * 1000)
+            totals += quote.total
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    results = {
+        'baskets': {
+            'count': baskets,
+            'lines': sum(len(lines) for lines, destination in baskets_lines),
+            'baskets_per_s': round(baskets / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 4),
+                'p99': round(percentile(latencies, 99), 4),
+                'max': round(latencies[-1], 4),
+            },
+            'queries': recorder.count,
+            'total': str(totals),
+        },
+    }
+    log(f"baskets: {results['baskets']['baskets_per_s']} baskets/s, "
+        f"p99 {results['baskets']['latency_ms']['p99']} ms, {recorder.count} queries")
+
+    if orders:
+        recorder = QueryRecorder()
+        with transaction.atomic():
+            queryset = Order.objects.filter(pk__in=list(Order.objects.values_list('pk', flat=True)[:orders]))
+            with connection.execute_wrapper(recorder):
+                start = time.perf_counter()
+                repriced = queryset.recalculate_totals()
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        results['orders'] = {
+            'count': repriced,
+            'orders_per_s': round(repriced / elapsed, 2) if elapsed else 0.0,
+            'ms': round(elapsed * 1000, 3),
+            'queries': recorder.count,
+        }
+        log(f"orders: {repriced} repriced in {results['orders']['ms']} ms, {recorder.count} queries")
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'products': len(rows),
+            'max_lines': max_lines,
+            'seed': seed,
+            'rules': {
+                'zones': len(rules.zones),
+                'vat_classes': len(rules.vat_rates),
+                'build_ms': round(build_ms, 3),
+            },
+        },
+        'results': results,
+    }
+
+
+def random_promotions(count, product_ids, category_ids, rng, coupons=0):
+    """Synthetic compiled promotions over the catalog: by product, by category and catalog wide."""
+    now = timezone.now()
+    promotions = []
+    for n in range(count + coupons):
+        kind = rng.choice(['percent', 'percent', 'fixed', 'buy_x_get_y'])
+        target = rng.random()
+        promotions.append(CompiledPromotion(
+            n,
+            f'Promo {n}',
+            kind,
+            Decimal(rng.randint(5, 40)) if kind == 'percent' else Decimal(rng.randint(1, 10)),
+            buy=rng.randint(2, 4),
+            get=1,
+            code=f'BENCH{n}' if n >= count else '',
+            # A quarter scheduled in the future or already over
+            starts_at=now + timedelta(days=1) if rng.random() < 0.1 else None,
+            ends_at=now - timedelta(days=1) if rng.random() < 0.15 else None,
+            product_ids=rng.sample(product_ids, min(len(product_ids), rng.randint(1, 20))) if target < 0.7 else (),
+            category_ids=rng.sample(category_ids, 1) if 0.7 <= target < 0.995 else (),
+        ))
+    return promotions
+
+
+def scan_discount_lines(lines, promotions, now):
+    """Reference evaluation without the index: every promotion against every line."""
+    amounts = []
+    for product_id, category_id, price, quantity in lines:
+        best = Decimal('0.00')
+        for promotion in promotions:
+            if not promotion.code and promotion.running(now) and promotion.targets(product_id, category_id):
+                best = max(best, promotion.line_discount(price, quantity))
+        amounts.append(best)
+    return amounts
+
+
+def run_promotion_benchmark(rules=2000, carts=200, lines=200, coupons=50, seed=42, compare=True, log=print):
+    """
+    Evaluate `carts` random carts of `lines` catalog products under `rules`
+    synthetic promotions (plus `coupons` codes), compiled in memory: nothing
+    is written. Reports the index build time, carts/s and latency
+    percentiles, the queries run (none expected), and with `compare` the
+    same carts evaluated by scanning every promotion, checking both agree.
+    """
+    rng = random.Random(seed)
+    rows = list(
+        Product.objects.filter(product_status='published')
+        .values_list('id', 'category_id', 'price')[:20000]
+    )
+    if not rows:
+        raise ValueError('No published products to build the carts from')
+    product_ids = [row[0] for row in rows]
+    category_ids = list(Category.objects.values_list('id', flat=True)) or [None]
+    promotions = random_promotions(rules, product_ids, category_ids, rng, coupons)
+
+    start = time.perf_counter()
+    index = PromotionIndex(promotions)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    cart_lines = [
+        (
+            [(product_id, category_id, price, rng.randint(1, 10))
+             for product_id, category_id, price in rng.sample(rows, min(len(rows), lines))],
+            f'BENCH{rules + rng.randrange(coupons)}' if coupons and rng.random() < 0.3 else '',
+        )
+        for n in range(carts)
+    ]
+
+    now = timezone.now()
+    recorder = QueryRecorder()
+    latencies = []
+    evaluated = []
+    with connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        for basket, code in cart_lines:
+            cart_start = time.perf_counter()
+            evaluated.append(discount_lines(basket, code, now, index))
+            latencies.append((time.perf_counter() - cart_start) * 1000)
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    results = {
+        'indexed': {
+            'carts_per_s': round(carts / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries': recorder.count,
+            'discount': str(sum((discounts.total for discounts in evaluated), Decimal('0.00'))),
+        },
+    }
+    log(f"indexed: {results['indexed']['carts_per_s']} carts/s, "
+        f"p99 {results['indexed']['latency_ms']['p99']} ms, {recorder.count} queries")
+
+    if compare:
+        start = time.perf_counter()
+        mismatches = 0
+        for (basket, code), discounts in zip(cart_lines, evaluated):
+            if code:
+                continue
+            if scan_discount_lines(basket, promotions, now) != discounts.amounts:
+                mismatches += 1
+        elapsed = time.perf_counter() - start
+        scanned = sum(1 for basket, code in cart_lines if not code)
+        results['scan'] = {
+            'carts': scanned,
+            'carts_per_s': round(scanned / elapsed, 2) if elapsed else 0.0,
+            'mismatches': mismatches,
+        }
+        log(f"scan: {results['scan']['carts_per_s']} carts/s, {mismatches} mismatches")
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'products': len(rows),
+            'rules': rules,
+            'coupons': coupons,
+            'carts': carts,
+            'lines': lines,
+            'seed': seed,
+            'index': {
+                'build_ms': round(build_ms, 3),
+                'products': len(index.by_product),
+                'categories': len(index.by_category),
+                'catalog_wide': len(index.catalog),
+            },
+        },
+        'results': results,
+    }
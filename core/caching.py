@@ -0,0 +1,303 @@
+"""
+Two-tier cache for catalog, cart summaries and reference data.
+
+L1 is a per-process LRU with a TTL per entry, L2 the shared Django cache
+(CACHES['default']: Redis, files on disk or local memory under tests).
+Values are grouped in namespaces configured by CACHE_NAMESPACES; keys carry
+the namespace version, so `invalidate()` drops a whole namespace at once.
+Other processes see a new version within CACHE_VERSION_CHECK_INTERVAL
+seconds; a single deleted key may live on in their L1 for the namespace
+`local_timeout`, so namespaces that need immediate deletes use no L1.
+
+`get_or_set` protects against stampedes: a missing value is computed by a
+single caller (a lock per key in this process, a lock key in L2 across
+processes) while the others wait for it, and an expired value is served
+for `stale` more seconds while one caller recomputes it. The lock key
+relies on an atomic `cache.add()`: Redis and Memcached have it, the
+file-based cache does not (it checks then writes the file), so without
+REDIS_URL two processes may occasionally compute the same value.
+
+Usage:
+    catalog_cache = namespace('catalog')
+    body = catalog_cache.get_or_set(key, render_body, timeout=3600)
+
+VersionedTable keeps a value built from the database (a compiled rule
+table) in every process, rebuilt only after `invalidate()`: the same
+version key scheme, without storing the value in L2.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+MISSING = object()
+
+# Seconds a lock key protects a recompute, and waited at most for another process
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+COUNTERS = ('l1_hits', 'l2_hits', 'stale_hits', 'misses', 'recomputes', 'waits')
+
+
+class LocalCache:
+    """Per-process LRU cache with a TTL per entry."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self, prefix=''):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+
+class Namespace:
+    """A group of cached values sharing timeouts and a version."""
+
+    def __init__(self, name, timeout=300, stale=0, local_timeout=0, local_cache=None):
+        self.name = name
+        self.timeout = timeout
+        self.stale = stale
+        self.local_timeout = local_timeout
+        self.local_cache = local_cache if local_cache is not None else LocalCache()
+        self.version_key = f'cache:{name}:version'
+        self.version_check_interval = getattr(settings, 'CACHE_VERSION_CHECK_INTERVAL', 2)
+        self._version = None
+        self._checked = 0.0
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._counters_lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(64)]
+
+    def _count(self, counter):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def version(self):
+        """Current version, read from L2 at most every CACHE_VERSION_CHECK_INTERVAL seconds."""
+        now = time.monotonic()
+        if self._version is None or now - self._checked >= self.version_check_interval:
+            version = cache.get(self.version_key)
+            if version is None:
+                cache.add(self.version_key, uuid.uuid4().hex[:8], None)
+                version = cache.get(self.version_key)
+            self._version, self._checked = version, now
+        return self._version
+
+    def make_key(self, key):
+        return f'{self.name}:{self.version()}:{key}'
+
+    def invalidate(self):
+        """Drop every value of the namespace."""
+        cache.set(self.version_key, uuid.uuid4().hex[:8], None)
+        self.local_cache.clear(f'{self.name}:')
+        self._version = None
+
+    def _lookup(self, full_key, count=True):
+        """Return (value or MISSING, fresh) from L1, then L2."""
+        if self.local_timeout:
+            value = self.local_cache.get(full_key)
+            if value is not MISSING:
+                if count:
+                    self._count('l1_hits')
+                return value, True
+
+        envelope = cache.get(full_key)
+        if envelope is None:
+            if count:
+                self._count('misses')
+            return MISSING, False
+
+        value, fresh_until = envelope
+        remaining = fresh_until - time.time()
+        if remaining > 0:
+            if self.local_timeout:
+                self.local_cache.set(full_key, value, min(self.local_timeout, remaining))
+            if count:
+                self._count('l2_hits')
+            return value, True
+        if count:
+            self._count('stale_hits')
+        return value, False
+
+    def _store(self, full_key, value, timeout=None):
+        timeout = timeout or self.timeout
+        cache.set(full_key, (value, time.time() + timeout), timeout + self.stale)
+        if self.local_timeout:
+            self.local_cache.set(full_key, value, min(self.local_timeout, timeout))
+
+    def _recompute(self, full_key, compute, timeout):
+        self._count('recomputes')
+        value = compute()
+        self._store(full_key, value, timeout)
+        return value
+
+    def get(self, key, default=None):
+        value, fresh = self._lookup(self.make_key(key))
+        return default if value is MISSING else value
+
+    def set(self, key, value, timeout=None):
+        self._store(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        self.local_cache.delete(full_key)
+        cache.delete(full_key)
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Return the cached value of `key`, computing it with `compute()` once when missing."""
+        full_key = self.make_key(key)
+        lock_key = f'{full_key}:lock'
+
+        value, fresh = self._lookup(full_key)
+        if value is not MISSING:
+            # Stale: one caller recomputes, the others keep serving the old value
+            if not fresh and cache.add(lock_key, 1, LOCK_TIMEOUT):
+                try:
+                    value = self._recompute(full_key, compute, timeout)
+                finally:
+                    cache.delete(lock_key)
+            return value
+
+        key_lock = self._key_locks[hash(full_key) % len(self._key_locks)]
+        with key_lock:
+            # Computed by another thread while waiting for the lock
+            value, fresh = self._lookup(full_key, count=False)
+            if value is not MISSING:
+                return value
+
+            if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                try:
+                    return self._recompute(full_key, compute, timeout)
+                finally:
+                    cache.delete(lock_key)
+
+        # Another process is computing it: wait without holding the key lock,
+        # which is shared with other keys
+        self._count('waits')
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value, fresh = self._lookup(full_key, count=False)
+            if value is not MISSING:
+                return value
+        with key_lock:
+            value, fresh = self._lookup(full_key, count=False)
+            if value is not MISSING:
+                return value
+            return self._recompute(full_key, compute, timeout)
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self._counters)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['stale_hits'] + stats['misses']
+        hits = lookups - stats['misses']
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._counters_lock:
+            self._counters = dict.fromkeys(COUNTERS, 0)
+
+
+class VersionedTable:
+    """Per-process value built by `build()`, rebuilt when its version in L2 changes."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self.version_key = f'table:{name}:version'
+        self.version_check_interval = getattr(settings, 'CACHE_VERSION_CHECK_INTERVAL', 2)
+        self.value = None
+        self.version = None
+        self.checked_at = 0.0
+        self.builds = 0
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the local value and tell the other processes."""
+        cache.set(self.version_key, uuid.uuid4().hex[:8], None)
+        self.version = None
+
+    def current_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex[:8], None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get(self):
+        """The value, checking the version at most once per CACHE_VERSION_CHECK_INTERVAL."""
+        if self.version is not None and time.monotonic() - self.checked_at < self.version_check_interval:
+            return self.value
+        with self.lock:
+            if self.version is None or time.monotonic() - self.checked_at >= self.version_check_interval:
+                version = self.current_version()
+                if version != self.version:
+                    self.value = self.build()
+                    self.version = version
+                    self.builds += 1
+                self.checked_at = time.monotonic()
+            return self.value
+
+    async def aget(self):
+        """get() for async code: a rebuild runs its queries in a thread."""
+        if self.version is not None and time.monotonic() - self.checked_at < self.version_check_interval:
+            return self.value
+        return await sync_to_async(self.get)()
+
+
+_local_cache = None
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def namespace(name):
+    """Return the namespace `name` of CACHE_NAMESPACES (one instance per process)."""
+    global _local_cache
+    with _namespaces_lock:
+        if name not in _namespaces:
+            if _local_cache is None:
+                _local_cache = LocalCache(getattr(settings, 'CACHE_L1_MAX_ENTRIES', 1000))
+            options = getattr(settings, 'CACHE_NAMESPACES', {})[name]
+            _namespaces[name] = Namespace(name, local_cache=_local_cache, **options)
+        return _namespaces[name]
+
+
+def cache_stats():
+    """Hit/miss counters of this process, per namespace."""
+    return {name: ns.stats() for name, ns in sorted(_namespaces.items())}
+
+
+def reset_cache_stats():
+    for ns in list(_namespaces.values()):
+        ns.reset_stats()
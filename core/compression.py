@@ -0,0 +1,194 @@
+"""
+Compression of dynamic responses (HTML, JSON) for CompressionMiddleware.
+
+The encoding is the one with the highest q-value in Accept-Encoding
+(q=0 refuses it), brotli on a tie. Gzip output carries the BREACH
+mitigation of Django's GZipMiddleware: a random length file name in the
+gzip header, so the body size does not give away a guessed secret.
+Brotli has no such header and is only used for dynamic responses with
+COMPRESSION_BROTLI_DYNAMIC (and the brotli package installed). Streaming
+responses are compressed chunk by chunk. Static files are not handled here: collectstatic writes their
+.gz/.br copies (WhiteNoise) and WhiteNoise serves them.
+
+`page_savings` and `static_savings` measure the bytes saved, for the
+compression_report command.
+"""
+
+import gzip
+import os
+import secrets
+import struct
+import zlib
+
+from django.conf import settings
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+
+# Longest random file name in the gzip header, as GZipMiddleware.max_random_bytes
+GZIP_MAX_RANDOM_BYTES = 100
+
+
+def brotli_quality():
+    return getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+
+def supported_encodings():
+    """Encodings of dynamic responses, preferred first."""
+    if brotli is not None and getattr(settings, 'COMPRESSION_BROTLI_DYNAMIC', False):
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def parse_accept_encoding(accept_encoding):
+    """{coding: q-value} of an Accept-Encoding header; a malformed q-value refuses the coding."""
+    codings = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(accept_encoding):
+    """Supported encoding with the highest q-value, or None (`*` stands for the codings not listed)."""
+    codings = parse_accept_encoding(accept_encoding)
+    wildcard = codings.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = codings.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def random_filename():
+    return b'a' * secrets.randbelow(GZIP_MAX_RANDOM_BYTES)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality())
+    return compress_string(data, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+class StreamCompressor:
+    """Incremental compressor: feed chunks, each call returns the bytes ready so far."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=brotli_quality())
+        else:
+            # Raw deflate in a gzip container written here, for the random file name
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self.header = (
+                b'\x1f\x8b\x08' + bytes([gzip.FNAME]) + b'\x00\x00\x00\x00\x00\xff'
+                + random_filename() + b'\x00'
+            )
+            self.crc = 0
+            self.size = 0
+
+    def compress(self, chunk):
+        if self.encoding == 'br':
+            # Flush so that every chunk reaches the client without waiting for the next ones
+            return self.compressor.process(chunk) + self.compressor.flush()
+        self.crc = zlib.crc32(chunk, self.crc)
+        self.size += len(chunk)
+        return self.take_header() + self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return (
+            self.take_header() + self.compressor.flush(zlib.Z_FINISH)
+            + struct.pack('<LL', self.crc, self.size & 0xffffffff)
+        )
+
+    def take_header(self):
+        header, self.header = self.header, b''
+        return header
+
+
+def compress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def response_body(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def page_savings(paths):
+    """
+    Fetch `paths` in-process, plain and with each encoding, and return per page
+    {'path', 'status', 'original', 'gzip', 'br'} (bytes of the body).
+    """
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    client = Client()
+    encodings = sorted(supported_encodings(), reverse=True)
+    pages = []
+    with override_settings(ALLOWED_HOSTS=['*']):
+        for path in paths:
+            response = client.get(path, HTTP_ACCEPT_ENCODING='identity')
+            original = len(response_body(response))
+            page = {'path': path, 'status': response.status_code, 'original': original}
+            for encoding in encodings:
+                page[encoding] = len(response_body(client.get(path, HTTP_ACCEPT_ENCODING=encoding)))
+            pages.append(page)
+    return pages
+
+
+def static_savings(root=None):
+    """
+    Bytes of the collected static files and of their precompressed copies:
+    {'files', 'original', 'gzip', 'br'} (only files with a copy are counted).
+    """
+    root = root or settings.STATIC_ROOT
+    totals = {'files': 0, 'original': 0, 'gzip': 0, 'br': 0}
+    for directory, dirnames, filenames in os.walk(root):
+        names = set(filenames)
+        for name in filenames:
+            if name.endswith(('.gz', '.br')):
+                continue
+            gz, br = f'{name}.gz' in names, f'{name}.br' in names
+            if not (gz or br):
+                continue
+            size = os.path.getsize(os.path.join(directory, name))
+            totals['files'] += 1
+            totals['original'] += size
+            totals['gzip'] += os.path.getsize(os.path.join(directory, f'{name}.gz')) if gz else size
+            totals['br'] += os.path.getsize(os.path.join(directory, f'{name}.br')) if br else size
+    return totals
@@ -3,30 +3,49 @@ Context processors for core app.
 Makes cart and other data available in all templates.
 """
 
+from django.utils.functional import SimpleLazyObject
+
+from .cookie_cart import CookieCart, uses_cookie_cart
 from .models import Cart
 
 
 def cart_context(request):
     """
     Add cart information to all templates.
+    Pages served from the edge cache get no per-user data,
+    their cart badge is loaded from core:cart-summary.
     """
+    if getattr(request, 'edge_cacheable', False):
+        return {
+            'cart': None,
+            'cart_total_items': 0,
+            'async_cart_badge': True,
+        }
+    
     cart = None
     cart_total_items = 0
     
     try:
-        if request.user.is_authenticated:
-            cart = Cart.objects.filter(user=request.user).first()
+        if uses_cookie_cart(request):
+            # Counted from the cookie, without queries
+            cart = CookieCart.from_request(request)
+            cart_total_items = cart.get_total_items()
+        elif request.user.is_authenticated:
+            # Badge from the 'cart' cache namespace, the cart itself only if a template uses it
+            user = request.user
+            cart = SimpleLazyObject(lambda: Cart.objects.filter(user=user).first())
+            cart_total_items = Cart.cached_total_items(user.pk)
         else:
             session_key = request.session.session_key
             if session_key:
                 cart = Cart.objects.filter(session_key=session_key).first()
-        
-        if cart:
-            cart_total_items = cart.get_total_items()
+                if cart:
+                    cart_total_items = cart.get_total_items()
     except:
         pass
     
     return {
         'cart': cart,
         'cart_total_items': cart_total_items,
+        'async_cart_badge': False,
     }
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Guest cart stored in a signed cookie (SESSION_STRATEGY = 'cookie_cart').
+
+Small guest carts live entirely in the cookie: no session and no Cart row
+are created until checkout, login, or until the cart grows beyond
+COOKIE_CART_MAX_ITEMS lines, when it is moved to a database cart.
+CookieCart and CookieCartItem expose the part of the Cart / CartItem
+interface used by the cart views and templates; CookieCartMiddleware
+writes the cookie back when the cart changed.
+"""
+
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+
+from products.models import Product
+from .models import Cart, CartItem, CART_SESSION_KEY
+from .pricing import pricing_rules
+from .promotions import promotion_index
+
+COOKIE_CART_SALT = 'core.cookie_cart'
+
+
+def cookie_cart_enabled():
+    return getattr(settings, 'COOKIE_CART_ENABLED', False)
+
+
+def uses_cookie_cart(request):
+    """Check if the cart of the request lives in the cookie (guest without a database cart)."""
+    return (
+        cookie_cart_enabled()
+        and not request.user.is_authenticated
+        and CART_SESSION_KEY not in request.session
+    )
+
+
+async def auses_cookie_cart(request, user):
+    """uses_cookie_cart for async views, `user` being the result of request.auser()."""
+    return (
+        cookie_cart_enabled()
+        and not user.is_authenticated
+        and not await request.session.ahas_key(CART_SESSION_KEY)
+    )
+
+
+def cookie_name():
+    return getattr(settings, 'COOKIE_CART_NAME', 'guest_cart')
+
+
+class CookieCartItem:
+    """A cart line, identified by its product id."""
+
+    def __init__(self, cart, product, quantity, price):
+        self.cart = cart
+        self.id = product.id
+        self.product = product
+        self.product_id = product.id
+        self.quantity = quantity
+        self.price = price
+
+    def get_total(self):
+        return self.price * self.quantity
+
+    def save(self):
+        self.cart.lines[self.product_id] = [self.quantity, str(self.price)]
+        self.cart.modified = True
+
+    async def asave(self):
+        self.save()
+
+    def delete(self):
+        self.cart.lines.pop(self.product_id, None)
+        self.cart.modified = True
+
+    async def adelete(self):
+        self.delete()
+
+
+class CookieCartItems:
+    """Queryset-like access to the cart lines (all, select_related, exists, count)."""
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    def __iter__(self):
+        return iter(self.cart.get_items())
+
+    def __len__(self):
+        return len(self.cart.get_items())
+
+    def all(self):
+        return self
+
+    def select_related(self, *fields):
+        return self
+
+    def exists(self):
+        return bool(self.cart.get_items())
+
+    def count(self):
+        return len(self.cart.get_items())
+
+    def delete(self):
+        self.cart.lines.clear()
+        self.cart.modified = True
+
+
+class CookieCart:
+    """Guest cart read from the signed cookie: {product id: [quantity, price]}."""
+
+    user = None
+    session_key = None
+    cart_id = None
+    # Entering a coupon moves the cart to the database
+    coupon_code = ''
+
+    # Same pricing as the database cart
+    get_discounts = Cart.get_discounts
+    get_quote = Cart.get_quote
+    get_subtotal = Cart.get_subtotal
+    get_shipping_cost = Cart.get_shipping_cost
+    get_tax = Cart.get_tax
+    get_total = Cart.get_total
+    summarize = Cart.summarize
+
+    def __init__(self, lines=None):
+        self.lines = lines or {}
+        self.modified = False
+        self._products = {}
+
+    @classmethod
+    def from_cookie(cls, value):
+        """Cart of a signed cookie value, empty if missing, tampered or expired."""
+        lines = {}
+        if value:
+            try:
+                data = signing.get_cookie_signer(salt=cookie_name() + COOKIE_CART_SALT).unsign(
+                    value, max_age=getattr(settings, 'COOKIE_CART_MAX_AGE', None)
+                )
+                lines = {int(pk): [int(line[0]), str(line[1])] for pk, line in json.loads(data).items()}
+            except (signing.BadSignature, ValueError, TypeError, AttributeError, IndexError):
+                lines = {}
+        return cls(lines)
+
+    @classmethod
+    def from_request(cls, request):
+        """Cart of the request, read once and kept on the request for the middleware."""
+        if not hasattr(request, '_cookie_cart'):
+            request._cookie_cart = cls.from_cookie(request.COOKIES.get(cookie_name()))
+        return request._cookie_cart
+
+    def __str__(self):
+        return 'Carrello Ospite'
+
+    @property
+    def items(self):
+        return CookieCartItems(self)
+
+    def _missing_products(self):
+        return [pk for pk in self.lines if pk not in self._products]
+
+    def _add_products(self, missing, products):
+        # None for the products deleted meanwhile, so they are not queried again
+        for pk in missing:
+            self._products[pk] = products.get(pk)
+
+    def _items(self):
+        return [
+            CookieCartItem(self, self._products[pk], quantity, Decimal(price))
+            for pk, (quantity, price) in self.lines.items()
+            if self._products.get(pk) is not None
+        ]
+
+    def get_items(self):
+        """Cart lines with their products (one query for the products not loaded yet)."""
+        missing = self._missing_products()
+        if missing:
+            self._add_products(missing, Product.objects.in_bulk(missing))
+        return self._items()
+
+    async def aget_items(self):
+        """get_items with the async ORM: afterwards the sync methods run no query."""
+        missing = self._missing_products()
+        if missing:
+            self._add_products(missing, await Product.objects.ain_bulk(missing))
+        return self._items()
+
+    async def asummary(self):
+        return self.summarize(await self.aget_items(), await pricing_rules.aget(), await promotion_index.aget())
+
+    def get_total_items(self):
+        """Number of units, from the cookie alone."""
+        return sum(quantity for quantity, price in self.lines.values())
+
+    def get_item(self, product_id):
+        return next((item for item in self.get_items() if item.id == product_id), None)
+
+    async def aget_item(self, product_id):
+        await self.aget_items()
+        return self.get_item(product_id)
+
+    def get_or_create_item(self, product, quantity, price):
+        self._products[product.id] = product
+        if product.id in self.lines:
+            return self.get_item(product.id), False
+        self.lines[product.id] = [quantity, str(price)]
+        self.modified = True
+        return self.get_item(product.id), True
+
+    async def aget_or_create_item(self, product, quantity, price):
+        await self.aget_items()
+        return self.get_or_create_item(product, quantity, price)
+
+    def is_full(self, product):
+        """Check if adding `product` would exceed the lines kept in the cookie."""
+        max_items = getattr(settings, 'COOKIE_CART_MAX_ITEMS', 20)
+        return product.id not in self.lines and len(self.lines) >= max_items
+
+    def clear(self):
+        self.items.delete()
+
+    def save_to_db(self, cart):
+        """
+        Add the lines to a database cart with a few bulk queries: existing
+        lines are summed and clamped to the stock, like Cart.merge, and
+        dropped when the product is out of stock.
+        """
+        items = self.get_items()
+        if items:
+            existing = {item.product_id: item for item in cart.items.all()}
+            to_update, to_create, to_delete = [], [], []
+            for item in items:
+                if item.product_id in existing:
+                    cart_item = existing[item.product_id]
+                    cart_item.quantity = min(cart_item.quantity + item.quantity, item.product.stock_count)
+                    if cart_item.quantity > 0:
+                        to_update.append(cart_item)
+                    else:
+                        to_delete.append(cart_item.pk)
+                elif item.product.stock_count > 0:
+                    to_create.append(CartItem(
+                        cart=cart,
+                        product=item.product,
+                        quantity=min(item.quantity, item.product.stock_count),
+                        price=item.price
+                    ))
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+            CartItem.objects.bulk_create(to_create)
+            if to_delete:
+                CartItem.objects.filter(pk__in=to_delete).delete()
+            cart.forget_summary()
+        self.clear()
+        return cart
+
+    def promote(self, request):
+        """Move the cart to the database (session cart), e.g. when it gets too big."""
+        if not request.session.session_key:
+            request.session.create()
+        cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
+        request.session[CART_SESSION_KEY] = cart.cart_id
+        return self.save_to_db(cart)
+
+    def serialize(self):
+        return json.dumps(
+            {str(pk): line for pk, line in self.lines.items()},
+            separators=(',', ':')
+        )
+
+
+def has_cookie_cart(request):
+    """Check if the request carries a guest cart cookie."""
+    return cookie_cart_enabled() and cookie_name() in request.COOKIES
@@ -0,0 +1,187 @@
+"""
+"Frequently bought together" engine built from the order history.
+
+Orders become rows of a sparse order x product incidence matrix B, each
+weighted by its age (half-life HALF_LIFE_DAYS). The product x product
+co-occurrence matrix is C = Bᵀ·W·B, its diagonal being the weighted
+number of orders of each product. Pairs are scored with a shrunk cosine,
+C[i, j] / (sqrt(C[i, i] * C[j, j]) + SHRINKAGE), so that a couple of
+orders of two rare products do not outrank well established pairs, and
+the best TOP_K of each product are written to CoPurchase.
+
+C is stored in CoPurchaseMatrix with the creation date up to which the
+orders are folded in: an incremental run decays it to the current date
+and adds only the newer orders, then rewrites the lists of the products
+whose scores changed. Orders of the last WATERMARK_LAG are left to the
+next run, so that an order still being committed is not skipped.
+Cancelled and refunded orders are skipped when folded in; later status
+changes of already folded orders need a full run.
+"""
+
+import io
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product
+from .models import CoPurchase, CoPurchaseMatrix, OrderItem
+
+HALF_LIFE_DAYS = 180
+SHRINKAGE = 2.0
+TOP_K = 6
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'refunded')
+
+# Margin on the folded orders for the transactions still open, as in ordini.rollups
+WATERMARK_LAG = timedelta(minutes=5)
+
+
+@dataclass
+class CoPurchaseReport:
+    orders: int = 0
+    products: int = 0
+    links: int = 0
+    full: bool = False
+
+
+def recency_weights(dates, now):
+    """Weight 1 for an order placed now, halved every HALF_LIFE_DAYS."""
+    ages = np.array([(now - date).total_seconds() for date in dates]) / 86400
+    return np.power(0.5, ages / HALF_LIFE_DAYS)
+
+
+def cooccurrence(since, until, size, now):
+    """
+    Weighted co-occurrence matrix of the orders created after `since`
+    (None: from the first one) and up to `until`.
+    Returns (matrix, number of orders).
+    """
+    items = OrderItem.objects.filter(order__created_at__lte=until, product__isnull=False)
+    if since is not None:
+        items = items.filter(order__created_at__gt=since)
+    rows = list(items.exclude(
+        order__order_status__in=EXCLUDED_ORDER_STATUSES
+    ).values_list('order_id', 'product_id', 'order__created_at'))
+    if not rows:
+        return sparse.csr_matrix((size, size)), 0
+
+    order_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    product_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    orders, first, order_index = np.unique(order_ids, return_index=True, return_inverse=True)
+    size = max(size, int(product_ids.max()) + 1)
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows)), (order_index, product_ids)),
+        shape=(len(orders), size)
+    )
+    # The same product twice in an order counts once
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+
+    weights = recency_weights([rows[i][2] for i in first], now)
+    matrix = (incidence.T @ sparse.diags(weights) @ incidence).tocsr()
+    return matrix, len(orders)
+
+
+def resize(matrix, size):
+    matrix = matrix.tocsr()
+    matrix.resize((size, size))
+    return matrix
+
+
+def scores(matrix):
+    """Shrunk cosine of every co-purchased pair, without the diagonal."""
+    pairs = sparse.triu(matrix, k=1, format='coo')
+    pairs = pairs + pairs.T
+    pairs = pairs.tocoo()
+    counts = matrix.diagonal()
+    denominator = np.sqrt(counts[pairs.row] * counts[pairs.col]) + SHRINKAGE
+    return sparse.csr_matrix(
+        (pairs.data / denominator, (pairs.row, pairs.col)),
+        shape=matrix.shape
+    )
+
+
+def top_neighbours(matrix, row, count):
+    """Best `count` (column, score) pairs of a CSR row, highest first."""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    columns, values = matrix.indices[start:end], matrix.data[start:end]
+    if len(values) > count:
+        best = np.argpartition(-values, count)[:count]
+        columns, values = columns[best], values[best]
+    order = np.argsort(-values, kind='stable')
+    return [(int(columns[i]), float(values[i])) for i in order]
+
+
+def serialize(matrix):
+    buffer = io.BytesIO()
+    sparse.save_npz(buffer, matrix.tocsr())
+    return buffer.getvalue()
+
+
+def deserialize(data):
+    return sparse.load_npz(io.BytesIO(bytes(data))).tocsr()
+
+
+def compute_copurchases(full=False, count=TOP_K, batch_size=1000):
+    """Fold the new orders into the matrix and rewrite the affected CoPurchase lists."""
+    now = timezone.now()
+    folded_until = now - WATERMARK_LAG
+    state = None if full else CoPurchaseMatrix.objects.filter(folded_until__isnull=False).first()
+    report = CoPurchaseReport(full=state is None)
+
+    if state is None:
+        matrix, report.orders = cooccurrence(None, folded_until, 0, now)
+        changed = None
+    else:
+        previous = deserialize(state.matrix)
+        elapsed_days = (now - state.computed_at).total_seconds() / 86400
+        new, report.orders = cooccurrence(state.folded_until, folded_until, previous.shape[0], now)
+        size = max(previous.shape[0], new.shape[0])
+        # Uniform decay shifts the scores only through the shrinkage, so only
+        # the lists touched by the new orders are rewritten
+        matrix = resize(previous, size) * math.pow(0.5, elapsed_days / HALF_LIFE_DAYS) + resize(new, size)
+        changed = np.flatnonzero(new.diagonal())
+
+    scored = scores(matrix)
+    existing = set(Product.objects.values_list('id', flat=True))
+    if changed is None:
+        targets = np.flatnonzero(np.diff(scored.indptr))
+    else:
+        # Products of the new orders and every product paired with them
+        targets = np.union1d(changed, scored[changed].indices) if len(changed) else changed
+    targets = [int(product_id) for product_id in targets if int(product_id) in existing]
+
+    with transaction.atomic():
+        if changed is None:
+            CoPurchase.objects.all().delete()
+        for start in range(0, len(targets), batch_size):
+            batch = targets[start:start + batch_size]
+            links = []
+            for product_id in batch:
+                # Deleted products may still have rows in the matrix
+                neighbours = [
+                    pair for pair in top_neighbours(scored, product_id, count * 2)
+                    if pair[0] in existing
+                ]
+                links.extend(
+                    CoPurchase(product_id=product_id, related_id=related_id, rank=rank, score=round(value, 6))
+                    for rank, (related_id, value) in enumerate(neighbours[:count], 1)
+                )
+            CoPurchase.objects.filter(product_id__in=batch).delete()
+            CoPurchase.objects.bulk_create(links)
+            report.links += len(links)
+        report.products = len(targets)
+
+        CoPurchaseMatrix.objects.all().delete()
+        CoPurchaseMatrix.objects.create(
+            matrix=serialize(matrix),
+            folded_until=folded_until,
+            computed_at=now
+        )
+
+    return report
@@ -0,0 +1,187 @@
+"""
+Per-request SQL instrumentation.
+Counts queries and database time, fingerprints statements to spot
+duplicated queries and N+1 patterns, and keeps per-endpoint statistics
+for the staff query report, together with the connection pool counters.
+"""
+
+import logging
+import re
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the statistics keys: the counters of each endpoint, and the
+# endpoints seen in numbered slots (STATS_CACHE_KEY:endpoint:<n>)
+STATS_CACHE_KEY = 'querybudget:stats'
+STATS_COUNTERS = ('requests', 'queries', 'db_time_us', 'n_plus_one', 'duplicates', 'over_budget')
+STATS_FIELDS = STATS_COUNTERS + ('max_queries', 'last_n_plus_one', 'last_duplicate')
+ENDPOINT_COUNT_KEY = f'{STATS_CACHE_KEY}:endpoints'
+
+# Statements that are not application queries (transaction control)
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more queries than its budget allows."""
+    pass
+
+
+def fingerprint(sql):
+    """
+    Return the shape of a SQL statement: parameters, literals and
+    IN lists of any length are collapsed, so that the same query run
+    with different values gives the same fingerprint.
+    """
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = LITERAL_RE.sub('?', sql)
+    return SPACES_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording the queries of a request.
+    Install with `connection.execute_wrapper(recorder)`.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = defaultdict(list)
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            if not sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+                self.count += 1
+                self.statements[fingerprint(sql)].append(repr(params))
+    
+    def n_plus_one(self, threshold):
+        """Query shapes run at least `threshold` times with different parameters."""
+        return [
+            (shape, len(params))
+            for shape, params in self.statements.items()
+            if len(params) >= threshold and len(set(params)) > 1
+        ]
+    
+    def duplicates(self):
+        """Query shapes run more than once with exactly the same parameters."""
+        result = []
+        for shape, params in self.statements.items():
+            repeated = len(params) - len(set(params))
+            if repeated:
+                result.append((shape, repeated + 1))
+        return result
+
+
+def stats_key(view_name, counter):
+    return f'{STATS_CACHE_KEY}:{view_name}:{counter}'
+
+
+def endpoint_key(number):
+    return f'{STATS_CACHE_KEY}:endpoint:{number}'
+
+
+def endpoints():
+    """View names with statistics, in the order they were first seen."""
+    count = cache.get(ENDPOINT_COUNT_KEY, 0)
+    keys = [endpoint_key(number) for number in range(1, count + 1)]
+    slots = cache.get_many(keys)
+    # An endpoint whose counters were evicted registers again in a new slot
+    return list(dict.fromkeys(slots[key] for key in keys if key in slots))
+
+
+def record_stats(view_name, recorder, n_plus_one, over_budget, duplicates=()):
+    """
+    Add the numbers of a request to the statistics of its endpoint.
+    Every counter is its own cache key updated with `incr`, so concurrent
+    workers do not overwrite each other (with Redis; the file-based cache
+    increments by reading and writing the file).
+    """
+    if cache.add(stats_key(view_name, 'requests'), 0, None):
+        # First request of the endpoint (a single caller gets here): take
+        # the next slot of the list of endpoints
+        cache.add(ENDPOINT_COUNT_KEY, 0, None)
+        cache.set(endpoint_key(cache.incr(ENDPOINT_COUNT_KEY)), view_name, None)
+
+    counters = {
+        'requests': 1,
+        'queries': recorder.count,
+        'db_time_us': int(recorder.duration * 1000000),
+        'n_plus_one': 1 if n_plus_one else 0,
+        'duplicates': 1 if duplicates else 0,
+        'over_budget': 1 if over_budget else 0,
+    }
+    for counter, value in counters.items():
+        if value:
+            key = stats_key(view_name, counter)
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+
+    # Not counters: a lost update only delays the new value to a later request
+    max_key = stats_key(view_name, 'max_queries')
+    if recorder.count > cache.get(max_key, 0):
+        cache.set(max_key, recorder.count, None)
+    if n_plus_one:
+        cache.set(stats_key(view_name, 'last_n_plus_one'), n_plus_one[0][0], None)
+    if duplicates:
+        cache.set(stats_key(view_name, 'last_duplicate'), duplicates[0][0], None)
+
+
+def get_endpoint_stats():
+    """Return endpoint statistics, worst average query count first."""
+    view_names = endpoints()
+    values = cache.get_many([stats_key(view_name, name) for view_name in view_names for name in STATS_FIELDS])
+    rows = []
+    for view_name in view_names:
+        entry = {name: values.get(stats_key(view_name, name), 0) for name in STATS_FIELDS}
+        entry['last_n_plus_one'] = entry['last_n_plus_one'] or ''
+        entry['last_duplicate'] = entry['last_duplicate'] or ''
+        entry['db_time'] = entry.pop('db_time_us') / 1000000
+        requests = entry['requests'] or 1
+        rows.append(dict(
+            entry,
+            view_name=view_name,
+            avg_queries=round(entry['queries'] / requests, 1),
+            avg_db_time_ms=round(entry['db_time'] * 1000 / requests, 2),
+        ))
+    return sorted(rows, key=lambda row: (row['avg_queries'], row['max_queries']), reverse=True)
+
+
+def reset_stats():
+    """Clear all endpoint statistics."""
+    count = cache.get(ENDPOINT_COUNT_KEY, 0)
+    cache.delete_many(
+        [stats_key(view_name, name) for view_name in endpoints() for name in STATS_FIELDS]
+        + [endpoint_key(number) for number in range(1, count + 1)]
+        + [ENDPOINT_COUNT_KEY]
+    )
+
+
+def pool_stats():
+    """
+    Counters of the connection pools of this process (psycopg_pool), per
+    database alias, with the mean wait of the requests that had to queue.
+    Empty without pooled databases.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        entry = pool.get_stats()
+        queued = entry.get('requests_queued', 0)
+        entry['wait_ms_mean'] = round(entry.get('requests_wait_ms', 0) / queued, 3) if queued else 0.0
+        stats[alias] = entry
+    return stats
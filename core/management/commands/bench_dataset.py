@@ -0,0 +1,49 @@
+"""
+Build the synthetic dataset used by the benchmark command.
+
+Example (large scale):
+    python manage.py bench_dataset --products 50000 --orders 500000 --movements 2000000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import build_dataset, dataset_exists
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic catalog, orders and stock movements for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--movements', type=int, default=50000, help='Stock movements')
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--images', type=int, default=2, help='Images per product')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        if dataset_exists():
+            raise CommandError('A benchmark dataset is already loaded in this database.')
+
+        if options['interactive']:
+            answer = input('This writes benchmark data into the configured database. Continue? [y/N] ')
+            if answer.lower() != 'y':
+                raise CommandError('Aborted.')
+
+        build_dataset(
+            products=options['products'],
+            orders=options['orders'],
+            movements=options['movements'],
+            customers=options['customers'],
+            categories=options['categories'],
+            tags=options['tags'],
+            images=options['images'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS('Benchmark dataset created.'))
@@ -0,0 +1,63 @@
+"""
+Measure latency percentiles and query counts of the main views.
+
+Runs in-process with the Django test client against the configured
+database (SQLite, or Postgres through DATABASE_URL), after `bench_dataset`.
+Results are written as JSON so that runs can be compared over time.
+
+Example:
+    python manage.py benchmark --threads 8 --requests 500 --output bench.json
+    python manage.py benchmark browse_with_cart cart_add --session-strategy cookie_cart
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import SCENARIOS, dataset_exists, run_benchmark
+from core.sessions import SESSION_STRATEGIES
+
+
+class Command(BaseCommand):
+    help = 'Run the storefront and back office benchmark scenarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='scenario',
+            help=f"Scenarios to run (default all): {', '.join(SCENARIOS)}"
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per thread')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='JSON results file (default stdout)')
+        parser.add_argument(
+            '--session-strategy', choices=list(SESSION_STRATEGIES),
+            help='Session strategy to run with (default SESSION_STRATEGY)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if not dataset_exists():
+            raise CommandError('No benchmark dataset found, run bench_dataset first.')
+
+        results = run_benchmark(
+            names,
+            requests=options['requests'],
+            threads=options['threads'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            session_strategy=options['session_strategy'],
+            log=self.stderr.write,
+        )
+
+        data = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,45 @@
+"""
+Price random baskets of catalog products with core.pricing (shipping
+bands, VAT classes) and reprice existing orders, reporting baskets/s,
+latency percentiles and query counts. Run `bench_dataset` first for a
+realistic catalog; the repriced orders are rolled back.
+
+Example:
+    python manage.py benchmark_pricing --baskets 10000 --max-lines 20 --output pricing.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import run_pricing_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the pricing engine on random baskets and existing orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baskets', type=int, default=10000)
+        parser.add_argument('--max-lines', type=int, default=20, help='Products per basket at most')
+        parser.add_argument('--orders', type=int, default=1000, help='Orders to reprice (0 to skip)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='JSON results file (default stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            results = run_pricing_benchmark(
+                baskets=options['baskets'],
+                max_lines=options['max_lines'],
+                orders=options['orders'],
+                seed=options['seed'],
+                log=self.stderr.write,
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        data = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,49 @@
+"""
+Evaluate large carts under many promotions with the compiled promotion
+index (core.promotions), and optionally with a scan of every promotion for
+comparison. The promotions are synthetic and stay in memory: nothing is
+written. Run `bench_dataset` first for a realistic catalog.
+
+Example:
+    python manage.py benchmark_promotions --rules 5000 --carts 200 --lines 300 --output promotions.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import run_promotion_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the promotion index on large carts under many active promotions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=2000, help='Automatic promotions')
+        parser.add_argument('--coupons', type=int, default=50, help='Coupon codes')
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--lines', type=int, default=200, help='Products per cart')
+        parser.add_argument('--no-compare', action='store_true', help='Skip the scan of every promotion')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='JSON results file (default stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            results = run_promotion_benchmark(
+                rules=options['rules'],
+                carts=options['carts'],
+                lines=options['lines'],
+                coupons=options['coupons'],
+                seed=options['seed'],
+                compare=not options['no_compare'],
+                log=self.stderr.write,
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        data = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,67 @@
+"""
+Compare requests/sec and latency percentiles of the cart and wishlist
+AJAX endpoints between the sync (wsgi) and the async (asgi) deployment.
+
+Starts a gunicorn server per mode on a free local port, against the
+configured database, after `bench_dataset`. The asgi mode needs uvicorn.
+
+Example:
+    python manage.py benchmark_servers --concurrency 64 --requests 2000 --output servers.json
+    python manage.py benchmark_servers cart_add wishlist_add --modes asgi
+"""
+
+import importlib.util
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import dataset_exists
+from core.server_benchmark import SCENARIOS, SERVER_MODES, run_server_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the AJAX endpoints under sync and async gunicorn workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='scenario',
+            help=f"Scenarios to run (default all): {', '.join(SCENARIOS)}"
+        )
+        parser.add_argument('--modes', nargs='+', choices=SERVER_MODES, default=list(SERVER_MODES))
+        parser.add_argument('--requests', type=int, default=1000, help='Timed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=32, help='Client threads')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn workers per server')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per thread')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='JSON results file (default stdout)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if not dataset_exists():
+            raise CommandError('No benchmark dataset found, run bench_dataset first.')
+        if 'asgi' in options['modes'] and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('The asgi mode needs uvicorn (pip install uvicorn).')
+
+        try:
+            results = run_server_benchmark(
+                names,
+                modes=options['modes'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                workers=options['workers'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                log=self.stderr.write,
+            )
+        except RuntimeError as error:
+            raise CommandError(str(error))
+
+        data = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,32 @@
+"""
+Delete the expired database sessions and the guest carts whose session is
+gone, in batches. Schedule it daily (it replaces `clearsessions`).
+
+Example:
+    python manage.py cleanup_sessions --cart-days 30
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.sessions import delete_abandoned_carts, delete_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions and abandoned guest carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--cart-days', type=int, default=30,
+            help='Delete guest carts untouched for this many days (0 to keep them)'
+        )
+
+    def handle(self, *args, **options):
+        sessions = delete_expired_sessions(batch_size=options['batch_size'])
+        self.stdout.write(f'Sessioni scadute eliminate: {sessions}')
+
+        if options['cart_days']:
+            carts = delete_abandoned_carts(days=options['cart_days'], batch_size=options['batch_size'])
+            self.stdout.write(f'Carrelli abbandonati eliminati: {carts}')
+
+        self.stdout.write(self.style.SUCCESS('Pulizia completata'))
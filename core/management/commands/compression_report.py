@@ -0,0 +1,55 @@
+"""
+Report the bytes saved by compression: the main storefront pages fetched
+in-process through CompressionMiddleware, and the collected static files
+against their .gz/.br copies (run `collectstatic` first).
+
+Example:
+    python manage.py compression_report
+    python manage.py compression_report /about/ /products/catalog/
+"""
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from core.compression import page_savings, static_savings
+from products.models import Product
+
+
+def saved(original, size):
+    return f'{100 * (original - size) / original:5.1f}%' if original else '    -'
+
+
+class Command(BaseCommand):
+    help = 'Report bytes saved by gzip/brotli per page and for static files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Pages to fetch (default the main storefront pages)')
+
+    def default_paths(self):
+        paths = [reverse('core:home'), reverse('products:catalog'), reverse('core:cart-summary')]
+        product = Product.objects.filter(in_stock=True).only('pid').first()
+        if product is not None:
+            paths.append(reverse('products:product-detail', args=[product.pid]))
+        return paths
+
+    def handle(self, *args, **options):
+        pages = page_savings(options['paths'] or self.default_paths())
+
+        self.stdout.write(f"{'Pagina':<40} {'Stato':>5} {'Originale':>10} {'gzip':>10} {'br':>10}")
+        for page in pages:
+            br = page.get('br', page['original'])
+            self.stdout.write(
+                f"{page['path'][:40]:<40} {page['status']:>5} {page['original']:>10} "
+                f"{page['gzip']:>10} {br:>10}  gzip {saved(page['original'], page['gzip'])}"
+                f"  br {saved(page['original'], br)}"
+            )
+
+        totals = static_savings()
+        if not totals['files']:
+            self.stdout.write('File statici: nessuna copia compressa, eseguire collectstatic')
+            return
+        self.stdout.write(
+            f"File statici ({totals['files']}): {totals['original']} byte, "
+            f"gzip {totals['gzip']} ({saved(totals['original'], totals['gzip'])}), "
+            f"br {totals['br']} ({saved(totals['original'], totals['br'])})"
+        )
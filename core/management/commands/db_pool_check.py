@@ -0,0 +1,59 @@
+"""
+Exercise the database connection pool (sisi3/database.py) against the
+configured Postgres, e.g. a local server: threads take, hold and give back
+connections, more of them than the pool holds, and the checkout waits
+are reported with the pool counters. With --kill-idle the idle connections
+are then terminated server side (use a database of your own) and a second
+round checks that the health checks replace them without errors.
+
+Example:
+    DATABASE_URL=postgres://localhost/sisi3 python manage.py db_pool_check --threads 32
+    DATABASE_URL=postgres://localhost/sisi3 DB_POOL_MAX_SIZE=4 python manage.py db_pool_check --kill-idle
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.benchmark import run_pool_check
+
+
+class Command(BaseCommand):
+    help = 'Exercise the Postgres connection pool and report checkout waits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iterations', type=int, default=100, help='Checkouts per thread')
+        parser.add_argument('--hold-ms', type=int, default=5, help='Time each connection is held')
+        parser.add_argument(
+            '--kill-idle', action='store_true',
+            help='Terminate the idle connections between two rounds'
+        )
+        parser.add_argument('--output', help='JSON results file (default stdout)')
+
+    def handle(self, *args, **options):
+        database = connections['default']
+        if database.vendor != 'postgresql' or database.pool is None:
+            raise CommandError(
+                'The default database has no connection pool: set DATABASE_URL '
+                'to a Postgres database and install psycopg[pool].'
+            )
+
+        results = run_pool_check(
+            threads=options['threads'],
+            iterations=options['iterations'],
+            hold_ms=options['hold_ms'],
+            kill_idle=options['kill_idle'],
+            log=self.stderr.write,
+        )
+
+        failed = sum(round_['errors'] for round_ in results['rounds'].values())
+        data = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        else:
+            self.stdout.write(data)
+        if failed:
+            raise CommandError(f'{failed} checkouts failed')
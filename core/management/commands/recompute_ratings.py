@@ -0,0 +1,23 @@
+"""
+Rebuild the rating average, count and histogram of every product from the
+approved reviews. The review signals keep them up to date; run this after
+bulk changes that bypass them (queryset.update, raw SQL, data imports).
+
+Example:
+    python manage.py recompute_ratings
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized product ratings from the approved reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = Review.recompute_product_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Valutazioni ricalcolate per {count} prodotti'))
@@ -0,0 +1,316 @@
+"""
+Middleware for core app.
+"""
+
+import logging
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .compression import acompress_stream, choose_encoding, compress, compress_stream
+from .cookie_cart import COOKIE_CART_SALT, cookie_cart_enabled, cookie_name
+from .instrumentation import QueryRecorder, QueryBudgetExceeded, record_stats
+
+logger = logging.getLogger(__name__)
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that only post-process the response, in
+    `process_response(request, response)` without I/O.
+    
+    Runs natively in both modes: under ASGI a sync-only middleware would make
+    Django run the rest of the stack, async views included, in a thread.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+    
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+    
+    def process_response(self, request, response):
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware able to run under ASGI too (WhiteNoise itself is sync only).
+    Files are looked up in memory and served from a thread, other requests go on async.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+    
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """
+    Compress HTML and JSON responses with brotli or gzip (core.compression).
+    
+    Only COMPRESSION_CONTENT_TYPES are compressed, when the body is at least
+    COMPRESSION_MIN_SIZE bytes and gets smaller; streaming responses are
+    compressed chunk by chunk, whatever their size. Static files are served
+    precompressed by WhiteNoise and never reach this middleware.
+    
+    Must be placed right after StaticFilesMiddleware, before anything that
+    reads or changes the response body.
+    """
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'COMPRESSION_ENABLED', True)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.content_types = tuple(getattr(
+            settings, 'COMPRESSION_CONTENT_TYPES', ('text/html', 'application/json')
+        ))
+    
+    def process_response(self, request, response):
+        if not self.enabled or response.status_code == 206 or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in self.content_types:
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        
+        # Compressed or not, the response depends on Accept-Encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            content = compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+        
+        # The encoded body is no longer byte for byte the one the ETag was computed on
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class EdgeCacheMiddleware(HybridMiddleware):
+    """
+    Mark anonymous storefront pages as cacheable by shared caches (CDN / reverse proxy).
+    
+    A page is a candidate when its URL name is listed in EDGE_CACHE_URL_NAMES and the
+    request carries no session, messages or guest cart cookie. The view then runs with an
+    anonymous user and the cart badge is loaded asynchronously from core:cart-summary.
+    The response gets `Cache-Control: public, s-maxage` only if the session and the
+    messages were not touched and no cookie was set while rendering.
+    
+    Must be placed before SessionMiddleware, so that its response phase runs last.
+    """
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'EDGE_CACHE_ENABLED', False)
+        self.max_age = getattr(settings, 'EDGE_CACHE_MAX_AGE', 300)
+        self.url_names = set(getattr(settings, 'EDGE_CACHE_URL_NAMES', []))
+    
+    def process_response(self, request, response):
+        if getattr(request, 'edge_cacheable', False) and self.is_cacheable(request, response):
+            patch_cache_control(response, public=True, max_age=0, s_maxage=self.max_age)
+            patch_vary_headers(response, ['Accept-Encoding'])
+        
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Flag candidate requests before the view and the context processors run."""
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.view_name not in self.url_names:
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+            return None
+        if cookie_cart_enabled() and cookie_name() in request.COOKIES:
+            return None
+        
+        # Without a session cookie the visitor is anonymous: avoid loading the session
+        request.edge_cacheable = True
+        request.user = AnonymousUser()
+        return None
+    
+    def is_cacheable(self, request, response):
+        """Check that nothing user-specific was read or written while rendering."""
+        if response.status_code != 200 or response.has_header('Cache-Control'):
+            return False
+        if response.cookies or 'Cookie' in response.get('Vary', ''):
+            return False
+        
+        session = getattr(request, 'session', None)
+        if session is not None and (session.accessed or session.modified):
+            return False
+        
+        storage = getattr(request, '_messages', None)
+        if storage is not None and (storage.used or storage.added_new):
+            return False
+        
+        return True
+
+
+class CookieCartMiddleware(HybridMiddleware):
+    """
+    Write the guest cart cookie (core.cookie_cart) back when the cart changed.
+    
+    Active when COOKIE_CART_ENABLED is set; responses that read the cart get
+    `Vary: Cookie`, an emptied cart deletes the cookie.
+    """
+    
+    def process_response(self, request, response):
+        cart = getattr(request, '_cookie_cart', None)
+        if cart is None or not cookie_cart_enabled():
+            return response
+        
+        patch_vary_headers(response, ['Cookie'])
+        if not cart.modified:
+            return response
+        
+        if cart.lines:
+            response.set_signed_cookie(
+                cookie_name(),
+                cart.serialize(),
+                salt=COOKIE_CART_SALT,
+                max_age=getattr(settings, 'COOKIE_CART_MAX_AGE', None),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        else:
+            response.delete_cookie(cookie_name(), samesite=settings.SESSION_COOKIE_SAMESITE)
+        
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Record SQL count, database time and repeated statements of every request.
+    
+    Query shapes repeated with different parameters are reported as N+1 patterns,
+    statements repeated with the same parameters as duplicates.
+    Requests running more queries than QUERY_BUDGETS[url name] (or
+    QUERY_BUDGET_DEFAULT) are logged, or raise QueryBudgetExceeded when
+    QUERY_BUDGET_RAISE is set (the default under the test runner).
+    Statistics per endpoint are shown to staff in core:query-report; they
+    are recorded for a QUERY_STATS_SAMPLE_RATE share of the requests.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', False)
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        self.threshold = getattr(settings, 'QUERY_BUDGET_N_PLUS_ONE_THRESHOLD', 5)
+        self.raise_errors = getattr(settings, 'QUERY_BUDGET_RAISE', False)
+        self.sample_rate = getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 1.0)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        return self.check(request, response, recorder)
+    
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        
+        # The async ORM runs the queries of a request in its own sync thread:
+        # the wrapper has to be installed on the connection of that thread
+        recorder = QueryRecorder()
+        wrapper = await sync_to_async(self.install_wrapper)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+        return await sync_to_async(self.check)(request, response, recorder)
+    
+    @staticmethod
+    def install_wrapper(recorder):
+        wrapper = connection.execute_wrapper(recorder)
+        wrapper.__enter__()
+        return wrapper
+    
+    def check(self, request, response, recorder):
+        """Log or raise for the statistics of a finished request."""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        view_name = match.view_name
+        
+        n_plus_one = recorder.n_plus_one(self.threshold)
+        for shape, count in n_plus_one:
+            logger.warning('Possible N+1 in %s: %d x %s', view_name, count, shape)
+        duplicates = recorder.duplicates()
+        for shape, count in duplicates:
+            logger.warning('Duplicate query in %s: %d x %s', view_name, count, shape)
+        
+        budget = self.budgets.get(view_name, self.default_budget)
+        over_budget = budget is not None and recorder.count > budget
+        
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            record_stats(view_name, recorder, n_plus_one, over_budget, duplicates)
+        
+        if over_budget:
+            message = '%s ran %d queries (budget %d, %.1f ms)' % (
+                view_name, recorder.count, budget, recorder.duration * 1000
+            )
+            if self.raise_errors:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        
+        return response
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('products', '0003_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchaseMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matrix', models.BinaryField(verbose_name='Matrice')),
+                ('last_order_id', models.BigIntegerField(default=0, verbose_name='Ultimo ordine')),
+                ('computed_at', models.DateTimeField(verbose_name='Calcolata il')),
+            ],
+            options={
+                'verbose_name': 'Matrice Acquisti Abbinati',
+                'verbose_name_plural': 'Matrici Acquisti Abbinati',
+            },
+        ),
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Posizione')),
+                ('score', models.FloatField(verbose_name='Punteggio')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copurchase_links', to='products.product', verbose_name='Prodotto')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copurchased_by', to='products.product', verbose_name='Acquistato insieme')),
+            ],
+            options={
+                'verbose_name': 'Acquisto Abbinato',
+                'verbose_name_plural': 'Acquisti Abbinati',
+                'ordering': ['product', 'rank'],
+                'indexes': [models.Index(fields=['product', 'rank'], name='core_copurc_product_3d1933_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'related'), name='unique_copurchase')],
+            },
+        ),
+    ]
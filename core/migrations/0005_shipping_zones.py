@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_default_zone(apps, schema_editor):
+    """The rule used so far: €5, free over €50, for Italy."""
+    ShippingZone = apps.get_model('core', 'ShippingZone')
+    ShippingBand = apps.get_model('core', 'ShippingBand')
+    zone = ShippingZone.objects.create(name='Italia', countries='IT')
+    ShippingBand.objects.create(zone=zone, max_weight=None, price='5.00', free_over='50.00')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_order_item_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('countries', models.CharField(blank=True, help_text='Codici ISO separati da virgola (IT, SM); vuoto: tutti i paesi', max_length=255, verbose_name='Paesi')),
+                ('postal_code_prefixes', models.TextField(blank=True, help_text='Prefissi separati da virgola (07, 08, 09); vuoto: tutti i CAP', verbose_name='Prefissi CAP')),
+                ('priority', models.IntegerField(default=0, help_text='Le zone con priorità più alta sono provate per prime', verbose_name='Priorità')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Attiva')),
+            ],
+            options={
+                'verbose_name': 'Zona di Spedizione',
+                'verbose_name_plural': 'Zone di Spedizione',
+                'ordering': ['-priority', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShippingBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_weight', models.DecimalField(blank=True, decimal_places=2, help_text='Vuoto: nessun limite', max_digits=8, null=True, verbose_name='Peso massimo (kg)')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Prezzo')),
+                ('free_over', models.DecimalField(blank=True, decimal_places=2, help_text='Subtotale oltre il quale la spedizione è gratuita', max_digits=12, null=True, verbose_name='Gratuita sopra')),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='core.shippingzone', verbose_name='Zona')),
+            ],
+            options={
+                'verbose_name': 'Fascia di Spedizione',
+                'verbose_name_plural': 'Fasce di Spedizione',
+                'ordering': ['zone', 'max_weight'],
+            },
+        ),
+        migrations.RunPython(create_default_zone, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_shipping_zones'),
+        ('products', '0005_vat_classes'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='coupon_code',
+            field=models.CharField(blank=True, max_length=30, verbose_name='Codice Sconto'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='coupon_code',
+            field=models.CharField(blank=True, max_length=30, verbose_name='Codice Sconto'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=12, verbose_name='Sconto'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=12, verbose_name='Sconto'),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('kind', models.CharField(choices=[('percent', 'Sconto percentuale'), ('fixed', 'Sconto fisso per unità'), ('buy_x_get_y', 'Prendi X, uno Y in omaggio')], default='percent', max_length=20, verbose_name='Tipo')),
+                ('value', models.DecimalField(decimal_places=2, default=0, help_text='Percentuale, o importo scontato per unità', max_digits=10, verbose_name='Valore')),
+                ('buy_quantity', models.PositiveSmallIntegerField(default=0, help_text='Prendi X: ogni X unità dello stesso prodotto, Y in omaggio', verbose_name='Quantità acquistata (X)')),
+                ('get_quantity', models.PositiveSmallIntegerField(default=0, verbose_name='Quantità in omaggio (Y)')),
+                ('code', models.CharField(blank=True, help_text='Vuoto: promozione automatica', max_length=30, verbose_name='Codice Sconto')),
+                ('min_subtotal', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Subtotale minimo')),
+                ('max_uses', models.PositiveIntegerField(blank=True, help_text='Ordini che possono usare il codice; vuoto: illimitati', null=True, verbose_name='Utilizzi massimi')),
+                ('uses', models.PositiveIntegerField(default=0, editable=False, verbose_name='Utilizzi')),
+                ('starts_at', models.DateTimeField(blank=True, null=True, verbose_name='Inizio')),
+                ('ends_at', models.DateTimeField(blank=True, null=True, verbose_name='Fine')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Attiva')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creata il')),
+                ('categories', models.ManyToManyField(blank=True, related_name='promotions', to='products.category', verbose_name='Categorie')),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='products.product', verbose_name='Prodotti')),
+                ('tags', models.ManyToManyField(blank=True, related_name='promotions', to='taggit.tag', verbose_name='Tag')),
+            ],
+            options={
+                'verbose_name': 'Promozione',
+                'verbose_name_plural': 'Promozioni',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('code', ''), _negated=True), fields=('code',), name='unique_promotion_code')],
+            },
+        ),
+    ]
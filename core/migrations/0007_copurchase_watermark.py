@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_promotions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='copurchasematrix',
+            name='last_order_id',
+        ),
+        migrations.AddField(
+            model_name='copurchasematrix',
+            name='folded_until',
+            field=models.DateTimeField(null=True, verbose_name='Ordini inclusi fino al'),
+        ),
+    ]
@@ -3,15 +3,31 @@ Core models for e-commerce functionality.
 Includes Cart, Order, OrderItem, and Payment models.
 """
 
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from shortuuid.django_fields import ShortUUIDField
-from products.models import Product
+from products.models import Category, Product, VatClass
+from taggit.models import Tag, TaggedItem
+from accounts.models import UserProfile
 from decimal import Decimal
+from .caching import namespace
+from .pricing import ORDER_LINE_FIELDS, price_lines, pricing_rules, quote_items, quote_order
+from .promotions import discount_items, promotion_index
+from .tracking import DirtyFieldsMixin
 
 User = get_user_model()
 
+# Item counts of the user carts (cart badge)
+cart_cache = namespace('cart')
+
+
+# Session key holding the guest cart id, kept across the login key rotation
+CART_SESSION_KEY = 'cart_id'
+
 
 # Order Status Choices
 ORDER_STATUS = (
@@ -32,6 +48,13 @@ PAYMENT_STATUS = (
     ('refunded', _('Rimborsato')),
 )
 
+# Promotion Kind Choices
+PROMOTION_KINDS = (
+    ('percent', _('Sconto percentuale')),
+    ('fixed', _('Sconto fisso per unità')),
+    ('buy_x_get_y', _('Prendi X, uno Y in omaggio')),
+)
+
 # Payment Method Choices
 PAYMENT_METHOD = (
     ('paypal', _('PayPal')),
@@ -67,6 +90,7 @@ class Cart(models.Model):
         blank=True,
         verbose_name=_('Sessione')
     )
+    coupon_code = models.CharField(max_length=30, blank=True, verbose_name=_('Codice Sconto'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Creato il'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Aggiornato il'))
     
@@ -84,32 +108,112 @@ class Cart(models.Model):
         """Get total number of items in cart."""
         return sum(item.quantity for item in self.items.all())
     
+    @staticmethod
+    def cached_total_items(user_id):
+        """Get total number of items in the cart of a user, from the 'cart' cache namespace."""
+        return cart_cache.get_or_set(
+            f'user:{user_id}',
+            lambda: CartItem.objects.filter(cart__user_id=user_id).aggregate(
+                total=models.Sum('quantity')
+            )['total'] or 0
+        )
+    
+    def forget_summary(self):
+        """Drop the cached item count of the user cart once the change is committed."""
+        if self.user_id:
+            key = f'user:{self.user_id}'
+            transaction.on_commit(lambda: cart_cache.delete(key))
+    
+    def get_discounts(self, items, promotions=None):
+        """Line discounts of the loaded `items` (core.promotions), with the cart coupon."""
+        return discount_items(items, self.coupon_code, index=promotions)
+    
+    def get_quote(self, items=None, rules=None, promotions=None):
+        """
+        Price the cart with its promotions and core.pricing (default country, no address yet).
+        `items` must have their product loaded; the cart items are read with one query if not given.
+        """
+        if items is None:
+            items = self.items.select_related('product')
+        items = list(items)
+        discounts = self.get_discounts(items, promotions)
+        quote = quote_items(items, rules=rules, discounts=discounts.amounts)
+        quote.promotions = discounts.applied
+        return quote
+    
     def get_subtotal(self):
         """Calculate cart subtotal (sum of all items)."""
-        return sum(item.get_total() for item in self.items.all())
+        return self.get_quote().subtotal
     
     def get_shipping_cost(self):
-        """Calculate shipping cost based on subtotal."""
-        subtotal = self.get_subtotal()
-        if subtotal >= 50:  # Free shipping over €50
-            return Decimal('0.00')
-        return Decimal('5.00')  # Standard shipping €5
+        """Calculate shipping cost (weight and zone bands)."""
+        return self.get_quote().shipping
     
     def get_tax(self):
-        """Calculate tax (IVA 22%)."""
-        subtotal = self.get_subtotal()
-        return (subtotal * Decimal('0.22')).quantize(Decimal('0.01'))
+        """Calculate tax (VAT class of each product)."""
+        return self.get_quote().tax
     
     def get_total(self):
         """Calculate cart total including shipping and tax."""
-        subtotal = self.get_subtotal()
-        shipping = self.get_shipping_cost()
-        tax = self.get_tax()
-        return subtotal + shipping + tax
+        return self.get_quote().total
+    
+    def summarize(self, items, rules=None, promotions=None):
+        """Item count and totals of the already loaded `items`, as returned by the AJAX views."""
+        quote = self.get_quote(items, rules, promotions)
+        return {
+            'cart_total_items': quote.item_count,
+            'cart_subtotal': float(quote.subtotal),
+            'cart_discount': float(quote.discount),
+            'cart_shipping': float(quote.shipping),
+            'cart_tax': float(quote.tax),
+            'cart_total': float(quote.total),
+        }
+    
+    async def asummary(self):
+        """summarize() of the cart items, loaded with their products by one async query."""
+        items = [item async for item in self.items.select_related('product')]
+        return self.summarize(items, await pricing_rules.aget(), await promotion_index.aget())
     
     def clear(self):
         """Remove all items from cart."""
         self.items.all().delete()
+    
+    def merge(self, guest_cart):
+        """
+        Move the items of a guest cart into this cart and delete the guest cart.
+        Quantities of products present in both carts are summed and clamped
+        to the available stock by a single INSERT ... ON CONFLICT statement,
+        so the number of queries does not depend on the cart size. Lines
+        left without quantity (stock gone to 0 meanwhile) are deleted.
+        """
+        item_table = CartItem._meta.db_table
+        product_table = Product._meta.db_table
+        least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+        now = timezone.now()
+        
+        sql = f"""
+            INSERT INTO {item_table} (cart_id, product_id, quantity, price, created_at, updated_at)
+            SELECT %s, gi.product_id, {least}(gi.quantity, p.stock_count), gi.price, %s, %s
+            FROM {item_table} gi
+            INNER JOIN {product_table} p ON p.id = gi.product_id
+            WHERE gi.cart_id = %s AND p.stock_count > 0
+            ON CONFLICT (cart_id, product_id) DO UPDATE SET
+                quantity = {least}(
+                    {item_table}.quantity + excluded.quantity,
+                    (SELECT sp.stock_count FROM {product_table} sp WHERE sp.id = excluded.product_id)
+                ),
+                updated_at = excluded.updated_at
+        """
+        
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [self.pk, now, now, guest_cart.pk])
+            CartItem.objects.filter(cart=self, quantity__lte=0).delete()
+            if guest_cart.coupon_code and not self.coupon_code:
+                self.coupon_code = guest_cart.coupon_code
+                self.save(update_fields=['coupon_code', 'updated_at'])
+            guest_cart.delete()
+        self.forget_summary()
 
 
 class CartItem(models.Model):
@@ -157,7 +261,41 @@ class CartItem(models.Model):
         super().save(*args, **kwargs)
 
 
-class Order(models.Model):
+class OrderQuerySet(models.QuerySet):
+    """Bulk operations on orders (Order.objects)."""
+    
+    def update_item_counts(self):
+        """Recompute item_count and line_count of the orders with one grouped UPDATE."""
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        return self.update(
+            item_count=Coalesce(Subquery(items.annotate(total=models.Sum('quantity')).values('total')), 0),
+            line_count=Coalesce(Subquery(items.annotate(total=models.Count('pk')).values('total')), 0),
+            # update() skips auto_now: the sales rollups look for changed orders by updated_at
+            updated_at=Now(),
+        )
+    
+    def recalculate_totals(self, batch_size=500):
+        """
+        Price the orders again with the current rules (core.pricing): one query
+        for the lines of all the orders, then a bulk UPDATE. Returns the orders updated.
+        """
+        orders = list(self)
+        lines = {order.pk: [] for order in orders}
+        rows = OrderItem.objects.filter(order__in=[order.pk for order in orders]).values_list(
+            'order_id', *ORDER_LINE_FIELDS
+        )
+        for row in rows:
+            lines[row[0]].append(row[1:])
+        # bulk_update skips auto_now: the sales rollups look for changed orders by updated_at
+        now = timezone.now()
+        for order in orders:
+            order.apply_quote(price_lines(lines[order.pk], order.shipping_country, order.shipping_postal_code))
+            order.updated_at = now
+        self.model.objects.bulk_update(orders, [*Order.TOTAL_FIELDS, 'updated_at'], batch_size=batch_size)
+        return len(orders)
+
+
+class Order(DirtyFieldsMixin, models.Model):
     """
     Order Model.
     Represents a customer order.
@@ -204,6 +342,13 @@ class Order(models.Model):
         default=0.00,
         verbose_name=_('Subtotale')
     )
+    discount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0.00,
+        verbose_name=_('Sconto')
+    )
+    coupon_code = models.CharField(max_length=30, blank=True, verbose_name=_('Codice Sconto'))
     shipping_cost = models.DecimalField(
         max_digits=12,
         decimal_places=2,
@@ -223,6 +368,10 @@ class Order(models.Model):
         verbose_name=_('Totale')
     )
     
+    # Item counts, kept with the totals so that order lists do not read the items
+    item_count = models.PositiveIntegerField(default=0, verbose_name=_('Articoli'))
+    line_count = models.PositiveIntegerField(default=0, verbose_name=_('Righe'))
+    
     # Order Status
     order_status = models.CharField(
         max_length=20,
@@ -238,6 +387,11 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Creato il'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Aggiornato il'))
     
+    objects = OrderQuerySet.as_manager()
+    
+    # Fields set by apply_quote
+    TOTAL_FIELDS = ['subtotal', 'discount', 'shipping_cost', 'tax', 'total', 'item_count', 'line_count']
+    
     class Meta:
         verbose_name = _('Ordine')
         verbose_name_plural = _('Ordini')
@@ -247,25 +401,22 @@ class Order(models.Model):
         return f"Ordine {self.order_id} - {self.full_name}"
     
     def get_total_items(self):
-        """Get total number of items in order."""
-        return sum(item.quantity for item in self.items.all())
+        """Get total number of items in order (stored in item_count)."""
+        return self.item_count
+    
+    def apply_quote(self, quote):
+        """Copy the totals and item counts of a core.pricing Quote (not saved)."""
+        self.subtotal = quote.subtotal
+        self.discount = quote.discount
+        self.shipping_cost = quote.shipping
+        self.tax = quote.tax
+        self.total = quote.total
+        self.item_count = quote.item_count
+        self.line_count = quote.line_count
     
     def calculate_totals(self):
-        """Calculate and update order totals."""
-        self.subtotal = sum(item.get_total() for item in self.items.all())
-        
-        # Calculate shipping
-        if self.subtotal >= 50:
-            self.shipping_cost = Decimal('0.00')
-        else:
-            self.shipping_cost = Decimal('5.00')
-        
-        # Calculate tax (IVA 22%)
-        self.tax = (self.subtotal * Decimal('0.22')).quantize(Decimal('0.01'))
-        
-        # Calculate total
-        self.total = self.subtotal + self.shipping_cost + self.tax
-        
+        """Calculate and update order totals and item counts (core.pricing, one query for the lines)."""
+        self.apply_quote(quote_order(self))
         self.save()
 
 
@@ -294,6 +445,13 @@ class OrderItem(models.Model):
         decimal_places=2,
         verbose_name=_('Prezzo Unitario')
     )
+    # Promotions and coupon at checkout, kept when the order is priced again
+    discount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0.00,
+        verbose_name=_('Sconto')
+    )
     
     class Meta:
         verbose_name = _('Articolo Ordine')
@@ -303,11 +461,11 @@ class OrderItem(models.Model):
         return f"{self.quantity}x {self.product_title}"
     
     def get_total(self):
-        """Calculate total price for this item."""
-        return self.price * self.quantity
+        """Calculate total price for this item, after its discount."""
+        return self.price * self.quantity - self.discount
 
 
-class Payment(models.Model):
+class Payment(DirtyFieldsMixin, models.Model):
     """
     Payment Model.
     Tracks payment information for orders.
@@ -410,7 +568,7 @@ class Wishlist(models.Model):
         return f"{self.user.email} - {self.product.title}"
 
 
-class Review(models.Model):
+class Review(DirtyFieldsMixin, models.Model):
     """
     Product Review Model.
     Allows users to review products.
@@ -451,6 +609,412 @@ class Review(models.Model):
         verbose_name_plural = _('Recensioni')
         unique_together = ('user', 'product')
         ordering = ['-created_at']
+        indexes = [
+            # Approved reviews of a product, newest first
+            models.Index(fields=['product', 'is_approved', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.product.title} ({self.rating}★)"
+    
+    @classmethod
+    def recompute_product_ratings(cls, batch_size=1000):
+        """
+        Rebuild the rating columns of every product from the approved reviews
+        with one grouped query. Returns the number of reviewed products.
+        """
+        histograms = {}
+        rows = cls.objects.filter(is_approved=True).values('product_id', 'rating').annotate(
+            count=models.Count('id')
+        ).order_by()
+        for row in rows:
+            histograms.setdefault(row['product_id'], {})[row['rating']] = row['count']
+        
+        products = []
+        for product_id, histogram in histograms.items():
+            product = Product(id=product_id)
+            for rating in range(1, 6):
+                setattr(product, f'rating_{rating}', histogram.get(rating, 0))
+            product.rating_count = sum(histogram.values())
+            product.rating_avg = (
+                Decimal(sum(rating * count for rating, count in histogram.items())) / product.rating_count
+            ).quantize(Decimal('0.01'))
+            products.append(product)
+        
+        rating_fields = ['rating_avg', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+        with transaction.atomic():
+            Product.objects.exclude(id__in=histograms.keys()).filter(rating_count__gt=0).update(
+                **{field: 0 for field in rating_fields}
+            )
+            Product.objects.bulk_update(products, rating_fields, batch_size=batch_size)
+        return len(products)
+
+
+class CoPurchase(models.Model):
+    """
+    Frequently bought together.
+    Top co-purchased products of a product, computed by `compute_copurchases`.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='copurchase_links',
+        verbose_name=_('Prodotto')
+    )
+    related = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='copurchased_by',
+        verbose_name=_('Acquistato insieme')
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name=_('Posizione'))
+    score = models.FloatField(verbose_name=_('Punteggio'))
+    
+    class Meta:
+        verbose_name = _('Acquisto Abbinato')
+        verbose_name_plural = _('Acquisti Abbinati')
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_copurchase'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.title} + {self.related.title}"
+    
+    @staticmethod
+    def suggestions(product_ids, limit=4):
+        """
+        Published products most often bought with the given ones, excluding them.
+        A single query: scores of several source products are summed.
+        """
+        return Product.objects.filter(
+            copurchased_by__product_id__in=product_ids,
+            product_status='published',
+            status=True,
+            in_stock=True
+        ).exclude(
+            id__in=product_ids
+        ).annotate(
+            copurchase_score=models.Sum('copurchased_by__score')
+        ).order_by('-copurchase_score')[:limit]
+
+
+class CoPurchaseMatrix(models.Model):
+    """
+    State of the co-purchase engine (a single row).
+    Keeps the recency weighted co-occurrence matrix and the creation date
+    of the orders folded in, so later runs only add the newer orders.
+    """
+    matrix = models.BinaryField(verbose_name=_('Matrice'))
+    folded_until = models.DateTimeField(null=True, verbose_name=_('Ordini inclusi fino al'))
+    computed_at = models.DateTimeField(verbose_name=_('Calcolata il'))
+    
+    class Meta:
+        verbose_name = _('Matrice Acquisti Abbinati')
+        verbose_name_plural = _('Matrici Acquisti Abbinati')
+    
+    def __str__(self):
+        return f"Matrice acquisti abbinati ({self.computed_at:%d/%m/%Y %H:%M})"
+
+
+class ShippingZone(models.Model):
+    """
+    Shipping zone (core.pricing).
+    Destinations matching its countries and postal code prefixes pay its weight bands.
+    """
+    name = models.CharField(max_length=100, verbose_name=_('Nome'))
+    countries = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name=_('Paesi'),
+        help_text=_('Codici ISO separati da virgola (IT, SM); vuoto: tutti i paesi')
+    )
+    postal_code_prefixes = models.TextField(
+        blank=True,
+        verbose_name=_('Prefissi CAP'),
+        help_text=_('Prefissi separati da virgola (07, 08, 09); vuoto: tutti i CAP')
+    )
+    priority = models.IntegerField(
+        default=0,
+        verbose_name=_('Priorità'),
+        help_text=_('Le zone con priorità più alta sono provate per prime')
+    )
+    is_active = models.BooleanField(default=True, verbose_name=_('Attiva'))
+    
+    class Meta:
+        verbose_name = _('Zona di Spedizione')
+        verbose_name_plural = _('Zone di Spedizione')
+        ordering = ['-priority', 'name']
+    
+    def __str__(self):
+        return self.name
+
+
+class ShippingBand(models.Model):
+    """Shipping price of a zone up to a basket weight."""
+    zone = models.ForeignKey(
+        ShippingZone,
+        on_delete=models.CASCADE,
+        related_name='bands',
+        verbose_name=_('Zona')
+    )
+    max_weight = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_('Peso massimo (kg)'),
+        help_text=_('Vuoto: nessun limite')
+    )
+    price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=_('Prezzo'))
+    free_over = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_('Gratuita sopra'),
+        help_text=_('Subtotale oltre il quale la spedizione è gratuita')
+    )
+    
+    class Meta:
+        verbose_name = _('Fascia di Spedizione')
+        verbose_name_plural = _('Fasce di Spedizione')
+        ordering = ['zone', 'max_weight']
+    
+    def __str__(self):
+        limit = f"fino a {self.max_weight} kg" if self.max_weight is not None else "oltre"
+        return f"{self.zone.name} {limit}: €{self.price}"
+
+
+class Promotion(models.Model):
+    """
+    Seasonal promotion or coupon (core.promotions).
+    Discounts the products, categories and tags it targets (the whole
+    catalog when none is set) between starts_at and ends_at. With a code
+    it applies only to the carts that entered it.
+    """
+    name = models.CharField(max_length=100, verbose_name=_('Nome'))
+    kind = models.CharField(max_length=20, choices=PROMOTION_KINDS, default='percent', verbose_name=_('Tipo'))
+    value = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Valore'),
+        help_text=_('Percentuale, o importo scontato per unità')
+    )
+    buy_quantity = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_('Quantità acquistata (X)'),
+        help_text=_('Prendi X: ogni X unità dello stesso prodotto, Y in omaggio')
+    )
+    get_quantity = models.PositiveSmallIntegerField(default=0, verbose_name=_('Quantità in omaggio (Y)'))
+    products = models.ManyToManyField(
+        Product,
+        blank=True,
+        related_name='promotions',
+        verbose_name=_('Prodotti')
+    )
+    categories = models.ManyToManyField(
+        Category,
+        blank=True,
+        related_name='promotions',
+        verbose_name=_('Categorie')
+    )
+    tags = models.ManyToManyField(Tag, blank=True, related_name='promotions', verbose_name=_('Tag'))
+    code = models.CharField(
+        max_length=30,
+        blank=True,
+        verbose_name=_('Codice Sconto'),
+        help_text=_('Vuoto: promozione automatica')
+    )
+    min_subtotal = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_('Subtotale minimo')
+    )
+    max_uses = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Utilizzi massimi'),
+        help_text=_('Ordini che possono usare il codice; vuoto: illimitati')
+    )
+    uses = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Utilizzi'))
+    starts_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Inizio'))
+    ends_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Fine'))
+    is_active = models.BooleanField(default=True, verbose_name=_('Attiva'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Creata il'))
+    
+    class Meta:
+        verbose_name = _('Promozione')
+        verbose_name_plural = _('Promozioni')
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['code'],
+                condition=~models.Q(code=''),
+                name='unique_promotion_code'
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.user.email} - {self.product.title} ({self.rating}★)"
\ No newline at end of file
+        return f"{self.name} ({self.code})" if self.code else self.name
+    
+    def save(self, *args, **kwargs):
+        """Codes are matched case-insensitively."""
+        self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def claim(cls, code):
+        """Count an order using `code`, with one conditional UPDATE: False when no use is left."""
+        return bool(cls.objects.filter(
+            models.Q(max_uses__isnull=True) | models.Q(uses__lt=models.F('max_uses')),
+            code=code,
+        ).update(uses=models.F('uses') + 1))
+
+
+# Signal to merge the guest cart into the user cart on login
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    """Merge the session cart (or cookie cart) of a guest into the user cart after login."""
+    if request is None or not hasattr(request, 'session'):
+        return
+    
+    from .cookie_cart import CookieCart, has_cookie_cart
+    if has_cookie_cart(request):
+        cookie_cart = CookieCart.from_request(request)
+        if cookie_cart.lines:
+            user_cart, created = Cart.objects.get_or_create(user=user)
+            cookie_cart.save_to_db(user_cart)
+    
+    cart_id = request.session.pop(CART_SESSION_KEY, None)
+    if not cart_id:
+        return
+    
+    guest_cart = Cart.objects.filter(cart_id=cart_id, user__isnull=True).first()
+    if guest_cart is None:
+        return
+    
+    user_cart, created = Cart.objects.get_or_create(user=user)
+    user_cart.merge(guest_cart)
+
+
+# Signal to keep the cached cart badge of the users in sync
+from django.db.models.signals import post_save, post_delete
+
+
+@receiver([post_save, post_delete], sender=CartItem)
+def forget_cart_summary(sender, instance, **kwargs):
+    """Drop the cached item count of the cart owner."""
+    if CartItem.cart.is_cached(instance):
+        cart = instance.cart
+    else:
+        cart = Cart.objects.filter(pk=instance.cart_id).only('user_id').first()
+    if cart is not None:
+        cart.forget_summary()
+
+
+# Signal to rebuild the compiled pricing rules when a rule changes
+@receiver([post_save, post_delete], sender=ShippingZone)
+@receiver([post_save, post_delete], sender=ShippingBand)
+@receiver([post_save, post_delete], sender=VatClass)
+def invalidate_pricing_rules(sender, **kwargs):
+    """Rebuild the pricing rules of every process once the change is committed."""
+    transaction.on_commit(pricing_rules.invalidate)
+
+
+# Signals to rebuild the promotion index when a promotion or its targets change
+from django.db.models.signals import m2m_changed
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+@receiver(m2m_changed, sender=Promotion.tags.through)
+@receiver([post_save, post_delete], sender=TaggedItem)
+def invalidate_promotion_index(sender, **kwargs):
+    """Rebuild the promotion index of every process once the change is committed."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(promotion_index.invalidate)
+
+
+# Signals to keep the product rating columns in sync with the approved reviews
+from django.db.models.signals import pre_save
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """Store the rating counted before this save (None if not counted)."""
+    instance._counted_rating = None
+    previous = instance.loaded_values()
+    if not (previous and {'rating', 'is_approved', 'product_id'} <= previous.keys()) and instance.pk:
+        previous = Review.objects.filter(pk=instance.pk).values('rating', 'is_approved', 'product_id').first()
+    if previous and previous['is_approved']:
+        instance._counted_rating = (previous['product_id'], previous['rating'])
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, **kwargs):
+    """Move the review between histogram buckets (approval, rating or product change)."""
+    changes = {}
+    previous = getattr(instance, '_counted_rating', None)
+    if previous:
+        product_id, rating = previous
+        changes.setdefault(product_id, {})[rating] = -1
+    if instance.is_approved:
+        product_changes = changes.setdefault(instance.product_id, {})
+        product_changes[instance.rating] = product_changes.get(instance.rating, 0) + 1
+    for product_id, product_changes in changes.items():
+        Product.update_ratings(product_id, product_changes)
+
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating(sender, instance, **kwargs):
+    if instance.is_approved:
+        Product.update_ratings(instance.product_id, {instance.rating: -1})
+
+
+# Signals to keep the order statistics of the user profile up to date
+@receiver(pre_save, sender=Payment)
+def remember_payment_status(sender, instance, **kwargs):
+    """Store whether the payment was counted as completed before this save."""
+    instance._was_completed = False
+    previous = instance.loaded_values()
+    if previous and 'payment_status' in previous:
+        instance._was_completed = previous['payment_status'] == 'completed'
+    elif instance.pk:
+        instance._was_completed = Payment.objects.filter(
+            pk=instance.pk,
+            payment_status='completed'
+        ).exists()
+
+
+@receiver(post_save, sender=Payment)
+def update_profile_stats(sender, instance, **kwargs):
+    """Count the order when its payment completes, uncount it when refunded."""
+    is_completed = instance.payment_status == 'completed'
+    if is_completed == getattr(instance, '_was_completed', False):
+        return
+    user_id = Order.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+    if user_id is None:
+        return
+    if is_completed:
+        UserProfile.record_payment(user_id, instance.amount)
+    else:
+        UserProfile.record_payment(user_id, -instance.amount, orders=-1)
+
+
+@receiver(post_delete, sender=Payment)
+def remove_profile_stats(sender, instance, **kwargs):
+    if instance.payment_status == 'completed':
+        user_id = Order.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            UserProfile.record_payment(user_id, -instance.amount, orders=-1)
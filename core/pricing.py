@@ -0,0 +1,238 @@
+"""
+Pricing of carts and orders: subtotal, shipping and VAT of a basket.
+
+Shipping comes from ShippingZone / ShippingBand: the zone is the first
+active one (by priority) matching the country and the postal code prefix
+of the destination, the band the lightest one holding the basket weight
+(Product.weight, digital products weigh nothing). Carts have no address
+yet and are priced for PRICING_DEFAULT_COUNTRY. Without a matching zone
+the PRICING_FALLBACK_* settings apply.
+
+Line discounts (core.promotions, OrderItem.discount) are taken off before
+VAT is added to the net prices per VatClass (the default class for
+products without one): each rate is applied to the sum of its lines and
+rounded half up to the cent, as on an invoice. Shipping is not taxed, the
+free shipping thresholds look at the discounted subtotal.
+
+The rule tables are compiled into PricingRules once per process and
+rebuilt when a rule changes (core.caching.VersionedTable), so pricing a
+basket runs no query beyond loading its lines, in a single pass.
+
+Usage:
+    quote = quote_items(items, discounts=[...])  # items with their product loaded
+    quote = quote_order(order)  # one query for the order lines
+
+Async code passes `rules=await pricing_rules.aget()`, the rules may need a rebuild.
+"""
+
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+
+from .caching import VersionedTable
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+# Columns of the OrderItem rows read by quote_order, in line order
+ORDER_LINE_FIELDS = ('price', 'quantity', 'product__weight', 'product__vat_class_id', 'product__digital', 'discount')
+
+# Country names accepted in the addresses, mapped to ISO codes
+COUNTRY_ALIASES = {
+    'italia': 'IT',
+    'italy': 'IT',
+    'san marino': 'SM',
+    'città del vaticano': 'VA',
+    'vaticano': 'VA',
+}
+
+
+def cents(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def normalize_country(value):
+    """ISO code of a country name or code ('Italia', 'it' -> 'IT')."""
+    value = (value or '').strip()
+    return COUNTRY_ALIASES.get(value.casefold(), value.upper())
+
+
+def split_codes(value):
+    return [code.strip() for code in (value or '').split(',') if code.strip()]
+
+
+@dataclass
+class Quote:
+    """
+    Price of a basket: subtotal before discounts, total after them.
+    `vat` maps each rate (%) to its (taxable, tax), `promotions` the names
+    of the promotions applied to their discount (filled by the cart).
+    """
+    subtotal: Decimal = ZERO
+    discount: Decimal = ZERO
+    shipping: Decimal = ZERO
+    tax: Decimal = ZERO
+    total: Decimal = ZERO
+    weight: Decimal = ZERO
+    item_count: int = 0
+    line_count: int = 0
+    zone: str = ''
+    vat: dict = field(default_factory=dict)
+    promotions: dict = field(default_factory=dict)
+
+
+class CompiledZone:
+    """A shipping zone with its bands as (max weight or None, price, free over or None)."""
+
+    def __init__(self, name, countries, prefixes, bands):
+        self.name = name
+        self.countries = frozenset(countries)
+        self.prefixes = tuple(prefixes)
+        # Open band (no max weight) last
+        self.bands = sorted(bands, key=lambda band: (band[0] is None, band[0] or 0))
+
+    def matches(self, country, postal_code):
+        if self.countries and country not in self.countries:
+            return False
+        return not self.prefixes or postal_code.startswith(self.prefixes)
+
+    def shipping_cost(self, weight, subtotal):
+        # Heavier than every band: the heaviest one
+        max_weight, price, free_over = self.bands[-1]
+        for band in self.bands:
+            if band[0] is None or weight <= band[0]:
+                max_weight, price, free_over = band
+                break
+        if free_over is not None and subtotal >= free_over:
+            return ZERO
+        return price
+
+
+class PricingRules:
+    """Shipping zones and VAT rates, as plain Python structures."""
+
+    def __init__(self, zones, vat_rates, default_vat_rate, fallback_zone):
+        self.zones = zones
+        self.vat_rates = vat_rates
+        self.default_vat_rate = default_vat_rate
+        self.fallback_zone = fallback_zone
+        self.default_country = normalize_country(getattr(settings, 'PRICING_DEFAULT_COUNTRY', 'IT'))
+        self.default_weight = Decimal(getattr(settings, 'PRICING_DEFAULT_WEIGHT', '0'))
+
+    def zone_for(self, country=None, postal_code=''):
+        country = normalize_country(country) if country else self.default_country
+        postal_code = (postal_code or '').replace(' ', '')
+        for zone in self.zones:
+            if zone.matches(country, postal_code):
+                return zone
+        return self.fallback_zone
+
+
+def fallback_band():
+    free_over = getattr(settings, 'PRICING_FALLBACK_FREE_SHIPPING_OVER', '50.00')
+    return (
+        None,
+        Decimal(getattr(settings, 'PRICING_FALLBACK_SHIPPING', '5.00')),
+        Decimal(free_over) if free_over is not None else None,
+    )
+
+
+def build_rules():
+    """Compile the rule tables (three queries)."""
+    from products.models import VatClass
+    from .models import ShippingZone
+
+    default_vat_rate = Decimal(getattr(settings, 'PRICING_DEFAULT_VAT_RATE', '22.00'))
+    vat_rates = {}
+    for pk, rate, is_default in VatClass.objects.values_list('id', 'rate', 'is_default'):
+        vat_rates[pk] = rate
+        if is_default:
+            default_vat_rate = rate
+
+    zones = []
+    for zone in ShippingZone.objects.filter(is_active=True).prefetch_related('bands').order_by('-priority', 'pk'):
+        bands = [(band.max_weight, band.price, band.free_over) for band in zone.bands.all()]
+        zones.append(CompiledZone(
+            zone.name,
+            [normalize_country(country) for country in split_codes(zone.countries)],
+            [prefix.replace(' ', '') for prefix in split_codes(zone.postal_code_prefixes)],
+            bands or [fallback_band()],
+        ))
+
+    return PricingRules(zones, vat_rates, default_vat_rate, CompiledZone('', [], [], [fallback_band()]))
+
+
+pricing_rules = VersionedTable('pricing', build_rules)
+
+
+def price_lines(lines, country=None, postal_code='', rules=None):
+    """
+    Price a basket in one pass. `lines` are (unit price, quantity, weight,
+    VAT class id, digital, line discount) tuples, weight and VAT class may be None.
+    """
+    rules = rules or pricing_rules.get()
+    vat_rates, default_rate, default_weight = rules.vat_rates, rules.default_vat_rate, rules.default_weight
+    subtotal, discount, weight = ZERO, ZERO, ZERO
+    item_count = line_count = 0
+    shippable = False
+    taxable = {}
+
+    for price, quantity, item_weight, vat_class_id, digital, line_discount in lines:
+        amount = price * quantity
+        subtotal += amount
+        discount += line_discount
+        item_count += quantity
+        line_count += 1
+        rate = vat_rates.get(vat_class_id, default_rate)
+        taxable[rate] = taxable.get(rate, ZERO) + amount - line_discount
+        if not digital:
+            shippable = True
+            weight += (default_weight if item_weight is None else item_weight) * quantity
+
+    vat = {rate: (base, cents(base * rate / HUNDRED)) for rate, base in sorted(taxable.items())}
+    tax = sum((amounts[1] for amounts in vat.values()), ZERO)
+    subtotal, discount = cents(subtotal), cents(discount)
+
+    # Only digital products (or nothing): no shipment
+    zone, shipping = None, ZERO
+    if shippable:
+        zone = rules.zone_for(country, postal_code)
+        shipping = zone.shipping_cost(weight, subtotal - discount)
+
+    return Quote(
+        subtotal=subtotal,
+        discount=discount,
+        shipping=shipping,
+        tax=tax,
+        total=subtotal - discount + shipping + tax,
+        weight=weight,
+        item_count=item_count,
+        line_count=line_count,
+        zone=zone.name if zone is not None else '',
+        vat=vat,
+    )
+
+
+def item_line(item, discount=ZERO):
+    """Line of a cart or order item with its product loaded (the product may be gone)."""
+    product = item.product
+    if product is None:
+        return item.price, item.quantity, None, None, False, discount
+    return item.price, item.quantity, product.weight, product.vat_class_id, product.digital, discount
+
+
+def quote_items(items, country=None, postal_code='', rules=None, discounts=None):
+    """Quote of cart items, `discounts` being the line discounts in the same order."""
+    if discounts is None:
+        lines = (item_line(item) for item in items)
+    else:
+        lines = (item_line(item, discount) for item, discount in zip(items, discounts))
+    return price_lines(lines, country, postal_code, rules)
+
+
+def quote_order(order):
+    """Quote of the order items for the shipping address of the order."""
+    lines = order.items.values_list(*ORDER_LINE_FIELDS)
+    return price_lines(lines, order.shipping_country, order.shipping_postal_code)
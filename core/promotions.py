@@ -0,0 +1,252 @@
+"""
+Promotions and coupon codes applied to the cart lines.
+
+The Promotion rows are compiled into a PromotionIndex once per process and
+rebuilt only when a promotion, its targets or the product tags change
+(core.caching.VersionedTable). Tag targets are resolved to product ids at
+build time, so a line only looks up its product id and category id:
+evaluating a cart is O(items) and runs no query.
+
+Promotions do not stack: each line gets the best discount among the
+automatic promotions and the coupon of the cart that target it and are
+running (starts_at / ends_at, checked at evaluation). Coupons with a
+minimum subtotal look at the subtotal before discounts; their usage limit
+is enforced at checkout (Promotion.claim).
+
+Usage:
+    discounts = discount_items(cart_items, cart.coupon_code)
+    discounts.amounts  # line discounts, in the order of the items
+"""
+
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+
+from .caching import VersionedTable
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+class CompiledPromotion:
+    """A promotion as plain Python values, with its discount rule."""
+
+    __slots__ = (
+        'id', 'name', 'kind', 'value', 'buy', 'get', 'code', 'min_subtotal',
+        'starts_at', 'ends_at', 'everything', 'product_ids', 'category_ids',
+    )
+
+    def __init__(self, id, name, kind, value, buy=0, get=0, code='', min_subtotal=None,
+                 starts_at=None, ends_at=None, product_ids=(), category_ids=()):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.value = value
+        self.buy = buy
+        self.get = get
+        self.code = code
+        self.min_subtotal = min_subtotal
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.product_ids = frozenset(product_ids)
+        self.category_ids = frozenset(category_ids)
+        self.everything = not self.product_ids and not self.category_ids
+
+    def running(self, now):
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+    def targets(self, product_id, category_id):
+        return self.everything or product_id in self.product_ids or category_id in self.category_ids
+
+    def line_discount(self, price, quantity):
+        """Discount of `quantity` units at `price`, never more than the line."""
+        if self.kind == 'percent':
+            discount = (price * quantity * self.value / HUNDRED).quantize(CENT, rounding=ROUND_HALF_UP)
+        elif self.kind == 'fixed':
+            discount = min(self.value, price) * quantity
+        elif self.buy and self.get:
+            # Every buy + get units of the same product, `get` of them are free
+            discount = price * (quantity // (self.buy + self.get) * self.get)
+        else:
+            return ZERO
+        return min(discount, price * quantity)
+
+
+class PromotionIndex:
+    """Automatic promotions by product id, by category id and for the whole catalog; coupons by code."""
+
+    def __init__(self, promotions):
+        self.by_product = {}
+        self.by_category = {}
+        self.catalog = []
+        self.coupons = {}
+        self.size = len(promotions)
+        for promotion in promotions:
+            if promotion.code:
+                self.coupons[promotion.code] = promotion
+            elif promotion.everything:
+                self.catalog.append(promotion)
+            else:
+                for product_id in promotion.product_ids:
+                    self.by_product.setdefault(product_id, []).append(promotion)
+                for category_id in promotion.category_ids:
+                    self.by_category.setdefault(category_id, []).append(promotion)
+
+    def coupon(self, code, now=None):
+        """The running promotion of a coupon code, or None."""
+        promotion = self.coupons.get(normalize_code(code))
+        if promotion is None or not promotion.running(now or timezone.now()):
+            return None
+        return promotion
+
+    def candidates(self, product_id, category_id):
+        # A promotion targeting both the product and its category is listed twice, harmlessly
+        return (
+            self.by_product.get(product_id, [])
+            + self.by_category.get(category_id, [])
+            + self.catalog
+        )
+
+
+def build_index():
+    """Compile the promotions that are active and not over (five queries)."""
+    from taggit.models import TaggedItem
+    from .models import Promotion
+
+    now = timezone.now()
+    promotions = list(
+        Promotion.objects.filter(is_active=True).exclude(ends_at__lte=now).values(
+            'id', 'name', 'kind', 'value', 'buy_quantity', 'get_quantity', 'code',
+            'min_subtotal', 'starts_at', 'ends_at',
+        )
+    )
+    ids = [promotion['id'] for promotion in promotions]
+    product_ids, category_ids, tag_ids = {}, {}, {}
+    for promotion_id, product_id in Promotion.products.through.objects.filter(
+        promotion_id__in=ids
+    ).values_list('promotion_id', 'product_id'):
+        product_ids.setdefault(promotion_id, set()).add(product_id)
+    for promotion_id, category_id in Promotion.categories.through.objects.filter(
+        promotion_id__in=ids
+    ).values_list('promotion_id', 'category_id'):
+        category_ids.setdefault(promotion_id, set()).add(category_id)
+    for promotion_id, tag_id in Promotion.tags.through.objects.filter(
+        promotion_id__in=ids
+    ).values_list('promotion_id', 'tag_id'):
+        tag_ids.setdefault(promotion_id, set()).add(tag_id)
+
+    # Tags become the products tagged with them
+    if tag_ids:
+        tagged = {}
+        for tag_id, product_id in TaggedItem.objects.filter(
+            tag_id__in=set().union(*tag_ids.values()),
+            content_type__app_label='products',
+            content_type__model='product',
+        ).values_list('tag_id', 'object_id'):
+            tagged.setdefault(tag_id, set()).add(product_id)
+        for promotion_id, tags in tag_ids.items():
+            product_ids.setdefault(promotion_id, set()).update(*(tagged.get(tag_id, ()) for tag_id in tags))
+            # Tags with no product left: the promotion must not widen to the whole catalog
+            product_ids[promotion_id].add(None)
+
+    return PromotionIndex([
+        CompiledPromotion(
+            promotion['id'],
+            promotion['name'],
+            promotion['kind'],
+            promotion['value'],
+            buy=promotion['buy_quantity'],
+            get=promotion['get_quantity'],
+            code=normalize_code(promotion['code']),
+            min_subtotal=promotion['min_subtotal'],
+            starts_at=promotion['starts_at'],
+            ends_at=promotion['ends_at'],
+            product_ids=product_ids.get(promotion['id'], ()),
+            category_ids=category_ids.get(promotion['id'], ()),
+        )
+        for promotion in promotions
+    ])
+
+
+promotion_index = VersionedTable('promotions', build_index)
+
+
+@dataclass
+class Discounts:
+    """
+    Line discounts of a cart. `applied` maps the names of the promotions
+    used to their total discount, `coupon` is the coupon applied to at least
+    a line (None otherwise), `coupon_error` why an entered code was not used.
+    """
+    amounts: list = field(default_factory=list)
+    applied: dict = field(default_factory=dict)
+    coupon: CompiledPromotion = None
+    coupon_error: str = ''
+
+    @property
+    def total(self):
+        return sum(self.amounts, ZERO)
+
+
+def discount_lines(lines, code='', now=None, index=None):
+    """
+    Discounts of (product id, category id, unit price, quantity) lines, in one
+    pass after the subtotal (needed by coupons with a minimum subtotal).
+    """
+    index = index or promotion_index.get()
+    now = now or timezone.now()
+    lines = list(lines)
+    result = Discounts()
+
+    coupon = None
+    if code:
+        coupon = index.coupon(code, now)
+        if coupon is None:
+            result.coupon_error = 'Codice sconto non valido o scaduto'
+        elif coupon.min_subtotal is not None:
+            subtotal = sum((price * quantity for product_id, category_id, price, quantity in lines), ZERO)
+            if subtotal < coupon.min_subtotal:
+                result.coupon_error = f'Codice valido per ordini da almeno €{coupon.min_subtotal}'
+                coupon = None
+
+    amounts, applied = result.amounts, result.applied
+    coupon_targeted = False
+    for product_id, category_id, price, quantity in lines:
+        best, best_promotion = ZERO, None
+        candidates = index.candidates(product_id, category_id)
+        if coupon is not None and coupon.targets(product_id, category_id):
+            coupon_targeted = True
+            candidates = candidates + [coupon]
+        for promotion in candidates:
+            if promotion.running(now):
+                discount = promotion.line_discount(price, quantity)
+                if discount > best:
+                    best, best_promotion = discount, promotion
+        amounts.append(best)
+        if best_promotion is not None:
+            applied[best_promotion.name] = applied.get(best_promotion.name, ZERO) + best
+            if best_promotion is coupon:
+                result.coupon = coupon
+
+    if coupon is not None and result.coupon is None:
+        if coupon_targeted:
+            result.coupon_error = 'Le promozioni in corso sono già più convenienti del codice sconto'
+        else:
+            result.coupon_error = 'Il codice sconto non si applica ai prodotti nel carrello'
+    return result
+
+
+def item_line(item):
+    """Line of a cart item with its product loaded."""
+    return item.product_id, item.product.category_id, item.price, item.quantity
+
+
+def discount_items(items, code='', now=None, index=None):
+    """Discounts of cart items (product loaded), in the order of the items."""
+    return discount_lines((item_line(item) for item in items), code, now, index)
@@ -0,0 +1,301 @@
+"""
+Concurrency benchmark of the two deployments: sync gunicorn workers
+(SERVER_MODE=wsgi) against uvicorn workers running the async cart and
+wishlist views (SERVER_MODE=asgi).
+
+For each mode a gunicorn server is started from gunicorn.conf.py on a local
+port and the AJAX endpoints are hit over HTTP by `concurrency` client
+threads with keep-alive connections, all against the same database (run
+`bench_dataset` first). Requests/sec and latency percentiles per mode and
+scenario are returned as JSON, like core.benchmark.
+
+Used by the `benchmark_servers` management command.
+"""
+
+import http.client
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmark import load_fixtures, percentile
+from .cookie_cart import CookieCart, cookie_cart_enabled, cookie_name
+from .models import CartItem
+
+SERVER_MODES = ('wsgi', 'asgi')
+SERVER_START_TIMEOUT = 30
+
+
+class HttpClient:
+    """Keep-alive HTTP client of one driver thread, with its own cookies and CSRF token."""
+
+    def __init__(self, port, cookies=None):
+        self.port = port
+        self.connection = None
+        self.csrf_token = secrets.token_hex(16)
+        self.cookies = {settings.CSRF_COOKIE_NAME: self.csrf_token, **(cookies or {})}
+
+    def post(self, path, data=None):
+        body = urlencode(data or {})
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items()),
+            'X-CSRFToken': self.csrf_token,
+        }
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.connection.request('POST', path, body, headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Sync workers close the connection after each response
+                self.close()
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0':
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response.status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Worker:
+    """State of one driver thread: a guest and a logged in customer."""
+
+    def __init__(self, fixtures, port, seed):
+        self.fixtures = fixtures
+        self.random = random.Random(seed)
+        self.iteration = 0
+        self.guest = HttpClient(port)
+        self.customer = HttpClient(port, {settings.SESSION_COOKIE_NAME: fixtures['customer_session']})
+
+    def pid(self):
+        return self.random.choice(self.fixtures['pids'])
+
+    def guest_item_id(self):
+        """Return the id of an item of the guest cart, adding one if needed."""
+        item_id = self.find_guest_item()
+        if item_id is None:
+            self.guest.post(reverse('core:add-to-cart', args=[self.pid()]), {'quantity': 1})
+            item_id = self.find_guest_item()
+        return item_id
+
+    def find_guest_item(self):
+        if cookie_cart_enabled():
+            cart = CookieCart.from_cookie(self.guest.cookies.get(cookie_name()))
+            return next(iter(cart.lines), None)
+        session_key = self.guest.cookies.get(settings.SESSION_COOKIE_NAME)
+        if session_key is None:
+            return None
+        return CartItem.objects.filter(cart__session_key=session_key).values_list('pk', flat=True).first()
+
+    def empty_guest_cart(self):
+        if cookie_cart_enabled():
+            self.guest.cookies.pop(cookie_name(), None)
+        elif settings.SESSION_COOKIE_NAME in self.guest.cookies:
+            session_key = self.guest.cookies[settings.SESSION_COOKIE_NAME]
+            CartItem.objects.filter(cart__session_key=session_key).delete()
+
+    def close(self):
+        self.guest.close()
+        self.customer.close()
+
+
+# Each scenario prepares its request (not measured) and returns
+# (client, path, data) for the POST to be timed.
+
+def cart_add(worker):
+    worker.iteration += 1
+    if worker.iteration % 20 == 0:
+        worker.empty_guest_cart()
+    return worker.guest, reverse('core:add-to-cart', args=[worker.pid()]), {'quantity': 1}
+
+
+def cart_update(worker):
+    item_id = worker.guest_item_id()
+    quantity = worker.random.randint(1, 5)
+    return worker.guest, reverse('core:update-cart-item', args=[item_id]), {'quantity': quantity}
+
+
+def cart_remove(worker):
+    item_id = worker.guest_item_id()
+    return worker.guest, reverse('core:remove-from-cart', args=[item_id]), None
+
+
+def wishlist_add(worker):
+    return worker.customer, reverse('core:add-to-wishlist', args=[worker.pid()]), None
+
+
+def wishlist_remove(worker):
+    return worker.customer, reverse('core:remove-from-wishlist', args=[worker.pid()]), None
+
+
+SCENARIOS = {
+    'cart_add': cart_add,
+    'cart_update': cart_update,
+    'cart_remove': cart_remove,
+    'wishlist_add': wishlist_add,
+    'wishlist_remove': wishlist_remove,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers):
+    """Start gunicorn in `mode` and wait until it accepts connections."""
+    env = dict(os.environ, SERVER_MODE=mode, WEB_CONCURRENCY=str(workers))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+        cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The {mode} server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'The {mode} server did not start in {SERVER_START_TIMEOUT} seconds')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def summarize(samples, elapsed):
+    """Throughput and latency of a scenario (latencies in ms)."""
+    latencies = sorted(sample['ms'] for sample in samples)
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+        'status_codes': statuses,
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def run_scenario(scenario, fixtures, port, requests, concurrency, warmup, seed):
+    """Run one scenario from `concurrency` threads, `requests` timed requests in total."""
+    samples = []
+    lock = threading.Lock()
+
+    def drive(index, count):
+        worker = Worker(fixtures, port, seed + index)
+        local = []
+        try:
+            for n in range(warmup + count):
+                client, path, data = scenario(worker)
+                start = time.perf_counter()
+                try:
+                    status = client.post(path, data)
+                except Exception:
+                    status = 599
+                elapsed = time.perf_counter() - start
+                if n >= warmup:
+                    local.append({'ms': elapsed * 1000, 'status': status})
+        finally:
+            worker.close()
+            connections.close_all()
+        with lock:
+            samples.extend(local)
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(drive, range(concurrency), shares))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def run_server_benchmark(names, modes=SERVER_MODES, requests=1000, concurrency=32, workers=2,
+                         warmup=5, seed=42, log=print):
+    """Run the scenarios against a server in each mode and return the JSON-serializable results."""
+    fixtures = load_fixtures()
+    client = Client()
+    client.force_login(fixtures['customer'])
+    fixtures['customer_session'] = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    results = {}
+    for mode in modes:
+        port = free_port()
+        log(f'Starting the {mode} server on port {port} ({workers} workers)')
+        process = start_server(mode, port, workers)
+        try:
+            results[mode] = {}
+            for name in names:
+                result = run_scenario(SCENARIOS[name], fixtures, port, requests, concurrency, warmup, seed)
+                results[mode][name] = result
+                log(f"{mode} {name}: {result['rps']} req/s, p50 {result['latency_ms']['p50']} ms, "
+                    f"p99 {result['latency_ms']['p99']} ms, {result['errors']} errors")
+        finally:
+            stop_server(process)
+
+    comparison = {}
+    if all(mode in results for mode in SERVER_MODES):
+        for name in names:
+            wsgi, asgi = results['wsgi'][name], results['asgi'][name]
+            comparison[name] = {
+                'rps_ratio': round(asgi['rps'] / wsgi['rps'], 3) if wsgi['rps'] else None,
+                'p99_ms_delta': round(asgi['latency_ms']['p99'] - wsgi['latency_ms']['p99'], 3),
+            }
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'session_strategy': settings.SESSION_STRATEGY,
+            'workers': workers,
+            'concurrency': concurrency,
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed,
+        },
+        'results': results,
+        'asgi_vs_wsgi': comparison,
+    }
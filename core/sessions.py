@@ -0,0 +1,63 @@
+"""
+Session strategies and cleanup of expired sessions and abandoned guest carts.
+
+SESSION_STRATEGIES lists the settings of each SESSION_STRATEGY (see
+settings.py), so that the benchmark can compare them in one process.
+"""
+
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from .models import Cart
+
+SESSION_STRATEGIES = {
+    'db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'COOKIE_CART_ENABLED': False,
+    },
+    'cached_db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'COOKIE_CART_ENABLED': False,
+    },
+    'cookie_cart': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'COOKIE_CART_ENABLED': True,
+    },
+}
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete the rows of `queryset` by primary key, `batch_size` at a time."""
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def delete_expired_sessions(batch_size=5000):
+    """
+    Delete the expired database sessions in short transactions, unlike
+    `clearsessions` which removes them all with one statement.
+    """
+    return _delete_in_batches(
+        Session.objects.filter(expire_date__lt=timezone.now()),
+        batch_size
+    )
+
+
+def delete_abandoned_carts(days=30, batch_size=1000):
+    """Delete the guest carts left untouched for `days` whose session is gone."""
+    return _delete_in_batches(
+        Cart.objects.filter(
+            user__isnull=True,
+            updated_at__lt=timezone.now() - timedelta(days=days)
+        ).exclude(
+            session_key__in=Session.objects.values('session_key')
+        ),
+        batch_size
+    )
@@ -1,3 +1,775 @@
-from django.test import TestCase
+import gzip
+import re
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.core import signing
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, Product, VatClass
+
+from . import compression
+from .caching import LocalCache, Namespace, VersionedTable
+from .cookie_cart import COOKIE_CART_SALT, CookieCart, cookie_name
+from .instrumentation import (
+    QueryBudgetExceeded, QueryRecorder, get_endpoint_stats, record_stats, reset_stats, stats_key,
+)
+from .models import CART_SESSION_KEY, Cart, CartItem, Order, Payment, Promotion, Review, ShippingZone
+from .pricing import ZERO, CompiledZone, PricingRules, build_rules, fallback_band, price_lines
+from .promotions import CompiledPromotion, PromotionIndex, build_index, discount_lines, promotion_index
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    """Per-request query budgets (the middleware reads the settings when the client loads it)."""
+
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(title='Bomboniere')
+
+    @override_settings(QUERY_BUDGETS={'api:category-list': 0})
+    def test_over_budget_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            Client().get(reverse('api:category-list'))
+
+    @override_settings(QUERY_BUDGETS={'api:category-list': 5})
+    def test_within_budget(self):
+        response = Client().get(reverse('api:category-list'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={}, QUERY_STATS_SAMPLE_RATE=1.0)
+    def test_endpoint_stats(self):
+        client = Client()
+        client.get(reverse('api:category-list'))
+        client.get(reverse('api:category-list'))
+        stats = {row['view_name']: row for row in get_endpoint_stats()}
+        self.assertEqual(stats['api:category-list']['requests'], 2)
+        self.assertGreaterEqual(stats['api:category-list']['max_queries'], 1)
+
+        reset_stats()
+        self.assertEqual(get_endpoint_stats(), [])
+
+    def test_endpoints_listed_once(self):
+        recorder = QueryRecorder()
+        record_stats('core:home', recorder, [], False)
+        record_stats('core:cart', recorder, [], True)
+        record_stats('core:home', recorder, [], False)
+        # Counters evicted: the endpoint registers again
+        cache.delete(stats_key('core:home', 'requests'))
+        record_stats('core:home', recorder, [], False)
+
+        stats = get_endpoint_stats()
+        self.assertEqual(sorted(row['view_name'] for row in stats), ['core:cart', 'core:home'])
+        self.assertEqual({row['view_name']: row['over_budget'] for row in stats}['core:cart'], 1)
+
+
+class QueryRecorderTests(TransactionTestCase):
+
+    def test_duplicates_and_n_plus_one(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            list(Category.objects.filter(pk=1))
+            list(Category.objects.filter(pk=1))
+            for pk in range(2, 7):
+                list(Category.objects.filter(pk=pk))
+
+        self.assertEqual(recorder.count, 7)
+        self.assertEqual([count for shape, count in recorder.duplicates()], [2])
+        self.assertEqual([count for shape, count in recorder.n_plus_one(5)], [7])
+
+    def test_transaction_control_not_counted(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for n in range(2):
+                with transaction.atomic():
+                    list(Category.objects.filter(pk=1))
+                    with transaction.atomic():
+                        Category.objects.filter(pk=1).update(title='Bomboniere')
+        for sql in ('BEGIN', 'COMMIT', 'ROLLBACK', 'BEGIN ISOLATION LEVEL SERIALIZABLE'):
+            recorder(lambda *args: None, sql, None, False, {})
+
+        self.assertEqual(recorder.count, 4)
+        self.assertFalse([shape for shape in recorder.statements if not shape.startswith(('SELECT', 'UPDATE'))])
+
+
+def signed_cookie(value):
+    """Value of the guest cart cookie, as CookieCartMiddleware writes it."""
+    return signing.get_cookie_signer(salt=cookie_name() + COOKIE_CART_SALT).sign(value)
+
+
+class CartMergeTests(TestCase):
+    """Guest carts merged into the user cart at login (Cart.merge, merge_guest_cart)."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'cliente@example.com', 'secret', first_name='Anna', last_name='Rossi'
+        )
+        self.confetti = Product.objects.create(title='Confetti', price='9.90', stock_count=10)
+        self.scatola = Product.objects.create(title='Scatola', price='4.50', stock_count=3)
+        self.nastro = Product.objects.create(title='Nastro', price='1.20', stock_count=0)
+
+    def add(self, cart, product, quantity):
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity, price=product.price)
+
+    def quantities(self, cart):
+        return dict(cart.items.values_list('product__title', 'quantity'))
+
+    def test_merge_sums_and_clamps_to_stock(self):
+        user_cart = Cart.objects.create(user=self.user)
+        guest_cart = Cart.objects.create()
+        self.add(user_cart, self.confetti, 2)
+        self.add(user_cart, self.scatola, 2)
+        self.add(guest_cart, self.confetti, 3)
+        self.add(guest_cart, self.scatola, 4)
+
+        user_cart.merge(guest_cart)
+
+        self.assertEqual(self.quantities(user_cart), {'Confetti': 5, 'Scatola': 3})
+        self.assertFalse(Cart.objects.filter(pk=guest_cart.pk).exists())
+
+    def test_merge_drops_out_of_stock_lines(self):
+        user_cart = Cart.objects.create(user=self.user)
+        guest_cart = Cart.objects.create()
+        self.add(guest_cart, self.scatola, 5)
+        self.add(guest_cart, self.nastro, 2)
+
+        user_cart.merge(guest_cart)
+
+        self.assertEqual(self.quantities(user_cart), {'Scatola': 3})
+
+    def test_merge_carries_coupon(self):
+        user_cart = Cart.objects.create(user=self.user)
+        user_cart.merge(Cart.objects.create(coupon_code='SPOSI10'))
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.coupon_code, 'SPOSI10')
+
+        # The coupon of the user cart wins
+        user_cart.merge(Cart.objects.create(coupon_code='ESTATE'))
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.coupon_code, 'SPOSI10')
+
+    @override_settings(COOKIE_CART_ENABLED=True)
+    def test_login_merges_cookie_and_session_carts(self):
+        guest_cart = Cart.objects.create()
+        self.add(guest_cart, self.confetti, 2)
+        self.add(guest_cart, self.scatola, 1)
+        cookie_cart = CookieCart({
+            self.confetti.pk: [1, '9.90'],
+            self.scatola.pk: [5, '4.50'],
+            self.nastro.pk: [1, '1.20'],
+        })
+
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.session[CART_SESSION_KEY] = guest_cart.cart_id
+        request.COOKIES[cookie_name()] = signed_cookie(cookie_cart.serialize())
+        user_logged_in.send(sender=self.user.__class__, request=request, user=self.user)
+
+        user_cart = Cart.objects.get(user=self.user)
+        self.assertEqual(self.quantities(user_cart), {'Confetti': 3, 'Scatola': 3})
+        self.assertNotIn(CART_SESSION_KEY, request.session)
+        self.assertFalse(Cart.objects.filter(pk=guest_cart.pk).exists())
+
+
+def line(price, quantity=1, weight=None, vat_class_id=None, digital=False, discount=ZERO):
+    """A price_lines line from plain values."""
+    return Decimal(price), quantity, None if weight is None else Decimal(weight), vat_class_id, digital, Decimal(discount)
+
+
+def band(max_weight, price, free_over=None):
+    return (
+        None if max_weight is None else Decimal(max_weight),
+        Decimal(price),
+        None if free_over is None else Decimal(free_over),
+    )
+
+
+class PriceLinesTests(SimpleTestCase):
+    """price_lines against compiled rules, no database."""
+
+    def setUp(self):
+        italia = CompiledZone('Italia', ['IT'], [], [
+            band(None, '14.90'), band('1', '4.90', '50.00'), band('5', '8.90', '50.00'),
+        ])
+        isole = CompiledZone('Isole', ['IT'], ['07', '09', '90'], [band('2', '12.00')])
+        self.rules = PricingRules(
+            [isole, italia],
+            {1: Decimal('22.00'), 2: Decimal('4.00')},
+            Decimal('22.00'),
+            CompiledZone('', [], [], [fallback_band()]),
+        )
+
+    def test_vat_rounded_per_rate(self):
+        quote = price_lines([
+            line('0.33', 3, vat_class_id=1, digital=True),
+            line('1.13', vat_class_id=2, digital=True),
+            line('0.10', 2, digital=True),
+            line('2.00', vat_class_id=2, digital=True, discount='0.87'),
+        ], rules=self.rules)
+
+        # 22% of 1.19 (not 3 x 0.07 + 2 x 0.02), 4% of 2.26
+        self.assertEqual(quote.vat, {
+            Decimal('4.00'): (Decimal('2.26'), Decimal('0.09')),
+            Decimal('22.00'): (Decimal('1.19'), Decimal('0.26')),
+        })
+        self.assertEqual(quote.tax, Decimal('0.35'))
+        self.assertEqual(quote.subtotal, Decimal('4.32'))
+        self.assertEqual(quote.discount, Decimal('0.87'))
+        self.assertEqual(quote.shipping, ZERO)
+        self.assertEqual(quote.total, Decimal('3.80'))
+        self.assertEqual(quote.zone, '')
+
+    def test_free_shipping_threshold(self):
+        self.assertEqual(price_lines([line('50.00', weight='0.5')], 'IT', rules=self.rules).shipping, ZERO)
+        self.assertEqual(price_lines([line('49.99', weight='0.5')], 'IT', rules=self.rules).shipping, Decimal('4.90'))
+        # The threshold looks at the discounted subtotal
+        quote = price_lines([line('55.00', weight='0.5', discount='5.01')], 'IT', rules=self.rules)
+        self.assertEqual(quote.shipping, Decimal('4.90'))
+
+    def test_band_selection(self):
+        def shipping(weight, country='IT', postal_code=''):
+            quote = price_lines([line('10.00', 2, weight=weight)], country, postal_code, rules=self.rules)
+            return quote.zone, quote.shipping
+
+        self.assertEqual(shipping('0.5'), ('Italia', Decimal('4.90')))
+        self.assertEqual(shipping('0.75'), ('Italia', Decimal('8.90')))
+        self.assertEqual(shipping('2.5'), ('Italia', Decimal('8.90')))
+        self.assertEqual(shipping('2.6'), ('Italia', Decimal('14.90')))
+        self.assertEqual(shipping('0.5', 'Italia', '09 100'), ('Isole', Decimal('12.00')))
+        # Heavier than every band of the zone: the heaviest band
+        self.assertEqual(shipping('3', 'IT', '90100'), ('Isole', Decimal('12.00')))
+        self.assertEqual(shipping('0.5', 'FR'), ('', Decimal('5.00')))
+
+
+class PricingFallbackTests(TestCase):
+    """Without shipping zones and VAT classes the PRICING_* settings apply."""
+
+    def setUp(self):
+        ShippingZone.objects.all().delete()
+        VatClass.objects.all().delete()
+
+    def test_fallback(self):
+        rules = build_rules()
+
+        quote = price_lines([line('10.00', 2, vat_class_id=99)], rules=rules)
+        self.assertEqual(quote.shipping, Decimal('5.00'))
+        self.assertEqual(quote.vat, {Decimal('22.00'): (Decimal('20.00'), Decimal('4.40'))})
+        self.assertEqual(quote.total, Decimal('29.40'))
+
+        quote = price_lines([line('25.00', 2)], 'DE', rules=rules)
+        self.assertEqual(quote.shipping, ZERO)
+        self.assertEqual(quote.total, Decimal('61.00'))
+
+
+class DiscountLinesTests(SimpleTestCase):
+    """discount_lines against a compiled index, no database."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.index = PromotionIndex([
+            CompiledPromotion(1, 'Bomboniere -10%', 'percent', Decimal('10'), category_ids=[7]),
+            CompiledPromotion(2, 'Confetti -2€', 'fixed', Decimal('2.00'), product_ids=[1]),
+            CompiledPromotion(3, 'Prendi 3 paghi 2', 'buy_x_get_y', ZERO, buy=2, get=1, product_ids=[2]),
+            CompiledPromotion(4, 'Finita', 'percent', Decimal('50'), ends_at=self.now),
+            CompiledPromotion(5, 'Sposi', 'percent', Decimal('15'), code='SPOSI', min_subtotal=Decimal('40.00')),
+            CompiledPromotion(6, 'Nastri', 'fixed', Decimal('1.00'), code='NASTRI', product_ids=[3]),
+        ])
+
+    def discounts(self, lines, code=''):
+        return discount_lines(lines, code, now=self.now, index=self.index)
+
+    def test_best_discount_per_line(self):
+        discounts = self.discounts([
+            (1, 7, Decimal('15.00'), 2),  # 10% = 3.00, 2€ per unit = 4.00
+            (1, 7, Decimal('30.00'), 1),  # 10% = 3.00, 2€ = 2.00
+            (9, 8, Decimal('10.00'), 1),  # Nothing running
+        ])
+        self.assertEqual(discounts.amounts, [Decimal('4.00'), Decimal('3.00'), ZERO])
+        self.assertEqual(discounts.applied, {'Confetti -2€': Decimal('4.00'), 'Bomboniere -10%': Decimal('3.00')})
+        self.assertEqual(discounts.total, Decimal('7.00'))
+
+    def test_buy_x_get_y(self):
+        amounts = self.discounts([(2, 8, Decimal('3.50'), quantity) for quantity in (2, 3, 5, 7)]).amounts
+        self.assertEqual(amounts, [ZERO, Decimal('3.50'), Decimal('3.50'), Decimal('7.00')])
+
+    def test_coupon(self):
+        lines = [(9, 8, Decimal('20.00'), 2)]
+        discounts = self.discounts(lines, ' sposi ')
+        self.assertEqual(discounts.amounts, [Decimal('6.00')])
+        self.assertEqual(discounts.coupon.code, 'SPOSI')
+        self.assertEqual(discounts.coupon_error, '')
+
+        discounts = self.discounts([(9, 8, Decimal('39.99'), 1)], 'SPOSI')
+        self.assertEqual(discounts.amounts, [ZERO])
+        self.assertIsNone(discounts.coupon)
+        self.assertEqual(discounts.coupon_error, 'Codice valido per ordini da almeno €40.00')
+
+        self.assertEqual(self.discounts(lines, 'ESTATE').coupon_error, 'Codice sconto non valido o scaduto')
+        self.assertEqual(
+            self.discounts(lines, 'NASTRI').coupon_error,
+            'Il codice sconto non si applica ai prodotti nel carrello'
+        )
+        self.assertEqual(
+            self.discounts([(3, 7, Decimal('20.00'), 1)], 'NASTRI').coupon_error,
+            'Le promozioni in corso sono già più convenienti del codice sconto'
+        )
+
+
+class PromotionIndexTests(TestCase):
+
+    def setUp(self):
+        self.tagged = Product.objects.create(title='Confetti', price='10.00', stock_count=5)
+        self.other = Product.objects.create(title='Scatola', price='10.00', stock_count=5)
+        self.tagged.tags.add('sposi')
+        self.other.tags.add('vuoto')
+
+    def test_tag_targets(self):
+        sposi = Promotion.objects.create(name='Sposi', value='10')
+        sposi.tags.set(self.tagged.tags.all())
+        vuoto = Promotion.objects.create(name='Tag senza prodotti', value='50')
+        vuoto.tags.set([self.other.tags.get()])
+        self.other.tags.clear()
+        Promotion.objects.create(name='Scaduta', value='50', ends_at=timezone.now() - timedelta(days=1))
+
+        index = build_index()
+
+        self.assertEqual(index.size, 2)
+        promotions = {promotion.name: promotion for promotion in index.catalog + index.by_product.get(None, [])}
+        # A tag without products must not widen the promotion to the whole catalog
+        self.assertEqual(index.catalog, [])
+        self.assertEqual(promotions['Tag senza prodotti'].product_ids, {None})
+        discounts = discount_lines(
+            [(self.tagged.pk, None, Decimal('10.00'), 1), (self.other.pk, None, Decimal('10.00'), 1)],
+            index=index,
+        )
+        self.assertEqual(discounts.amounts, [Decimal('1.00'), ZERO])
+
+
+class CouponCheckoutTests(TestCase):
+    """The usage limit of a coupon is claimed in the checkout transaction."""
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(title='Confetti', price='20.00', stock_count=10)
+        Promotion.objects.create(name='Sposi', code='sposi10', value='10', max_uses=2, uses=1)
+        promotion_index.invalidate()
+
+    def checkout(self, email):
+        user = get_user_model().objects.create_user(email, 'secret', first_name='Anna', last_name='Rossi')
+        cart = Cart.objects.create(user=user, coupon_code='SPOSI10')
+        product = Product.objects.get()
+        CartItem.objects.create(cart=cart, product=product, quantity=2, price=product.price)
+        client = Client()
+        client.force_login(user)
+        response = client.post(reverse('core:checkout-process'), {
+            'full_name': 'Anna Rossi',
+            'email': email,
+            'phone': '3331234567',
+            'shipping_address': 'Via Roma 1',
+            'shipping_city': 'Roma',
+            'shipping_state': 'RM',
+            'shipping_postal_code': '00100',
+            'payment_method': 'cash_on_delivery',
+        })
+        self.assertEqual(response.status_code, 302)
+        return Order.objects.filter(email=email).first()
+
+    def test_last_use_claimed_once(self):
+        self.assertFalse(Promotion.claim('ALTRO'))
+
+        first = self.checkout('prima@example.com')
+        second = self.checkout('seconda@example.com')
+
+        self.assertEqual(first.coupon_code, 'SPOSI10')
+        self.assertEqual(first.items.get().discount, Decimal('4.00'))
+        self.assertEqual(second.coupon_code, '')
+        self.assertEqual(second.items.get().discount, ZERO)
+        self.assertEqual(Promotion.objects.get().uses, 2)
+        self.assertFalse(Promotion.claim('SPOSI10'))
+
+    def test_failed_checkout_gives_the_use_back(self):
+        with mock.patch('core.views.OrderItem.objects.bulk_create', side_effect=DatabaseError):
+            self.assertIsNone(self.checkout('prima@example.com'))
+        self.assertEqual(Promotion.objects.get().uses, 1)
+
+
+class ProductRatingTests(TestCase):
+    """The review signals keep the rating columns equal to a full recompute."""
+
+    RATING_FIELDS = ('rating_count', 'rating_avg', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(f'cliente{n}@example.com', 'secret', first_name='Anna', last_name='Rossi')
+            for n in range(3)
+        ]
+        self.confetti = Product.objects.create(title='Confetti', price='9.90')
+        self.scatola = Product.objects.create(title='Scatola', price='4.50')
+
+    def ratings(self):
+        return {
+            row[0]: row[1:]
+            for row in Product.objects.order_by('pk').values_list('pk', *self.RATING_FIELDS)
+        }
+
+    def assertRatings(self, product, count, avg):
+        """Check the incremental columns of `product`, then that a full recompute agrees."""
+        incremental = self.ratings()
+        self.assertEqual(incremental[product.pk][:2], (count, Decimal(avg)))
+        Review.recompute_product_ratings()
+        self.assertEqual(self.ratings(), incremental)
+
+    def review(self, user, rating, is_approved=True, product=None):
+        return Review.objects.create(
+            user=user, product=product or self.confetti, rating=rating, title='Bello', comment='Molto bello',
+            is_approved=is_approved,
+        )
+
+    def test_review_lifecycle(self):
+        first = self.review(self.users[0], 5, is_approved=False)
+        self.assertRatings(self.confetti, 0, '0')
+
+        first.is_approved = True
+        first.save()
+        self.assertRatings(self.confetti, 1, '5.00')
+
+        second = self.review(self.users[1], 2)
+        self.review(self.users[2], 4)
+        self.assertRatings(self.confetti, 3, '3.67')
+
+        first.rating = 3
+        first.save(update_fields=['rating'])
+        self.assertRatings(self.confetti, 3, '3.00')
+
+        second.is_approved = False
+        second.save()
+        self.assertRatings(self.confetti, 2, '3.50')
+
+        # Saved from an instance that was not loaded: the previous values are queried
+        Review(
+            pk=first.pk, user=first.user, product=self.scatola, rating=3, title='Bello', comment='Molto bello',
+            is_approved=True, created_at=first.created_at,
+        ).save()
+        self.assertRatings(self.confetti, 1, '4.00')
+        self.assertRatings(self.scatola, 1, '3.00')
+
+        Review.objects.get(pk=first.pk).delete()
+        self.assertRatings(self.scatola, 0, '0')
+        second.delete()
+        self.assertRatings(self.confetti, 1, '4.00')
+
+
+class DirtyFieldsTests(TestCase):
+    """Saves of loaded instances write only the changed columns (core.tracking)."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'cliente@example.com', 'secret', first_name='Anna', last_name='Rossi'
+        )
+        order = Order.objects.create(
+            user=user, email=user.email, full_name='Anna Rossi', phone='3331234567',
+            shipping_address='Via Roma 1', shipping_city='Roma', shipping_state='RM', shipping_postal_code='00100',
+        )
+        Payment.objects.create(order=order, payment_method='bank_transfer', amount=Decimal('30.00'))
+        product = Product.objects.create(title='Confetti', price='9.90')
+        Review.objects.create(
+            user=user, product=product, rating=4, title='Bello', comment='Molto bello', is_approved=True
+        )
+
+    def updated_columns(self, instance):
+        """Save `instance` and return the columns set by its single UPDATE."""
+        with CaptureQueriesContext(connection) as queries:
+            instance.save()
+        self.assertEqual(len(queries), 1)
+        set_clause = queries[0]['sql'].split(' SET ', 1)[1].split(' WHERE ', 1)[0]
+        return set(re.findall(r'"(\w+)" =', set_clause))
+
+    def test_unchanged_save_runs_no_query(self):
+        payment = Payment.objects.get()
+        payment.payment_status = 'pending'
+        payment.payment_response = {}
+        with self.assertNumQueries(0):
+            payment.save()
+
+    def test_partial_save(self):
+        payment = Payment.objects.get()
+        payment.payment_status = 'processing'
+        self.assertEqual(self.updated_columns(payment), {'payment_status', 'updated_at'})
+
+        payment.payment_response['id'] = 'PAY-1'
+        self.assertEqual(self.updated_columns(payment), {'payment_response', 'updated_at'})
+        with self.assertNumQueries(0):
+            payment.save()
+        self.assertEqual(Payment.objects.get().payment_response, {'id': 'PAY-1'})
+
+    def test_deferred_field_assigned(self):
+        payment = Payment.objects.only('order').get()
+        payment.payment_status = 'processing'
+        payment.save()
+        self.assertEqual(Payment.objects.get().payment_status, 'processing')
+
+    def test_refresh_resets_snapshot(self):
+        payment = Payment.objects.get()
+        Payment.objects.update(payment_status='processing')
+        payment.refresh_from_db()
+        self.assertFalse(payment.is_dirty())
+
+        payment.payment_status = 'failed'
+        payment.transaction_id = 'TX-1'
+        payment.refresh_from_db(fields=['payment_status'])
+        self.assertEqual(payment.get_dirty_fields(), {'transaction_id': ''})
+
+    def test_receivers_use_loaded_values(self):
+        payment = Payment.objects.get()
+        payment.payment_status = 'processing'
+        # Not completed before nor after: only the UPDATE of the payment
+        with self.assertNumQueries(1):
+            payment.save()
+
+        review = Review.objects.get()
+        review.rating = 2
+        # The UPDATE of the review and the one of the product ratings
+        with CaptureQueriesContext(connection) as queries:
+            review.save()
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['UPDATE', 'UPDATE'])
+        self.assertEqual(Product.objects.values_list('rating_4', 'rating_2').get(), (0, 1))
+
+
+@override_settings(COOKIE_CART_ENABLED=True, COOKIE_CART_MAX_ITEMS=2)
+class CookieCartTests(TestCase):
+    """Guest carts kept in the signed cookie (core.cookie_cart)."""
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(title=f'Bomboniera {n}', price='9.90', stock_count=5, product_status='published')
+            for n in range(3)
+        ]
+
+    def test_tampered_or_expired_cookie_dropped(self):
+        value = signed_cookie(CookieCart({self.products[0].pk: [2, '9.90']}).serialize())
+        self.assertEqual(CookieCart.from_cookie(value).lines, {self.products[0].pk: [2, '9.90']})
+        # A price lowered in the cookie
+        self.assertEqual(CookieCart.from_cookie(value.replace('9.90', '0.01')).lines, {})
+        for payload in ('non json', '[1, 2]', '{"1": 3}', '{"x": [1, "9.90"]}'):
+            with self.subTest(payload=payload):
+                self.assertEqual(CookieCart.from_cookie(signed_cookie(payload)).lines, {})
+
+        with override_settings(COOKIE_CART_MAX_AGE=60):
+            with mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() - 120):
+                value = signed_cookie(CookieCart({self.products[0].pk: [2, '9.90']}).serialize())
+            self.assertEqual(CookieCart.from_cookie(value).lines, {})
+
+    def test_save_to_db_clamps_to_stock(self):
+        user = get_user_model().objects.create_user(
+            'cliente@example.com', 'secret', first_name='Anna', last_name='Rossi'
+        )
+        cart = Cart.objects.create(user=user)
+        summed, sold_out, new = self.products
+        CartItem.objects.create(cart=cart, product=summed, quantity=3, price=summed.price)
+        CartItem.objects.create(cart=cart, product=sold_out, quantity=2, price=sold_out.price)
+        Product.objects.filter(pk=sold_out.pk).update(stock_count=0)
+        missing = Product.objects.create(title='Esaurito', price='1.00', stock_count=0)
+        cookie_cart = CookieCart({
+            summed.pk: [3, '9.90'], sold_out.pk: [1, '9.90'], new.pk: [8, '9.90'], missing.pk: [1, '1.00'],
+        })
+
+        cookie_cart.save_to_db(cart)
+
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {summed.pk: 5, new.pk: 5})
+        self.assertEqual(cookie_cart.lines, {})
+
+    def test_cart_moves_to_the_database_when_full(self):
+        def add(product):
+            return self.client.post(reverse('core:add-to-cart', args=[product.pid]))
+
+        self.assertEqual(add(self.products[0]).json()['cart_total_items'], 1)
+        self.assertEqual(add(self.products[1]).json()['cart_total_items'], 2)
+        self.assertFalse(Cart.objects.exists())
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+        self.assertEqual(len(CookieCart.from_cookie(self.client.cookies[cookie_name()].value).lines), 2)
+
+        response = add(self.products[2])
+        self.assertEqual(response.json()['cart_total_items'], 3)
+        cart = Cart.objects.get()
+        self.assertEqual(cart.items.count(), 3)
+        self.assertEqual(self.client.session[CART_SESSION_KEY], cart.cart_id)
+        # The emptied cookie is deleted
+        self.assertEqual(response.cookies[cookie_name()].value, '')
+
+
+class NamespaceTests(SimpleTestCase):
+    """Two-tier cache (core.caching) over the local memory cache of the tests."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='valore', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_stampede_computes_once(self):
+        catalog = Namespace('catalog-test', timeout=60)
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            results.append(catalog.get_or_set('home', self.compute(delay=0.1)))
+
+        threads = [threading.Thread(target=worker) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['valore'] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(catalog.stats()['recomputes'], 1)
+
+    def test_waits_for_another_process(self):
+        catalog = Namespace('catalog-test', timeout=60)
+        # The lock key of another process computing the value
+        cache.add(f"{catalog.make_key('home')}:lock", 1)
+        threading.Timer(0.1, catalog.set, ['home', 'dall\'altro processo']).start()
+
+        self.assertEqual(catalog.get_or_set('home', self.compute()), "dall'altro processo")
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(catalog.stats()['waits'], 1)
+
+        # The other process died: computed here once the wait is over
+        cache.add(f"{catalog.make_key('menu')}:lock", 1)
+        with mock.patch('core.caching.LOCK_WAIT', 0.1):
+            self.assertEqual(catalog.get_or_set('menu', self.compute()), 'valore')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_while_revalidate(self):
+        catalog = Namespace('catalog-test', timeout=10, stale=60)
+        catalog.get_or_set('home', self.compute('vecchio'))
+        lock_key = f"{catalog.make_key('home')}:lock"
+
+        with mock.patch('core.caching.time.time', return_value=time.time() + 30):
+            # Being recomputed elsewhere: the expired value is served meanwhile
+            cache.add(lock_key, 1)
+            self.assertEqual(catalog.get_or_set('home', self.compute('nuovo')), 'vecchio')
+            self.assertEqual(self.calls, 1)
+            cache.delete(lock_key)
+
+            self.assertEqual(catalog.get_or_set('home', self.compute('nuovo')), 'nuovo')
+            self.assertEqual(self.calls, 2)
+            self.assertEqual(catalog.get_or_set('home', self.compute('ancora')), 'nuovo')
+        self.assertEqual(catalog.stats()['stale_hits'], 2)
+
+    def test_invalidate_bumps_the_version(self):
+        local_cache = LocalCache()
+        catalog = Namespace('catalog-test', timeout=60, local_timeout=60, local_cache=local_cache)
+        # The same namespace in another process
+        other = Namespace('catalog-test', timeout=60)
+        other.version_check_interval = 0
+
+        catalog.set('home', 'pagina')
+        self.assertEqual(other.get('home'), 'pagina')
+        version = catalog.version()
+
+        catalog.invalidate()
+        self.assertNotEqual(catalog.version(), version)
+        self.assertIsNone(catalog.get('home'))
+        self.assertIsNone(other.get('home'))
+        self.assertEqual(local_cache.entries, {})
+
+    def test_versioned_table(self):
+        table = VersionedTable('table-test', self.compute())
+        other = VersionedTable('table-test', self.compute())
+        other.version_check_interval = 0
+
+        self.assertEqual((table.get(), table.get(), other.get()), ('valore', 'valore', 'valore'))
+        self.assertEqual(self.calls, 2)
+        table.invalidate()
+        self.assertEqual((table.get(), other.get()), ('valore', 'valore'))
+        self.assertEqual((table.builds, other.builds), (2, 2))
+
+
+class CompressionTests(TestCase):
+    """Compression of dynamic responses (core.compression, CompressionMiddleware)."""
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.bulk_create([
+            Product(
+                title=f'Bomboniera {n}', pid=f'bom{n}', sku=f'BOM-{n}', price='9.90', stock_count=5,
+                product_status='published',
+            )
+            for n in range(20)
+        ])
+
+    def test_choose_encoding(self):
+        with mock.patch('core.compression.supported_encodings', return_value=['br', 'gzip']):
+            for accept_encoding, encoding in (
+                ('gzip, deflate, br', 'br'),
+                ('br;q=0.5, gzip', 'gzip'),
+                ('gzip;q=0.5, br;q=0.5', 'br'),
+                ('br;q=0, gzip;q=0', None),
+                ('*', 'br'),
+                ('*;q=0.1, gzip;q=0.5', 'gzip'),
+                ('br;q=abc, gzip;q=0.1', 'gzip'),
+                ('identity', None),
+                ('', None),
+            ):
+                with self.subTest(accept_encoding=accept_encoding):
+                    self.assertEqual(compression.choose_encoding(accept_encoding), encoding)
+
+        with mock.patch('core.compression.supported_encodings', return_value=['gzip']):
+            self.assertIsNone(compression.choose_encoding('br'))
+            self.assertEqual(compression.choose_encoding('br, gzip;q=0.1'), 'gzip')
+
+    def test_gzip_response_weakens_the_etag(self):
+        url = reverse('api:product-list')
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertGreater(len(plain.content), 1024)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        # The weak ETag still revalidates
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_responses_left_alone(self):
+        response = self.client.get(reverse('api:category-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_stream(self):
+        chunks = [b'<li>Bomboniera</li>' * 50, b'', b'<li>Confetti</li>' * 50]
+        data = b''.join(compression.compress_stream(chunks, 'gzip'))
+        self.assertEqual(gzip.decompress(data), b''.join(chunks))
+        # Random file name in the header (BREACH mitigation)
+        self.assertTrue(data[3] & gzip.FNAME)
+
+    @skipUnless(compression.brotli, 'Needs the brotli package')
+    @override_settings(COMPRESSION_BROTLI_DYNAMIC=True)
+    def test_brotli_response(self):
+        url = reverse('api:product-list')
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
@@ -0,0 +1,97 @@
+"""
+Dirty-field tracking for models.
+
+DirtyFieldsMixin keeps the field values an instance had when it was loaded
+(or last saved). Saving a loaded instance writes only the changed columns
+with `update_fields`, plus the auto_now ones, and does nothing at all,
+signals included, when no field changed. New instances and explicit
+`update_fields` saves are left to Django.
+
+Signals can read the previous values with `loaded_values()` instead of
+querying the row again.
+"""
+
+import copy
+
+from django.db.models import DEFERRED
+from django.db.models.fields.files import FieldFile
+
+
+class DirtyFieldsMixin:
+    """Mixin for models: save only what changed since the instance was loaded."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _tracked_value(self, field):
+        value = getattr(self, field.attname)
+        if isinstance(value, FieldFile):
+            return value.name
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
+
+    def _take_snapshot(self, names=None):
+        """Record the current values of the loaded fields (only `names` if given)."""
+        fields = [
+            field for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        ]
+        if names is not None:
+            names = set(names)
+            fields = [field for field in fields if field.name in names or field.attname in names]
+        else:
+            self._loaded_values = {}
+        snapshot = self.__dict__.setdefault('_loaded_values', {})
+        for field in fields:
+            snapshot[field.attname] = self._tracked_value(field)
+
+    def loaded_values(self):
+        """Field values (by attname) as loaded or last saved, None for a new instance."""
+        if self._state.adding:
+            return None
+        return getattr(self, '_loaded_values', None)
+
+    def get_dirty_fields(self):
+        """
+        Changed fields as {attname: loaded value}, None if the instance is not
+        tracked. Deferred fields that were assigned are changed, with DEFERRED.
+        """
+        loaded = self.loaded_values()
+        if loaded is None:
+            return None
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in loaded:
+                if self._tracked_value(field) != loaded[field.attname]:
+                    dirty[field.attname] = loaded[field.attname]
+            elif not field.primary_key and field.attname in self.__dict__:
+                dirty[field.attname] = DEFERRED
+        return dirty
+
+    def is_dirty(self):
+        return self.get_dirty_fields() != {}
+
+    def save(self, *args, **kwargs):
+        dirty = self.get_dirty_fields()
+        if dirty is None or args or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+            super().save(*args, **kwargs)
+            self._take_snapshot(kwargs.get('update_fields'))
+            return
+
+        if not dirty:
+            return
+
+        update_fields = set(dirty) | {
+            field.attname for field in self._meta.concrete_fields
+            if getattr(field, 'auto_now', False)
+        }
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._take_snapshot()
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._take_snapshot(fields)
@@ -19,6 +19,9 @@ urlpatterns = [
     path('cart/update/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove-from-cart'),
     path('cart/clear/', views.clear_cart, name='clear-cart'),
+    path('cart/summary/', views.cart_summary, name='cart-summary'),
+    path('cart/coupon/', views.apply_coupon, name='apply-coupon'),
+    path('cart/coupon/remove/', views.remove_coupon, name='remove-coupon'),
     
     # Checkout URLs
     path('checkout/', views.checkout_view, name='checkout'),
@@ -33,6 +36,9 @@ urlpatterns = [
     path('wishlist/add/<str:pid>/', views.add_to_wishlist, name='add-to-wishlist'),
     path('wishlist/remove/<str:pid>/', views.remove_from_wishlist, name='remove-from-wishlist'),
 
+    # Staff URLs
+    path('staff/queries/', views.query_report_view, name='query-report'),
+
     # Payment URLs - PayPal
     path('payment/paypal/<str:order_id>/', views.paypal_checkout, name='paypal-checkout'),
     path('payment/paypal/execute/<str:order_id>/', views.paypal_execute, name='paypal-execute'),
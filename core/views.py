@@ -2,18 +2,27 @@
 Views for core app.
 """
 
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.views.generic import TemplateView, ListView, DetailView
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
+from django.views.decorators.cache import never_cache
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
 from django.db.models import Q
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 from products.models import Category, Product
-from .models import Cart, CartItem, Order, OrderItem, Payment, Wishlist, Review
+from .models import Cart, CartItem, CoPurchase, Order, OrderItem, Payment, Promotion, Wishlist, Review, CART_SESSION_KEY
+from .caching import cache_stats, reset_cache_stats
+from .context_processors import cart_context
+from .cookie_cart import CookieCart, auses_cookie_cart, uses_cookie_cart
+from .instrumentation import get_endpoint_stats, pool_stats, reset_stats
+from .promotions import discount_items, normalize_code, promotion_index
 from decimal import Decimal
 import json
 
@@ -26,7 +35,7 @@ class HomeView(TemplateView):
         context = super().get_context_data(**kwargs)
         context['page_title'] = 'Home'
         # Get main categories for homepage
-        context['categories'] = Category.objects.all()[:4]
+        context['categories'] = Category.cached_list()[:4]
         # Get 4 random products for carousel
         context['featured_products'] = Product.objects.filter(
             status=True,
@@ -63,7 +72,11 @@ class ContactView(TemplateView):
 def get_or_create_cart(request):
     """
     Get or create cart for user or session.
+    With COOKIE_CART_ENABLED a guest gets the cookie cart instead.
     """
+    if uses_cookie_cart(request):
+        return CookieCart.from_request(request)
+    
     if request.user.is_authenticated:
         cart, created = Cart.objects.get_or_create(user=request.user)
     else:
@@ -74,32 +87,80 @@ def get_or_create_cart(request):
             session_key = request.session.session_key
         
         cart, created = Cart.objects.get_or_create(session_key=session_key)
+        
+        # Remember the cart id so it can be merged into the user cart on login
+        if request.session.get(CART_SESSION_KEY) != cart.cart_id:
+            request.session[CART_SESSION_KEY] = cart.cart_id
     
     return cart
 
 
+async def aget_or_create_cart(request, user):
+    """
+    get_or_create_cart for the async views, with the async ORM and session API.
+    `user` is the result of request.auser().
+    """
+    if await auses_cookie_cart(request, user):
+        return CookieCart.from_request(request)
+    
+    if user.is_authenticated:
+        cart, created = await Cart.objects.aget_or_create(user=user)
+    else:
+        session_key = request.session.session_key
+        if not session_key:
+            await request.session.acreate()
+            session_key = request.session.session_key
+        
+        cart, created = await Cart.objects.aget_or_create(session_key=session_key)
+        
+        if await request.session.aget(CART_SESSION_KEY) != cart.cart_id:
+            await request.session.aset(CART_SESSION_KEY, cart.cart_id)
+    
+    return cart
+
+
+async def aget_cart_item(cart, item_id):
+    """Get an item of the cart, with its product, or raise Http404."""
+    if isinstance(cart, CookieCart):
+        cart_item = await cart.aget_item(item_id)
+        if cart_item is None:
+            raise Http404('Prodotto non presente nel carrello')
+        return cart_item
+    return await aget_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart=cart)
+
+
 def cart_view(request):
     """
     Display shopping cart.
     """
     cart = get_or_create_cart(request)
+    cart_items = list(cart.items.select_related('product').all())
     
+    # Frequently bought together with the cart products (fills the cart_items cache)
+    product_ids = [item.product_id for item in cart_items]
+    suggested_products = CoPurchase.suggestions(product_ids) if product_ids else []
+    
+    discounts = cart.get_discounts(cart_items)
     context = {
         'page_title': 'Carrello',
         'cart': cart,
-        'cart_items': cart.items.select_related('product').all(),
+        'cart_items': cart_items,
+        'cart_quote': cart.get_quote(cart_items),
+        'coupon_error': discounts.coupon_error,
+        'suggested_products': suggested_products,
     }
     
     return render(request, 'core/cart.html', context)
 
 
 @require_POST
-def add_to_cart(request, pid):
+async def add_to_cart(request, pid):
     """
     Add product to cart (AJAX).
+    Async view: under ASGI (SERVER_MODE=asgi) it does not hold a worker while waiting for the database.
     """
     try:
-        product = get_object_or_404(Product, pid=pid)
+        product = await aget_object_or_404(Product, pid=pid)
         
         # Check if product is available
         if not product.in_stock or product.product_status != 'published':
@@ -119,14 +180,20 @@ def add_to_cart(request, pid):
             }, status=400)
         
         # Get or create cart
-        cart = get_or_create_cart(request)
+        cart = await aget_or_create_cart(request, await request.auser())
+        if isinstance(cart, CookieCart) and cart.is_full(product):
+            # Too many lines for the cookie: continue with a database cart
+            cart = await sync_to_async(cart.promote)(request)
         
         # Add or update cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'price': product.price, 'quantity': quantity}
-        )
+        if isinstance(cart, CookieCart):
+            cart_item, created = await cart.aget_or_create_item(product, quantity, product.price)
+        else:
+            cart_item, created = await CartItem.objects.aget_or_create(
+                cart=cart,
+                product=product,
+                defaults={'price': product.price, 'quantity': quantity}
+            )
         
         if not created:
             # Update quantity if item already exists
@@ -137,13 +204,14 @@ def add_to_cart(request, pid):
                     'message': f'Disponibili solo {product.stock_count} unità'
                 }, status=400)
             cart_item.quantity = new_quantity
-            cart_item.save()
+            await cart_item.asave()
         
+        summary = await cart.asummary()
         return JsonResponse({
             'success': True,
             'message': 'Prodotto aggiunto al carrello',
-            'cart_total_items': cart.get_total_items(),
-            'cart_total': float(cart.get_total())
+            'cart_total_items': summary['cart_total_items'],
+            'cart_total': summary['cart_total']
         })
         
     except Exception as e:
@@ -154,18 +222,18 @@ def add_to_cart(request, pid):
 
 
 @require_POST
-def update_cart_item(request, item_id):
+async def update_cart_item(request, item_id):
     """
     Update cart item quantity (AJAX).
     """
     try:
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart = await aget_or_create_cart(request, await request.auser())
+        cart_item = await aget_cart_item(cart, item_id)
         
         quantity = int(request.POST.get('quantity', 1))
         
         if quantity <= 0:
-            cart_item.delete()
+            await cart_item.adelete()
             message = 'Prodotto rimosso dal carrello'
         else:
             # Check stock
@@ -176,17 +244,13 @@ def update_cart_item(request, item_id):
                 }, status=400)
             
             cart_item.quantity = quantity
-            cart_item.save()
+            await cart_item.asave()
             message = 'Quantità aggiornata'
         
         return JsonResponse({
             'success': True,
             'message': message,
-            'cart_total_items': cart.get_total_items(),
-            'cart_subtotal': float(cart.get_subtotal()),
-            'cart_shipping': float(cart.get_shipping_cost()),
-            'cart_tax': float(cart.get_tax()),
-            'cart_total': float(cart.get_total()),
+            **await cart.asummary(),
             'item_total': float(cart_item.get_total()) if quantity > 0 else 0
         })
         
@@ -198,23 +262,19 @@ def update_cart_item(request, item_id):
 
 
 @require_POST
-def remove_from_cart(request, item_id):
+async def remove_from_cart(request, item_id):
     """
     Remove item from cart (AJAX).
     """
     try:
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        cart_item.delete()
+        cart = await aget_or_create_cart(request, await request.auser())
+        cart_item = await aget_cart_item(cart, item_id)
+        await cart_item.adelete()
         
         return JsonResponse({
             'success': True,
             'message': 'Prodotto rimosso dal carrello',
-            'cart_total_items': cart.get_total_items(),
-            'cart_subtotal': float(cart.get_subtotal()),
-            'cart_shipping': float(cart.get_shipping_cost()),
-            'cart_tax': float(cart.get_tax()),
-            'cart_total': float(cart.get_total())
+            **await cart.asummary()
         })
         
     except Exception as e:
@@ -224,6 +284,67 @@ def remove_from_cart(request, item_id):
         }, status=500)
 
 
+@never_cache
+def cart_summary(request):
+    """
+    Cart badge and wishlist flags for the current visitor (AJAX).
+    Used by pages served from the edge cache, which carry no per-user data.
+    Optional `pids` parameter: comma separated product ids to check in the wishlist.
+    """
+    summary = cart_context(request)
+    
+    wishlist = []
+    pids = [pid for pid in request.GET.get('pids', '').split(',') if pid]
+    if pids and request.user.is_authenticated:
+        wishlist = list(Wishlist.objects.filter(
+            user=request.user,
+            product__pid__in=pids
+        ).values_list('product__pid', flat=True))
+    
+    return JsonResponse({
+        'success': True,
+        'is_authenticated': request.user.is_authenticated,
+        'cart_total_items': summary['cart_total_items'],
+        'wishlist': wishlist,
+    })
+
+
+@require_POST
+def apply_coupon(request):
+    """
+    Enter a coupon code on the cart.
+    A cookie cart is moved to the database first, the code is kept on the Cart.
+    """
+    code = normalize_code(request.POST.get('code'))
+    if not code or promotion_index.get().coupon(code) is None:
+        messages.error(request, 'Codice sconto non valido o scaduto')
+        return redirect('core:cart')
+    
+    cart = get_or_create_cart(request)
+    if isinstance(cart, CookieCart):
+        cart = cart.promote(request)
+    cart.coupon_code = code
+    cart.save(update_fields=['coupon_code', 'updated_at'])
+    
+    discounts = cart.get_discounts(cart.items.select_related('product'))
+    if discounts.coupon_error:
+        messages.warning(request, discounts.coupon_error)
+    else:
+        messages.success(request, f'Codice sconto {code} applicato')
+    return redirect('core:cart')
+
+
+@require_POST
+def remove_coupon(request):
+    """Remove the coupon code from the cart."""
+    cart = get_or_create_cart(request)
+    if cart.coupon_code:
+        cart.coupon_code = ''
+        cart.save(update_fields=['coupon_code', 'updated_at'])
+        messages.success(request, 'Codice sconto rimosso')
+    return redirect('core:cart')
+
+
 def clear_cart(request):
     """
     Clear all items from cart.
@@ -254,10 +375,12 @@ def checkout_view(request):
     if request.user.is_authenticated:
         addresses = request.user.addresses.filter(is_active=True)
     
+    cart_items = list(cart.items.select_related('product').all())
     context = {
         'page_title': 'Checkout',
         'cart': cart,
-        'cart_items': cart.items.select_related('product').all(),
+        'cart_items': cart_items,
+        'cart_quote': cart.get_quote(cart_items),
         'addresses': addresses,
     }
     
@@ -329,7 +452,8 @@ def process_checkout(request):
     try:
         # 1. Get cart
         cart = get_or_create_cart(request)
-        if not cart.items.exists():
+        cart_items = list(cart.items.select_related('product'))
+        if not cart_items:
             messages.error(request, 'Il carrello è vuoto.')
             return redirect('core:cart')
 
@@ -341,6 +465,7 @@ def process_checkout(request):
         shipping_city = request.POST.get('shipping_city')
         shipping_state = request.POST.get('shipping_state')
         shipping_postal_code = request.POST.get('shipping_postal_code')
+        shipping_country = request.POST.get('shipping_country') or 'Italia'
         payment_method = request.POST.get('payment_method')
         order_notes = request.POST.get('order_notes', '')
 
@@ -356,55 +481,73 @@ def process_checkout(request):
             messages.error(request, 'Compila tutti i campi obbligatori.')
             return redirect('core:checkout')
 
-        # 4. Create Order
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            email=email,
-            full_name=full_name,
-            phone=phone,
-            shipping_address=shipping_address,
-            shipping_city=shipping_city,
-            shipping_state=shipping_state,
-            shipping_postal_code=shipping_postal_code,
-            billing_address=billing_address or shipping_address,
-            billing_city=billing_city or shipping_city,
-            billing_state=billing_state or shipping_state,
-            billing_postal_code=billing_postal_code or shipping_postal_code,
-            order_notes=order_notes,
-        )
+        # 4-8 in one transaction: a failure gives the coupon use back
+        with transaction.atomic():
+            # 4. Promotions of the cart; a coupon out of uses is dropped
+            discounts = cart.get_discounts(cart_items)
+            coupon_code = discounts.coupon.code if discounts.coupon is not None else ''
+            if coupon_code and not Promotion.claim(coupon_code):
+                messages.warning(request, f'Il codice sconto {coupon_code} non è più disponibile.')
+                coupon_code = ''
+                discounts = discount_items(cart_items)
+
+            # 5. Create Order
+            order = Order.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                email=email,
+                full_name=full_name,
+                phone=phone,
+                shipping_address=shipping_address,
+                shipping_city=shipping_city,
+                shipping_state=shipping_state,
+                shipping_postal_code=shipping_postal_code,
+                shipping_country=shipping_country,
+                billing_address=billing_address or shipping_address,
+                billing_city=billing_city or shipping_city,
+                billing_state=billing_state or shipping_state,
+                billing_postal_code=billing_postal_code or shipping_postal_code,
+                order_notes=order_notes,
+                coupon_code=coupon_code,
+            )
 
-        # 5. Create OrderItems from CartItems
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
+            # 6. Create OrderItems from CartItems, with their discounts
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=cart_item.product,
+                    product_title=cart_item.product.title,
+                    product_sku=cart_item.product.sku,
+                    quantity=cart_item.quantity,
+                    price=cart_item.price,
+                    discount=discount,
+                )
+                for cart_item, discount in zip(cart_items, discounts.amounts)
+            ])
+
+            # 7. Calculate order totals
+            order.calculate_totals()
+
+            # 8. Create Payment record
+            payment = Payment.objects.create(
                 order=order,
-                product=cart_item.product,
-                product_title=cart_item.product.title,
-                product_sku=cart_item.product.sku,
-                quantity=cart_item.quantity,
-                price=cart_item.price,
+                payment_method=payment_method,
+                amount=order.total,
+                payment_status='pending',
             )
 
-        # 6. Calculate order totals
-        order.calculate_totals()
-
-        # 7. Create Payment record
-        payment = Payment.objects.create(
-            order=order,
-            payment_method=payment_method,
-            amount=order.total,
-            payment_status='pending',
-        )
-
-        # 8. Send confirmation emails
+        # 9. Send confirmation emails
         email_sent = send_order_confirmation_emails(order, request)
         if not email_sent:
             # Don't fail checkout, just log it
             messages.warning(request, 'Ordine creato, ma c\'è stato un problema con l\'invio dell\'email di conferma.')
 
-        # 9. Clear cart
+        # 10. Clear cart
         cart.clear()
+        if cart.coupon_code:
+            cart.coupon_code = ''
+            cart.save(update_fields=['coupon_code', 'updated_at'])
 
-        # 10. Redirect based on payment method
+        # 11. Redirect based on payment method
         if payment_method == 'paypal':
             # Redirect to PayPal checkout
             return redirect('core:paypal-checkout', order_id=order.order_id)
@@ -430,7 +573,7 @@ def order_list_view(request):
     """
     Display user's orders.
     """
-    orders = Order.objects.filter(user=request.user).prefetch_related('items')
+    orders = Order.objects.filter(user=request.user)
     
     context = {
         'page_title': 'I Miei Ordini',
@@ -489,15 +632,15 @@ def wishlist_view(request):
 
 @login_required
 @require_POST
-def add_to_wishlist(request, pid):
+async def add_to_wishlist(request, pid):
     """
     Add product to wishlist (AJAX).
     """
     try:
-        product = get_object_or_404(Product, pid=pid)
+        product = await aget_object_or_404(Product, pid=pid)
         
-        wishlist_item, created = Wishlist.objects.get_or_create(
-            user=request.user,
+        wishlist_item, created = await Wishlist.objects.aget_or_create(
+            user=await request.auser(),
             product=product
         )
         
@@ -521,13 +664,13 @@ def add_to_wishlist(request, pid):
 
 @login_required
 @require_POST
-def remove_from_wishlist(request, pid):
+async def remove_from_wishlist(request, pid):
     """
     Remove product from wishlist (AJAX).
     """
     try:
-        product = get_object_or_404(Product, pid=pid)
-        Wishlist.objects.filter(user=request.user, product=product).delete()
+        product = await aget_object_or_404(Product, pid=pid)
+        await Wishlist.objects.filter(user=await request.auser(), product=product).adelete()
         
         return JsonResponse({
             'success': True,
@@ -540,6 +683,34 @@ def remove_from_wishlist(request, pid):
             'message': str(e)
         }, status=500)
 
+# ============================================================================
+# STAFF VIEWS
+# ============================================================================
+
+@staff_member_required
+def query_report_view(request):
+    """
+    Query statistics per endpoint, worst first, cache and connection pool counters of this process.
+    Only accessible to staff members
+    """
+    if request.method == 'POST':
+        reset_stats()
+        reset_cache_stats()
+        messages.success(request, 'Statistiche query azzerate')
+        return redirect('core:query-report')
+    
+    context = {
+        'page_title': 'Report Query',
+        'endpoints': get_endpoint_stats(),
+        'cache_stats': cache_stats(),
+        'pool_stats': pool_stats(),
+        'budgets': settings.QUERY_BUDGETS,
+        'default_budget': settings.QUERY_BUDGET_DEFAULT,
+    }
+    
+    return render(request, 'core/query_report.html', context)
+
+
 # ============================================================================
 # PAYMENT INTEGRATION VIEWS
 # ============================================================================
@@ -592,6 +763,13 @@ def paypal_checkout(request, order_id):
                         "price": str(item.price),
                         "currency": "EUR",
                         "quantity": item.quantity
+                    } if not item.discount else {
+                        # Discounted line as a single item, its total after the discount
+                        "name": f"{item.quantity}x {item.product_title}",
+                        "sku": item.product_sku or "N/A",
+                        "price": str(item.get_total()),
+                        "currency": "EUR",
+                        "quantity": 1
                     }
                     for item in order.items.all()
                 ]
@@ -600,7 +778,7 @@ def paypal_checkout(request, order_id):
                 "total": str(order.total),
                 "currency": "EUR",
                 "details": {
-                    "subtotal": str(order.subtotal),
+                    "subtotal": str(order.subtotal - order.discount),
                     "tax": str(order.tax),
                     "shipping": str(order.shipping_cost)
                 }
@@ -675,15 +853,20 @@ def stripe_checkout(request, order_id):
         # Create line items for Stripe
         line_items = []
         for item in order.items.all():
+            if item.discount:
+                # Discounted line as a single item, its total after the discount
+                name, unit_amount, quantity = f'{item.quantity}x {item.product_title}', item.get_total(), 1
+            else:
+                name, unit_amount, quantity = item.product_title, item.price, item.quantity
             line_items.append({
                 'price_data': {
                     'currency': 'eur',
                     'product_data': {
-                        'name': item.product_title,
+                        'name': name,
                     },
-                    'unit_amount': int(item.price * 100),  # Stripe uses cents
+                    'unit_amount': int(unit_amount * 100),  # Stripe uses cents
                 },
-                'quantity': item.quantity,
+                'quantity': quantity,
             })
 
         # Add shipping as a line item if > 0
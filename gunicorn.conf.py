@@ -0,0 +1,23 @@
+"""
+Gunicorn configuration, picked by SERVER_MODE (see sisi3/settings.py).
+
+    SERVER_MODE=wsgi (default): sync workers serving sisi3.wsgi,
+        WEB_THREADS threads each (gthread workers when more than one)
+    SERVER_MODE=asgi: uvicorn workers serving sisi3.asgi
+
+Workers come from WEB_CONCURRENCY and the port from PORT, as on Heroku.
+The database pool of each worker is sized on the same variables
+(sisi3/database.py).
+"""
+
+import os
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'sisi3.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'sisi3.wsgi:application'
+    worker_class = 'sync'
+    threads = int(os.environ.get('WEB_THREADS', 1))
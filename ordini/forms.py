@@ -260,6 +260,46 @@ class OrderFilterForm(forms.Form):
     )
 
 
+class SalesReportForm(forms.Form):
+    """
+    Form per l'intervallo di date del report vendite.
+    """
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'form-control',
+            'type': 'date',
+        }),
+        label='Da Data'
+    )
+
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'form-control',
+            'type': 'date',
+        }),
+        label='A Data'
+    )
+
+    status = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Tutti gli stati')] + list(ORDER_STATUS),
+        widget=forms.Select(attrs={
+            'class': 'form-select',
+        }),
+        label='Stato Ordine'
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('La data iniziale è successiva a quella finale.')
+        return cleaned_data
+
+
 class BulkOrderActionForm(forms.Form):
     """
     Form per azioni in blocco sugli ordini.
@@ -0,0 +1,46 @@
+"""
+Ricalcola i riepiloghi vendite di un intervallo di date (tutta la storia
+se non indicato), a blocchi di giorni elaborati in parallelo.
+
+Esempio:
+    python manage.py backfill_sales_rollups --from 2024-01-01 --to 2024-12-31 --workers 8
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core.models import Order
+from ordini.rollups import MAX_RANGE_DAYS, backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups of a date range in parallel chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first_day', type=date.fromisoformat, help='YYYY-MM-DD')
+        parser.add_argument('--to', dest='last_day', type=date.fromisoformat, help='YYYY-MM-DD')
+        parser.add_argument('--chunk-days', type=int, default=MAX_RANGE_DAYS)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None and not (options['first_day'] and options['last_day']):
+            self.stdout.write('Nessun ordine')
+            return
+
+        first_day = options['first_day'] or timezone.localdate(bounds['first'])
+        last_day = options['last_day'] or timezone.localdate(bounds['last'])
+        if first_day > last_day:
+            raise CommandError('La data iniziale è successiva a quella finale')
+
+        rows = backfill(
+            first_day,
+            last_day,
+            chunk_days=options['chunk_days'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Riepiloghi ricalcolati dal {first_day} al {last_day}: {rows} righe"))
@@ -0,0 +1,24 @@
+"""
+Aggiorna i riepiloghi vendite dei giorni con ordini o pagamenti modificati
+dall'ultima esecuzione (da pianificare, ad es. ogni 15 minuti).
+
+Esempio:
+    python manage.py update_sales_rollups
+"""
+
+from django.core.management.base import BaseCommand
+
+from ordini.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Incremental update of the daily sales rollups'
+
+    def handle(self, *args, **options):
+        days = update_rollups()
+        if days:
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(days)} giorni ricalcolati ({days[0]} - {days[-1]})"
+            ))
+        else:
+            self.stdout.write('Nessun giorno da ricalcolare')
@@ -1,7 +1,8 @@
 from django.db import models
 from django.conf import settings
 from core.models import Order, OrderItem
-from products.models import Product
+from core.tracking import DirtyFieldsMixin
+from products.models import Product, Category
 
 
 class DeliveryNote(models.Model):
@@ -84,7 +85,7 @@ class StockMovement(models.Model):
         return f"{self.get_movement_type_display()} - {self.product.title} ({self.quantity})"
 
 
-class OrderProcessing(models.Model):
+class OrderProcessing(DirtyFieldsMixin, models.Model):
     """
     Traccia il processo di preparazione dell'ordine.
     """
@@ -171,3 +172,74 @@ class OrderItemVerification(models.Model):
 
     def __str__(self):
         return f"Verifica {self.order_item.product_title} - {'✓' if self.verified else '✗'}"
+
+
+class DailySales(models.Model):
+    """
+    Riepilogo vendite giornaliero per metodo di pagamento e stato ordine.
+    Aggiornato da `update_sales_rollups`, letto dalla pagina report.
+    """
+    day = models.DateField()
+    payment_method = models.CharField(max_length=20, blank=True, help_text="Vuoto se l'ordine non ha pagamento")
+    order_status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Subtotale articoli")
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Vendite Giornaliere"
+        verbose_name_plural = "Vendite Giornaliere"
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_method', 'order_status'], name='unique_daily_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_method or '-'} {self.order_status}: {self.revenue}€"
+
+
+class DailyCategorySales(models.Model):
+    """
+    Riepilogo vendite giornaliero per categoria, metodo di pagamento e stato ordine.
+    Tasse e spedizione sono ripartite sulle categorie in proporzione al subtotale;
+    un ordine con articoli di più categorie è contato in ognuna.
+    """
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    payment_method = models.CharField(max_length=20, blank=True)
+    order_status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Vendite Giornaliere per Categoria"
+        verbose_name_plural = "Vendite Giornaliere per Categoria"
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category or '-'}: {self.revenue}€"
+
+
+class RollupWatermark(models.Model):
+    """
+    Ultimo aggiornamento dei riepiloghi: i giorni con ordini o pagamenti
+    modificati dopo `watermark` vengono ricalcolati.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    watermark = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Watermark Riepiloghi"
+        verbose_name_plural = "Watermark Riepiloghi"
+
+    def __str__(self):
+        return f"{self.name}: {self.watermark}"
@@ -15,6 +15,8 @@ urlpatterns = [
 
     # Verifica Articoli
     path('verify-item/<int:item_id>/', views.verify_order_item, name='verify-item'),
+    path('scan/', views.scan_code, name='scan'),
+    path('scan/<str:order_id>/', views.scan_code, name='scan-order'),
 
     # Bolla di Consegna
     path('create-delivery-note/<str:order_id>/', views.create_delivery_note, name='create-delivery-note'),
@@ -24,6 +26,9 @@ urlpatterns = [
     # Note
     path('add-note/<str:order_id>/', views.add_order_note, name='add-note'),
 
+    # Report
+    path('reports/sales/', views.sales_report, name='sales-report'),
+
     # Magazzino
     path('stock-movements/', views.stock_movements, name='stock-movements'),
 ]
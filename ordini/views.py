@@ -1,21 +1,28 @@
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
 from django.utils import timezone
 from django.db.models import Q, Count, Sum
 from django.views.decorators.http import require_POST
 
 from core.models import Order, OrderItem
 from products.models import Product
+from products.barcodes import lookup as barcode_lookup, InvalidBarcode
 from .models import (
     DeliveryNote, StockMovement, OrderProcessing,
-    OrderNote, OrderItemVerification
+    OrderNote, OrderItemVerification,
+    DailySales, DailyCategorySales, RollupWatermark
 )
 from .forms import (
     OrderProcessingForm, OrderStatusUpdateForm, DeliveryNoteForm,
-    OrderNoteForm, OrderItemVerificationForm, OrderFilterForm
+    OrderNoteForm, OrderItemVerificationForm, OrderFilterForm,
+    SalesReportForm
 )
+from .rollups import WATERMARK_NAME
 
 
 def is_staff(user):
@@ -296,6 +303,51 @@ def verify_order_item(request, item_id):
     return redirect('ordini:order-detail', order_id=order_item.order.order_id)
 
 
+@login_required
+@user_passes_test(is_staff)
+def scan_code(request, order_id=None):
+    """
+    Lettura barcode: risolve EAN-13, SKU o pid nel prodotto e, se indicato
+    l'ordine in preparazione, nell'articolo corrispondente.
+    """
+    try:
+        product = barcode_lookup(request.GET.get('code', ''))
+    except InvalidBarcode as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    if product is None:
+        return JsonResponse({'success': False, 'message': 'Codice non trovato.'}, status=404)
+
+    data = {'success': True, 'product': product}
+    if order_id is None:
+        return JsonResponse(data)
+
+    # Articolo dell'ordine: per prodotto, o per SKU se il prodotto è stato eliminato
+    order_item = OrderItem.objects.filter(
+        Q(product_id=product['id']) | Q(product__isnull=True, product_sku=product['sku']),
+        order__order_id=order_id
+    ).select_related('verification').first()
+
+    if order_item is None:
+        data.update(success=False, message='Prodotto non presente nell\'ordine.')
+        return JsonResponse(data, status=404)
+
+    try:
+        verification = order_item.verification
+    except OrderItemVerification.DoesNotExist:
+        verification = None
+
+    data['order_item'] = {
+        'id': order_item.id,
+        'product_title': order_item.product_title,
+        'quantity': order_item.quantity,
+        'verified': verification.verified if verification else False,
+        'verified_quantity': verification.verified_quantity if verification else 0,
+        'verify_url': reverse('ordini:verify-item', args=[order_item.id]),
+    }
+    return JsonResponse(data)
+
+
 @login_required
 @user_passes_test(is_staff)
 def create_delivery_note(request, order_id):
@@ -384,6 +436,65 @@ def add_order_note(request, order_id):
     return redirect('ordini:order-detail', order_id=order.order_id)
 
 
+@login_required
+@user_passes_test(is_staff)
+def sales_report(request):
+    """
+    Report vendite per intervallo di date (predefinito: ultimi 30 giorni).
+    Legge solo i riepiloghi giornalieri, aggiornati da `update_sales_rollups`.
+    """
+    form = SalesReportForm(request.GET or None)
+    date_to = timezone.localdate()
+    date_from = date_to - timedelta(days=29)
+    status = ''
+    if form.is_valid():
+        date_from = form.cleaned_data['date_from'] or date_from
+        date_to = form.cleaned_data['date_to'] or date_to
+        status = form.cleaned_data['status']
+
+    daily = DailySales.objects.filter(day__gte=date_from, day__lte=date_to)
+    by_category = DailyCategorySales.objects.filter(day__gte=date_from, day__lte=date_to)
+    if status:
+        daily = daily.filter(order_status=status)
+        by_category = by_category.filter(order_status=status)
+
+    measures = {
+        'orders': Sum('orders'),
+        'units': Sum('units'),
+        'revenue': Sum('revenue'),
+        'tax': Sum('tax'),
+        'shipping': Sum('shipping'),
+    }
+    totals = daily.aggregate(**measures)
+
+    # Serie giornaliera per i grafici, con i giorni senza vendite a zero
+    rows = {row['day']: row for row in daily.values('day').annotate(**measures).order_by()}
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    chart = {
+        'labels': [day.isoformat() for day in days],
+        'revenue': [float(rows[day]['revenue']) if day in rows else 0 for day in days],
+        'orders': [rows[day]['orders'] if day in rows else 0 for day in days],
+    }
+
+    by_payment_method = daily.values('payment_method').annotate(**measures).order_by('-revenue')
+    by_status = daily.values('order_status').annotate(**measures).order_by('-revenue')
+    by_category = by_category.values('category__title').annotate(**measures).order_by('-revenue')
+
+    context = {
+        'form': form,
+        'date_from': date_from,
+        'date_to': date_to,
+        'totals': totals,
+        'chart': chart,
+        'by_payment_method': by_payment_method,
+        'by_status': by_status,
+        'by_category': by_category,
+        'watermark': RollupWatermark.objects.filter(name=WATERMARK_NAME).first(),
+    }
+
+    return render(request, 'ordini/sales_report.html', context)
+
+
 @login_required
 @user_passes_test(is_staff)
 def stock_movements(request):
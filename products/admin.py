@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Category, ProductImages
+from .models import Product, Category, ProductImages, VatClass
 
 
 class ProductImagesInline(admin.TabularInline):
@@ -16,6 +16,13 @@ class CategoryAdmin(admin.ModelAdmin):
     readonly_fields = ['cid', 'category_image']
 
 
+@admin.register(VatClass)
+class VatClassAdmin(admin.ModelAdmin):
+    """Admin interface for VatClass model"""
+    list_display = ['name', 'rate', 'is_default']
+    list_editable = ['rate', 'is_default']
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     """Admin interface for Product model"""
@@ -35,6 +42,7 @@ class ProductAdmin(admin.ModelAdmin):
         'featured', 
         'in_stock',
         'digital',
+        'vat_class',
         'date'
     ]
     search_fields = ['title', 'description', 'tags__name']
@@ -50,7 +58,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('description', 'tags')
         }),
         ('Prezzi e Magazzino', {
-            'fields': ('price', 'old_price', 'stock_count', 'weight')
+            'fields': ('price', 'old_price', 'vat_class', 'stock_count', 'weight')
         }),
         ('Media', {
             'fields': ('image', 'product_image')
@@ -0,0 +1,298 @@
+"""
+Read-only JSON catalog API (v1).
+
+Serializers are hand-written over `.values()` rows, so no model instance
+or related object is built per product. List endpoints use cursor
+(keyset) pagination and every response carries an ETag, answered with
+304 Not Modified when it matches.
+"""
+
+import base64
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Case, When, Value, IntegerField, Count, Max, OuterRef, Q, Subquery, Sum
+from django.http import JsonResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
+from taggit.models import TaggedItem
+
+from .models import Category, Product, ProductImages
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# API field: (columns read with .values(), formatter of the row)
+PRODUCT_FIELDS = {
+    'pid': (['pid'], lambda row: row['pid']),
+    'title': (['title'], lambda row: row['title']),
+    'sku': (['sku'], lambda row: row['sku']),
+    'ean': (['ean'], lambda row: row['ean']),
+    'price': (['price'], lambda row: str(row['price'])),
+    'old_price': (['old_price'], lambda row: str(row['old_price']) if row['old_price'] else None),
+    'discount': (['price', 'old_price'], lambda row: discount_percentage(row['price'], row['old_price'])),
+    'category': (['category__cid', 'category__title'], lambda row: {
+        'cid': row['category__cid'],
+        'title': row['category__title'],
+    } if row['category__cid'] else None),
+    'image': (['image'], lambda row: default_storage.url(row['image']) if row['image'] else None),
+    'in_stock': (['in_stock'], lambda row: row['in_stock']),
+    'featured': (['featured'], lambda row: row['featured']),
+    'updated': (['updated', 'date'], lambda row: (row['updated'] or row['date']).isoformat()),
+}
+
+# Extra fields of the product detail
+DETAIL_FIELDS = ['description', 'weight', 'stock_count', 'tags', 'images']
+
+# Sort name: ordering columns (the last one is unique)
+SORTS = {
+    'default': ['has_discount', '-date', '-id'],
+    'newest': ['-date', '-id'],
+    'price': ['price', 'id'],
+    '-price': ['-price', '-id'],
+}
+
+
+class BadRequest(Exception):
+    """Invalid query parameters."""
+    pass
+
+
+def discount_percentage(price, old_price):
+    """Same value as Product.get_percentage, from raw values."""
+    if old_price and old_price > 0:
+        return float(round((old_price - price) / old_price * 100, 2))
+    return 0
+
+
+def error_response(message, status=400):
+    return JsonResponse({'success': False, 'message': message}, status=status)
+
+
+def parse_fields(request, available):
+    """Sparse fieldset: `?fields=pid,title,price` (default all)."""
+    value = request.GET.get('fields', '')
+    if not value:
+        return list(available)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise BadRequest(f"Campi sconosciuti: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('Parametro limit non valido')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    """Values of the ordering columns encoded in a cursor: a list of scalars, one per column."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise BadRequest('Cursore non valido')
+    if (
+        not isinstance(values, list)
+        or len(values) != len(ordering)
+        or not all(isinstance(value, (str, int, float)) for value in values)
+    ):
+        raise BadRequest('Cursore non valido')
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows after `values` in `ordering`:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... with > or < per direction.
+    """
+    condition = Q()
+    equal = Q()
+    for column, value in zip(ordering, values):
+        name = column.lstrip('-')
+        lookup = 'lt' if column.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def with_etag(request, data, etag):
+    """Return 304 if the client has this version, else the JSON with its ETag."""
+    etag = f'"{etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    return response
+
+
+def published_products():
+    return Product.objects.filter(product_status='published', status=True, in_stock=True)
+
+
+def serialize_products(rows, fields):
+    formatters = [(name, PRODUCT_FIELDS[name][1]) for name in fields]
+    return [{name: format_value(row) for name, format_value in formatters} for row in rows]
+
+
+@require_GET
+def category_list(request):
+    """GET /api/v1/categories/ : categories with their published product count."""
+    rows = Category.objects.annotate(
+        product_count=Count('products', filter=Q(
+            products__product_status='published',
+            products__status=True,
+            products__in_stock=True,
+        ))
+    ).values('cid', 'title', 'image', 'product_count')
+
+    data = {'results': [{
+        'cid': row['cid'],
+        'title': row['title'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'product_count': row['product_count'],
+    } for row in rows]}
+    etag = hashlib.md5(json.dumps(data).encode()).hexdigest()
+    return with_etag(request, data, etag)
+
+
+@require_GET
+def product_list(request):
+    """
+    GET /api/v1/products/ : published products.
+    Filters: category (cid), q (search), sort (default, newest, price, -price).
+    Pagination: limit and cursor (the `next` value of the previous page).
+    """
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS)
+        limit = parse_limit(request)
+        sort = request.GET.get('sort', 'default')
+        if sort not in SORTS:
+            raise BadRequest('Ordinamento non valido')
+        ordering = SORTS[sort]
+        cursor = decode_cursor(request.GET['cursor'], ordering) if request.GET.get('cursor') else None
+    except BadRequest as e:
+        return error_response(str(e))
+
+    products = published_products()
+    category = request.GET.get('category', '')
+    if category:
+        products = products.filter(category__cid=category)
+    search = request.GET.get('q', '')
+    if search:
+        products = products.filter(
+            Q(title__icontains=search) |
+            Q(description__icontains=search) |
+            Q(tags__name__icontains=search)
+        ).distinct()
+
+    # Version of the filtered catalog: last change and product count
+    version = products.aggregate(updated=Max('updated'), date=Max('date'), count=Count('id'))
+    stamp = max(filter(None, [version['updated'], version['date']]), default=None)
+    etag = hashlib.md5(
+        f"{request.GET.urlencode()}|{stamp}|{version['count']}".encode()
+    ).hexdigest()
+    not_modified = get_conditional_response(request, etag=f'"{etag}"')
+    if not_modified is not None:
+        not_modified['ETag'] = f'"{etag}"'
+        return not_modified
+
+    if sort == 'default':
+        products = products.annotate(has_discount=Case(
+            When(old_price__gt=0, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+    keys = [column.lstrip('-') for column in ordering]
+    columns = {column for name in fields for column in PRODUCT_FIELDS[name][0]} | set(keys)
+    try:
+        if cursor is not None:
+            products = products.filter(keyset_filter(ordering, cursor))
+        rows = list(products.order_by(*ordering).values(*columns)[:limit + 1])
+    except (ValidationError, TypeError, ValueError):
+        # Cursor values that do not fit the columns (not a date, not a number...)
+        return error_response('Cursore non valido')
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for key in keys])
+
+    data = {
+        'count': version['count'],
+        'next': next_cursor,
+        'results': serialize_products(rows, fields),
+    }
+    return with_etag(request, data, etag)
+
+
+@require_GET
+def product_detail(request, pid):
+    """GET /api/v1/products/<pid>/ : a published product with tags and images."""
+    try:
+        fields = parse_fields(request, list(PRODUCT_FIELDS) + DETAIL_FIELDS)
+    except BadRequest as e:
+        return error_response(str(e))
+
+    columns = {column for name in fields if name in PRODUCT_FIELDS for column in PRODUCT_FIELDS[name][0]}
+    columns |= {'id', 'updated', 'date', 'stock_count'} | {name for name in ('description', 'weight') if name in fields}
+    # Stock and tags change without touching `updated`; tag rows are only
+    # added and deleted, so the sum of their ids tracks them
+    tags = TaggedItem.objects.filter(
+        object_id=OuterRef('pk'),
+        content_type__app_label='products',
+        content_type__model='product'
+    ).order_by().values('object_id').annotate(checksum=Sum('id')).values('checksum')
+    row = Product.objects.filter(
+        pid=pid,
+        product_status='published'
+    ).annotate(
+        images_date=Max('p_images__date'),
+        images_count=Count('p_images'),
+        tags_checksum=Subquery(tags)
+    ).values(*columns, 'images_date', 'images_count', 'tags_checksum').first()
+    if row is None:
+        raise Http404
+
+    stamp = max(filter(None, [row['updated'] or row['date'], row['images_date']]))
+    etag = (
+        f"{pid}-{int(stamp.timestamp() * 1000000)}-{row['images_count']}"
+        f"-{row['stock_count']}-{row['tags_checksum'] or 0}-"
+    ) + hashlib.md5(','.join(fields).encode()).hexdigest()[:8]
+    not_modified = get_conditional_response(request, etag=f'"{etag}"')
+    if not_modified is not None:
+        not_modified['ETag'] = f'"{etag}"'
+        return not_modified
+
+    data = serialize_products([row], [name for name in fields if name in PRODUCT_FIELDS])[0]
+    if 'description' in fields:
+        data['description'] = row['description']
+    if 'weight' in fields:
+        data['weight'] = str(row['weight']) if row['weight'] is not None else None
+    if 'stock_count' in fields:
+        data['stock_count'] = row['stock_count']
+    if 'tags' in fields:
+        data['tags'] = sorted(Product.tags.through.objects.filter(
+            object_id=row['id'],
+            content_type__app_label='products',
+            content_type__model='product'
+        ).values_list('tag__name', flat=True))
+    if 'images' in fields:
+        data['images'] = [
+            default_storage.url(name)
+            for name in ProductImages.objects.filter(
+                product_id=row['id']
+            ).order_by('date').values_list('images', flat=True) if name
+        ]
+
+    return with_etag(request, data, etag)
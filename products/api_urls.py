@@ -0,0 +1,10 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('categories/', api.category_list, name='category-list'),
+    path('products/', api.product_list, name='product-list'),
+    path('products/<str:pid>/', api.product_detail, name='product-detail'),
+]
@@ -0,0 +1,70 @@
+"""
+Barcode lookup for warehouse scanning.
+
+Every process keeps a dict from code (EAN-13, SKU or pid) to product,
+built with a single query (core.caching.VersionedTable). Product saves and
+deletes invalidate it: the local table is dropped at once and other
+processes notice the new version within CACHE_VERSION_CHECK_INTERVAL
+seconds. EAN-13 check digits are validated before the table or the
+database is touched.
+"""
+
+from core.caching import VersionedTable
+
+from .models import Product
+
+
+class InvalidBarcode(ValueError):
+    """The scanned code cannot be a valid product code."""
+    pass
+
+
+def is_valid_ean13(code):
+    """Check length and check digit of an EAN-13 code."""
+    if len(code) != 13 or not code.isdigit():
+        return False
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(code[:12]))
+    return (10 - total % 10) % 10 == int(code[12])
+
+
+def normalize(code):
+    return (code or '').strip().lower()
+
+
+def validate(code):
+    """Normalize a scanned code, raising InvalidBarcode on a bad EAN-13."""
+    code = normalize(code)
+    if not code:
+        raise InvalidBarcode('Codice vuoto')
+    # Thirteen digits: an EAN-13, its check digit must match. Other numeric
+    # codes may be supplier SKUs or pids and are looked up as they are.
+    if len(code) == 13 and code.isdigit() and not is_valid_ean13(code):
+        raise InvalidBarcode(f'Codice EAN non valido: {code}')
+    return code
+
+
+def build_codes():
+    """Code (pid, SKU or EAN) -> product dict of every product (one query)."""
+    codes = {}
+    rows = Product.objects.values_list('id', 'pid', 'sku', 'ean', 'title', 'stock_count')
+    for row in rows:
+        product = {
+            'id': row[0],
+            'pid': row[1],
+            'sku': row[2],
+            'ean': row[3],
+            'title': row[4],
+            'stock_count': row[5],
+        }
+        for code in (row[1], row[2], row[3]):
+            if code:
+                codes[normalize(code)] = product
+    return codes
+
+
+barcode_table = VersionedTable('barcodes', build_codes)
+
+
+def lookup(code):
+    """Return the product dict of a scanned code, or None."""
+    return barcode_table.get().get(validate(code))
@@ -0,0 +1,103 @@
+"""
+Streaming catalog export (CSV or JSON Lines).
+
+Products are read with a server-side cursor (`.iterator(chunk_size)`),
+tags and images are prefetched per chunk, and every row is written as
+soon as it is read, so memory stays constant for any catalog size.
+"""
+
+import csv
+import json
+
+from django.db.models import Q
+
+from .models import Product
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Exported columns, in default order
+EXPORT_FIELDS = {
+    'pid': lambda p, url: p.pid,
+    'sku': lambda p, url: p.sku,
+    'ean': lambda p, url: p.ean or '',
+    'title': lambda p, url: p.title,
+    'category': lambda p, url: p.category.title if p.category else '',
+    'category_id': lambda p, url: p.category.cid if p.category else '',
+    'tags': lambda p, url: ', '.join(sorted(tag.name for tag in p.tags.all())),
+    'price': lambda p, url: str(p.price),
+    'old_price': lambda p, url: str(p.old_price or ''),
+    'stock_count': lambda p, url: p.stock_count,
+    'in_stock': lambda p, url: p.in_stock,
+    'weight': lambda p, url: str(p.weight or ''),
+    'product_status': lambda p, url: p.product_status,
+    'image_url': lambda p, url: url(p.image.url) if p.image else '',
+    'gallery_urls': lambda p, url: ' | '.join(url(i.images.url) for i in p.p_images.all() if i.images),
+    'updated': lambda p, url: (p.updated or p.date).isoformat(),
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def filter_products(queryset, search='', category='', status=''):
+    """Apply the filters of the staff product list."""
+    if search:
+        queryset = queryset.filter(
+            Q(title__icontains=search) |
+            Q(description__icontains=search) |
+            Q(tags__name__icontains=search)
+        ).distinct()
+    if category:
+        queryset = queryset.filter(category__cid=category)
+    if status:
+        queryset = queryset.filter(product_status=status)
+    return queryset
+
+
+def parse_fields(value):
+    """Return the requested field names, raising ValueError on unknown ones."""
+    if not value:
+        return list(EXPORT_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Campi sconosciuti: {', '.join(unknown)}")
+    return fields
+
+
+def export_queryset(fields, search='', category='', status=''):
+    """Products to export, fetching only the relations the fields need."""
+    queryset = Product.objects.select_related('category').order_by('pk')
+    if 'tags' in fields:
+        queryset = queryset.prefetch_related('tags')
+    if 'gallery_urls' in fields:
+        queryset = queryset.prefetch_related('p_images')
+    return filter_products(queryset, search, category, status)
+
+
+class Echo:
+    """File-like object returning what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, url, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the exported values of each product as a list."""
+    extractors = [EXPORT_FIELDS[name] for name in fields]
+    for product in queryset.iterator(chunk_size=chunk_size):
+        yield [extract(product, url) for extract in extractors]
+
+
+def stream_export(queryset, fields, export_format, url=lambda path: path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export file piece by piece (header first for CSV)."""
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in iter_rows(queryset, fields, url, chunk_size):
+            yield writer.writerow(row)
+    else:
+        for row in iter_rows(queryset, fields, url, chunk_size):
+            yield json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n'
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Product, Category
+from .models import Product, Category, STATUS
 from django_ckeditor_5.widgets import CKEditor5Widget
 
 
@@ -20,6 +20,7 @@ class ProductForm(forms.ModelForm):
             'category', 
             'price', 
             'old_price',
+            'vat_class',
             'stock_count', 
             'weight',
             'image', 
@@ -48,6 +49,9 @@ class ProductForm(forms.ModelForm):
                 'placeholder': '0.00',
                 'step': '0.01'
             }),
+            'vat_class': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'stock_count': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'placeholder': '0'
@@ -83,6 +87,7 @@ class ProductForm(forms.ModelForm):
             'category': 'Categoria',
             'price': 'Prezzo di Vendita (€)',
             'old_price': 'Vecchio Prezzo (€)',
+            'vat_class': 'Classe IVA',
             'stock_count': 'Quantità in Magazzino',
             'weight': 'Peso (kg)',
             'image': 'Immagine Principale',
@@ -114,4 +119,32 @@ class CategoryForm(forms.ModelForm):
         labels = {
             'title': 'Nome Categoria',
             'image': 'Immagine Categoria'
-        }
\ No newline at end of file
+        }
+
+
+class ProductImportForm(forms.Form):
+    """Form for uploading a supplier catalog feed"""
+    
+    feed = forms.FileField(
+        label='File Catalogo (CSV o XLSX)',
+        widget=forms.FileInput(attrs={
+            'class': 'form-control',
+            'accept': '.csv,.txt,.xlsx'
+        })
+    )
+    images_zip = forms.FileField(
+        label='Immagini (ZIP)',
+        required=False,
+        widget=forms.FileInput(attrs={
+            'class': 'form-control',
+            'accept': '.zip'
+        })
+    )
+    product_status = forms.ChoiceField(
+        label='Stato dei Nuovi Prodotti',
+        choices=STATUS,
+        initial='in_review',
+        widget=forms.Select(attrs={
+            'class': 'form-select'
+        })
+    )
@@ -0,0 +1,444 @@
+"""
+Bulk product import from supplier feeds (CSV or XLSX).
+
+The file is read row by row and processed in batches: every batch upserts
+products on EAN (or SKU) with bulk_create/bulk_update, generates the missing
+pid/sku in bulk with collision checks, attaches tags through the taggit
+through table and stores the images found in a directory or zip archive.
+Rows without EAN and SKU are rejected: a later import could not match them.
+The images stored by a batch that is rolled back are deleted.
+"""
+
+import csv
+import io
+import os
+import zipfile
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from core.caching import namespace
+from core.promotions import promotion_index
+
+from .barcodes import barcode_table, is_valid_ean13
+from .models import Product, Category, ProductImages, STATUS
+
+# Accepted column names (supplier feeds are often in Italian)
+COLUMN_ALIASES = {
+    'title': ['title', 'titolo', 'nome', 'name'],
+    'ean': ['ean', 'ean13', 'barcode', 'codice ean'],
+    'sku': ['sku', 'codice', 'code'],
+    'category': ['category', 'categoria'],
+    'price': ['price', 'prezzo'],
+    'old_price': ['old_price', 'prezzo precedente', 'prezzo listino'],
+    'stock_count': ['stock_count', 'stock', 'quantità', 'quantita', 'giacenza'],
+    'weight': ['weight', 'peso'],
+    'description': ['description', 'descrizione'],
+    'tags': ['tags', 'tag'],
+    'image': ['image', 'immagine'],
+    'gallery': ['gallery', 'immagini'],
+    'product_status': ['product_status', 'stato'],
+}
+
+PRODUCT_STATUSES = {value for value, label in STATUS}
+SKU_MAX_LENGTH = Product._meta.get_field('sku').max_length
+MAX_UUID_ATTEMPTS = 10
+
+
+class FeedError(Exception):
+    """Raised when the feed cannot be read at all."""
+    pass
+
+
+@dataclass
+class BatchReport:
+    """Outcome of one batch of rows."""
+    number: int
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    images: int = 0
+    errors: list = field(default_factory=list)  # (row number, message)
+
+
+def normalize_header(header):
+    """Map the file headers to product fields, unknown columns are ignored."""
+    lookup = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    return [lookup.get((column or '').strip().lower()) for column in header]
+
+
+def read_rows(file, filename):
+    """
+    Yield the rows of a CSV or XLSX file as dicts keyed by product field,
+    without loading the whole file in memory.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in ('.xlsx', '.xlsm'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise FeedError('Per importare file XLSX installa openpyxl.')
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    elif extension in ('.csv', '.txt'):
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        rows = csv.reader(text, dialect)
+    else:
+        raise FeedError(f'Formato file non supportato: {extension}')
+
+    header = normalize_header(next(rows, []))
+    if 'title' not in header or 'price' not in header:
+        raise FeedError('Il file deve contenere almeno le colonne titolo e prezzo.')
+
+    for values in rows:
+        if not any(values):
+            continue
+        yield {
+            name: '' if value is None else str(value).strip()
+            for name, value in zip(header, values) if name
+        }
+
+
+def parse_decimal(value, column):
+    """Parse prices and weights, accepting the Italian decimal comma."""
+    if value in ('', None):
+        return None
+    number = value.replace('€', '').strip()
+    if ',' in number:
+        number = number.replace('.', '').replace(',', '.')
+    try:
+        number = Decimal(number).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise ValueError(f'Valore non valido per {column}: {value}')
+    return number
+
+
+def parse_quantity(value, column):
+    """Parse stock quantities, '12' or '12.0' as written by spreadsheets."""
+    if value in ('', None):
+        return 0
+    try:
+        return int(float(value))
+    except (ValueError, OverflowError):
+        raise ValueError(f'Valore non valido per {column}: {value}')
+
+
+class ImageSource:
+    """Images referenced by the feed, from a local directory or a zip archive."""
+
+    def __init__(self, path=None, archive=None):
+        self.path = path
+        self.zip = zipfile.ZipFile(archive) if archive else None
+        self.names = {}
+        if self.zip:
+            self.names = {os.path.basename(name): name for name in self.zip.namelist() if not name.endswith('/')}
+
+    def read(self, filename):
+        """Return the image content or None if not found."""
+        filename = os.path.basename(filename)
+        if self.zip and filename in self.names:
+            return self.zip.read(self.names[filename])
+        if self.path:
+            full_path = os.path.join(self.path, filename)
+            if os.path.isfile(full_path):
+                with open(full_path, 'rb') as image:
+                    return image.read()
+        return None
+
+
+class ProductImporter:
+    """
+    Streaming upsert of products from a supplier feed.
+
+    Usage:
+        importer = ProductImporter(user, images=ImageSource(path='foto/'))
+        for report in importer.run(file, 'feed.csv'):
+            ...
+    """
+
+    def __init__(self, user, images=None, batch_size=500, default_status='in_review'):
+        self.user = user
+        self.images = images
+        self.batch_size = batch_size
+        self.default_status = default_status
+        self.content_type = ContentType.objects.get_for_model(Product)
+        # Files saved by the current batch, deleted if it is rolled back
+        self.stored_files = []
+
+    def run(self, file, filename):
+        """Process the file and yield a BatchReport after each batch."""
+        batch, number = [], 0
+        for row_number, row in enumerate(read_rows(file, filename), start=2):
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                number += 1
+                yield self.process_batch(number, batch)
+                batch = []
+        if batch:
+            yield self.process_batch(number + 1, batch)
+
+    def process_batch(self, number, rows):
+        """Validate and upsert one batch of rows in a single transaction."""
+        report = BatchReport(number=number, rows=len(rows))
+        parsed = []
+        for row_number, row in rows:
+            try:
+                parsed.append((row_number, self.parse_row(row)))
+            except ValueError as e:
+                report.errors.append((row_number, str(e) or 'Valore non valido'))
+
+        self.stored_files = []
+        try:
+            with transaction.atomic():
+                self.upsert(parsed, report)
+        except IntegrityError as e:
+            self.delete_stored_files()
+            report.created = report.updated = report.images = 0
+            report.errors.append((None, f'Lotto annullato: {e}'))
+        except BaseException:
+            self.delete_stored_files()
+            raise
+        return report
+
+    def delete_stored_files(self):
+        """Delete the images saved by a batch that was rolled back."""
+        for name in self.stored_files:
+            default_storage.delete(name)
+        self.stored_files = []
+
+    def parse_row(self, row):
+        """Convert a raw row to product values, raising ValueError on bad data."""
+        title = row.get('title', '')
+        if not title:
+            raise ValueError('Titolo mancante')
+
+        ean = row.get('ean') or None
+        if ean and not is_valid_ean13(ean):
+            raise ValueError(f'EAN non valido: {ean}')
+
+        sku = row.get('sku') or None
+        if sku and len(sku) > SKU_MAX_LENGTH:
+            raise ValueError(f'SKU troppo lungo (massimo {SKU_MAX_LENGTH} caratteri): {sku}')
+        if not ean and not sku:
+            raise ValueError('EAN o SKU mancante')
+
+        price = parse_decimal(row.get('price', ''), 'prezzo')
+        if price is None:
+            raise ValueError('Prezzo mancante')
+
+        status = row.get('product_status') or self.default_status
+        if status not in PRODUCT_STATUSES:
+            raise ValueError(f'Stato non valido: {status}')
+
+        values = {
+            'title': title[:100],
+            'ean': ean,
+            'sku': sku,
+            'category': row.get('category', ''),
+            'price': price,
+            'old_price': parse_decimal(row.get('old_price', ''), 'prezzo precedente') or Decimal('0.00'),
+            'stock_count': parse_quantity(row.get('stock_count', ''), 'quantità'),
+            'weight': parse_decimal(row.get('weight', ''), 'peso'),
+            'description': row.get('description', ''),
+            'product_status': status,
+            'image': row.get('image', ''),
+            'gallery': [name.strip() for name in row.get('gallery', '').split('|') if name.strip()],
+            'tags': None,
+        }
+        if 'tags' in row:
+            values['tags'] = sorted({
+                tag.strip() for tag in row['tags'].replace(';', ',').split(',') if tag.strip()
+            })
+        return values
+
+    def upsert(self, parsed, report):
+        """Create or update the products of a batch with bulk queries."""
+        # Existing products by EAN or SKU (two queries)
+        eans = [values['ean'] for row_number, values in parsed if values['ean']]
+        skus = [values['sku'] for row_number, values in parsed if values['sku']]
+        by_ean = {p.ean: p for p in Product.objects.filter(ean__in=eans)}
+        by_sku = {p.sku: p for p in Product.objects.filter(sku__in=skus)}
+        categories = self.get_categories({values['category'] for row_number, values in parsed})
+
+        now = timezone.now()
+        to_create, to_update, seen = [], [], {}
+        for row_number, values in parsed:
+            by_code = by_ean.get(values['ean']), by_sku.get(values['sku'])
+            if all(by_code) and by_code[0] != by_code[1]:
+                report.errors.append((row_number, 'EAN e SKU di due prodotti diversi'))
+                continue
+            product = by_code[0] or by_code[1]
+
+            # A row is a duplicate when its EAN, its SKU or its product are already in the batch
+            keys = [('ean', values['ean']), ('sku', values['sku'])]
+            if product is not None:
+                keys.append(('pk', product.pk))
+            keys = [key for key in keys if key[1]]
+            duplicate = next((seen[key] for key in keys if key in seen), None)
+            if duplicate is not None:
+                report.errors.append((row_number, f'Riga duplicata di {duplicate}'))
+                continue
+            for key in keys:
+                seen[key] = row_number
+
+            if product is None:
+                product = Product(user=self.user)
+                to_create.append(product)
+            else:
+                product.updated = now
+                to_update.append(product)
+
+            for name in ('title', 'price', 'old_price', 'stock_count', 'weight', 'product_status'):
+                setattr(product, name, values[name])
+            if values['description']:
+                product.description = values['description']
+            if values['ean']:
+                product.ean = values['ean']
+            if values['sku']:
+                product.sku = values['sku']
+            if values['category']:
+                product.category = categories[values['category']]
+            product.in_stock = values['stock_count'] > 0
+            product._import_values = values
+
+        self.assign_identifiers(to_create)
+        for product in to_create + to_update:
+            report.images += self.store_image(product)
+
+        Product.objects.bulk_create(to_create)
+        if to_create and to_create[0].pk is None:
+            ids = dict(Product.objects.filter(pid__in=[p.pid for p in to_create]).values_list('pid', 'pk'))
+            for product in to_create:
+                product.pk = ids[product.pid]
+        Product.objects.bulk_update(to_update, [
+            'title', 'description', 'category', 'price', 'old_price', 'stock_count', 'weight',
+            'product_status', 'in_stock', 'ean', 'sku', 'image', 'updated',
+        ])
+
+        self.attach_tags(to_create + to_update)
+        report.images += self.attach_gallery(to_create + to_update)
+        # Bulk writes send no post_save
+        transaction.on_commit(barcode_table.invalidate)
+        report.created += len(to_create)
+        report.updated += len(to_update)
+
+    def get_categories(self, titles):
+        """Return categories by title, creating the missing ones in bulk."""
+        titles = {title for title in titles if title}
+        categories = {c.title: c for c in Category.objects.filter(title__in=titles)}
+        missing = [Category(title=title[:100]) for title in titles if title not in categories]
+        if missing:
+            Category.objects.bulk_create(missing)
+            # Bulk writes send no post_save: drop the cached category list
+            transaction.on_commit(lambda: namespace('reference').delete('categories'))
+            categories.update({c.title: c for c in Category.objects.filter(title__in=[c.title for c in missing])})
+        return categories
+
+    def assign_identifiers(self, products):
+        """
+        Generate pid and sku for the new products in bulk.
+        Candidates are checked against the database with one query per field
+        and regenerated only where they collide.
+        """
+        for name in ('pid', 'sku'):
+            model_field = Product._meta.get_field(name)
+            pending = [p for p in products if name == 'pid' or not p._import_values['sku']]
+            taken = set()
+            for attempt in range(MAX_UUID_ATTEMPTS):
+                if not pending:
+                    break
+                candidates = {}
+                for product in pending:
+                    value = model_field._generate_uuid()
+                    while value in candidates or value in taken:
+                        value = model_field._generate_uuid()
+                    candidates[value] = product
+                existing = set(Product.objects.filter(**{f'{name}__in': list(candidates)}).values_list(name, flat=True))
+                taken |= existing
+                for value, product in candidates.items():
+                    if value not in existing:
+                        setattr(product, name, value)
+                pending = [candidates[value] for value in existing]
+            if pending:
+                raise FeedError(f'Impossibile generare valori univoci per {name}.')
+
+    def store_image(self, product):
+        """Save the main image of a product from the image source."""
+        filename = product._import_values['image']
+        if not filename or not self.images:
+            return 0
+        content = self.images.read(filename)
+        if content is None:
+            return 0
+        user_id = product.user_id or (self.user.pk if self.user else 0)
+        product.image = self.save_file(f'user_{user_id}/{os.path.basename(filename)}', content)
+        return 1
+
+    def save_file(self, name, content):
+        name = default_storage.save(name, ContentFile(content))
+        self.stored_files.append(name)
+        return name
+
+    def attach_gallery(self, products):
+        """Add the additional images of the products in bulk."""
+        if not self.images:
+            return 0
+        gallery = []
+        for product in products:
+            for filename in product._import_values['gallery']:
+                content = self.images.read(filename)
+                if content is not None:
+                    name = self.save_file(f'product-images/{os.path.basename(filename)}', content)
+                    gallery.append(ProductImages(product=product, images=name))
+        ProductImages.objects.bulk_create(gallery)
+        return len(gallery)
+
+    def attach_tags(self, products):
+        """Replace the tags of the products with bulk queries on the taggit through table."""
+        products = [p for p in products if p._import_values['tags'] is not None]
+        if not products:
+            return
+
+        names = {name for p in products for name in p._import_values['tags']}
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+        missing = [name for name in names if name not in tags]
+        if missing:
+            slugs = {name: slugify(name, allow_unicode=True) for name in missing}
+            used = set(Tag.objects.filter(slug__in=slugs.values()).values_list('slug', flat=True))
+            new_tags, seen_slugs = [], set()
+            for name in missing:
+                if slugs[name] in used or slugs[name] in seen_slugs:
+                    # Rare slug clash: let taggit find a free slug
+                    tags[name] = Tag.objects.create(name=name)
+                else:
+                    seen_slugs.add(slugs[name])
+                    new_tags.append(Tag(name=name, slug=slugs[name]))
+            Tag.objects.bulk_create(new_tags)
+            tags.update({tag.name: tag for tag in Tag.objects.filter(name__in=[t.name for t in new_tags])})
+
+        TaggedItem.objects.filter(
+            content_type=self.content_type,
+            object_id__in=[p.pk for p in products]
+        ).delete()
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=self.content_type, object_id=p.pk, tag=tags[name])
+            for p in products for name in p._import_values['tags']
+        ], ignore_conflicts=True)
+        # Bulk writes send no post_save: promotions targeting tags resolve them to products
+        transaction.on_commit(promotion_index.invalidate)
@@ -0,0 +1,39 @@
+"""
+Precompute the related products shown on the product detail page.
+
+Run periodically (e.g. nightly from cron or the Heroku scheduler): only
+the products whose category, tags, price or status changed since the last
+run are recomputed, with the products related to them.
+
+Example:
+    python manage.py compute_related_products
+    python manage.py compute_related_products --full
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.related import RELATED_PRODUCTS_COUNT, compute_related_products
+
+
+class Command(BaseCommand):
+    help = 'Precompute related products by category, shared tags and price proximity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product')
+        parser.add_argument('--count', type=int, default=RELATED_PRODUCTS_COUNT, help='Related products per product')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        report = compute_related_products(
+            full=options['full'],
+            count=options['count'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.recomputed}/{report.products} prodotti ricalcolati "
+            f"({report.changed} modificati), {report.links} correlazioni "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,53 @@
+"""
+Export the product catalog as CSV or JSON Lines, streaming row by row.
+
+Example:
+    python manage.py export_products --format jsonl --fields pid,title,price,stock_count -o catalogo.jsonl
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.exporter import DEFAULT_CHUNK_SIZE, EXPORT_FIELDS, FORMATS, export_queryset, parse_fields, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Export the product catalog (CSV or JSONL) with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', default='csv', choices=sorted(FORMATS))
+        parser.add_argument('--fields', default='', help=f"Comma separated columns: {', '.join(EXPORT_FIELDS)}")
+        parser.add_argument('--search', default='')
+        parser.add_argument('--category', default='', help='Category cid')
+        parser.add_argument('--status', default='', help='Product status')
+        parser.add_argument('--base-url', default='', help='Prefix for image URLs, e.g. https://example.com')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('-o', '--output', help='Output file (default stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            fields = parse_fields(options['fields'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        products = export_queryset(
+            fields,
+            search=options['search'],
+            category=options['category'],
+            status=options['status'],
+        )
+        base_url = options['base_url'].rstrip('/')
+        chunks = stream_export(
+            products, fields, options['format'],
+            url=lambda path: base_url + path,
+            chunk_size=options['chunk_size'],
+        )
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
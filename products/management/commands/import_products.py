@@ -0,0 +1,62 @@
+"""
+Import a supplier catalog (CSV or XLSX) in batches.
+
+Example:
+    python manage.py import_products listino.csv --images foto/ --user admin@example.com
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from products.importer import FeedError, ImageSource, ProductImporter, PRODUCT_STATUSES
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a supplier CSV/XLSX feed, matching on EAN or SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV or XLSX file')
+        parser.add_argument('--images', help='Directory containing the images referenced by the feed')
+        parser.add_argument('--images-zip', help='Zip archive containing the images referenced by the feed')
+        parser.add_argument('--user', help='Email of the user set as creator of new products')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--status', default='in_review', choices=sorted(PRODUCT_STATUSES),
+                            help='Status of the products when the feed has no status column')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} not found.")
+
+        images = None
+        if options['images'] or options['images_zip']:
+            images = ImageSource(path=options['images'], archive=options['images_zip'])
+
+        importer = ProductImporter(
+            user,
+            images=images,
+            batch_size=options['batch_size'],
+            default_status=options['status'],
+        )
+
+        totals = {'created': 0, 'updated': 0, 'errors': 0}
+        try:
+            with open(options['file'], 'rb') as feed:
+                for report in importer.run(feed, options['file']):
+                    totals['created'] += report.created
+                    totals['updated'] += report.updated
+                    totals['errors'] += len(report.errors)
+                    self.stdout.write(
+                        f'Batch {report.number}: {report.rows} rows, {report.created} created, '
+                        f'{report.updated} updated, {report.images} images, {len(report.errors)} errors'
+                    )
+                    for row_number, message in report.errors:
+                        self.stderr.write(f'  row {row_number or "-"}: {message}')
+        except FeedError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import completed: {totals['created']} created, {totals['updated']} updated, {totals['errors']} errors."
+        ))
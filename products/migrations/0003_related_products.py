@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_ean'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='related_signature',
+            field=models.CharField(blank=True, editable=False, help_text="Categoria, tag e prezzo all'ultimo calcolo dei prodotti correlati", max_length=32),
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Posizione')),
+                ('score', models.FloatField(verbose_name='Punteggio')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='products.product', verbose_name='Prodotto')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_by', to='products.product', verbose_name='Prodotto correlato')),
+            ],
+            options={
+                'verbose_name': 'Prodotto Correlato',
+                'verbose_name_plural': 'Prodotti Correlati',
+                'ordering': ['product', 'rank'],
+                'indexes': [models.Index(fields=['product', 'rank'], name='products_re_product_5f5c5b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'related'), name='unique_related_product')],
+            },
+        ),
+    ]
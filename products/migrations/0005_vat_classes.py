@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_default_vat_class(apps, schema_editor):
+    """Standard Italian rate, applied so far to every product."""
+    VatClass = apps.get_model('products', 'VatClass')
+    VatClass.objects.create(name='Ordinaria', rate='22.00', is_default=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_ratings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VatClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Nome')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Aliquota (%)')),
+                ('is_default', models.BooleanField(default=False, help_text='Applicata ai prodotti senza classe IVA', verbose_name='Predefinita')),
+            ],
+            options={
+                'verbose_name': 'Classe IVA',
+                'verbose_name_plural': 'Classi IVA',
+                'ordering': ['-is_default', 'name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='vat_class',
+            field=models.ForeignKey(blank=True, help_text='Vuota: classe IVA predefinita', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.vatclass', verbose_name='Classe IVA'),
+        ),
+        migrations.RunPython(create_default_vat_class, migrations.RunPython.noop),
+    ]
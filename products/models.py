@@ -1,10 +1,16 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
+from django.dispatch import receiver
 from shortuuid.django_fields import ShortUUIDField
 from django.utils.html import mark_safe
 from django.contrib.auth import get_user_model
 from taggit.managers import TaggableManager
 from django_ckeditor_5.fields import CKEditor5Field
 from django.utils import timezone
+from core.caching import namespace
 
 User = get_user_model()
 
@@ -55,10 +61,38 @@ class Category(models.Model):
         """Count products in this category"""
         return Product.objects.filter(category=self).count()
 
+    @classmethod
+    def cached_list(cls):
+        """All categories, from the 'reference' cache namespace"""
+        return namespace('reference').get_or_set('categories', lambda: list(cls.objects.all()))
+
     def __str__(self):
         return self.title
 
 
+class VatClass(models.Model):
+    """VAT class of the products (core.pricing)"""
+    name = models.CharField(max_length=50, verbose_name="Nome")
+    rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        verbose_name="Aliquota (%)"
+    )
+    is_default = models.BooleanField(
+        default=False,
+        verbose_name="Predefinita",
+        help_text="Applicata ai prodotti senza classe IVA"
+    )
+
+    class Meta:
+        verbose_name = "Classe IVA"
+        verbose_name_plural = "Classi IVA"
+        ordering = ['-is_default', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.rate}%)"
+
+
 class Product(models.Model):
     """Product Model"""
     pid = ShortUUIDField(
@@ -121,6 +155,15 @@ class Product(models.Model):
         blank=True, 
         verbose_name="Peso (kg)"
     )
+    vat_class = models.ForeignKey(
+        VatClass,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="products",
+        verbose_name="Classe IVA",
+        help_text="Vuota: classe IVA predefinita"
+    )
     tags = TaggableManager(blank=True)
     
     product_status = models.CharField(
@@ -134,6 +177,21 @@ class Product(models.Model):
     featured = models.BooleanField(default=False, verbose_name="In evidenza")
     digital = models.BooleanField(default=False, verbose_name="Prodotto digitale")
     
+    # Approved reviews, kept up to date by the Review signals in core
+    rating_avg = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Valutazione media"
+    )
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Numero recensioni")
+    rating_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Recensioni 1 stella")
+    rating_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Recensioni 2 stelle")
+    rating_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Recensioni 3 stelle")
+    rating_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Recensioni 4 stelle")
+    rating_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Recensioni 5 stelle")
+    
     sku = ShortUUIDField(
         unique=True, 
         length=4, 
@@ -151,6 +209,12 @@ class Product(models.Model):
     )
     date = models.DateTimeField(auto_now_add=True, verbose_name="Data creazione")
     updated = models.DateTimeField(null=True, blank=True, verbose_name="Ultima modifica")
+    related_signature = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        help_text="Categoria, tag e prezzo all'ultimo calcolo dei prodotti correlati"
+    )
 
     class Meta:
         verbose_name = "Prodotto"
@@ -171,6 +235,41 @@ class Product(models.Model):
             return round(discount, 2)
         return 0
 
+    def rating_histogram(self):
+        """Review count and percentage per star, from 5 to 1"""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}')
+            percent = round(count * 100 / self.rating_count) if self.rating_count else 0
+            histogram.append({'stars': stars, 'count': count, 'percent': percent})
+        return histogram
+
+    @classmethod
+    def update_ratings(cls, product_id, changes):
+        """
+        Apply review changes to the rating columns with a single UPDATE.
+        `changes` maps a rating (1-5) to +1/-1; average and count are
+        computed in the same statement from the updated histogram.
+        """
+        changes = {rating: delta for rating, delta in changes.items() if delta}
+        if not changes:
+            return
+        counts = {
+            rating: F(f'rating_{rating}') + changes.get(rating, 0)
+            for rating in range(1, 6)
+        }
+        total = sum(counts.values(), Value(0))
+        stars = sum((count * rating for rating, count in counts.items()), Value(0))
+        cls.objects.filter(pk=product_id).update(
+            rating_count=total,
+            rating_avg=Case(
+                When(condition=GreaterThan(total, 0), then=Cast(stars, models.FloatField()) / total),
+                default=Value(0),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2)
+            ),
+            **{f'rating_{rating}': counts[rating] for rating in changes}
+        )
+
     def save(self, *args, **kwargs):
         """Override save to update timestamp"""
         if self.pk:
@@ -199,4 +298,49 @@ class ProductImages(models.Model):
         ordering = ['-date']
 
     def __str__(self):
-        return f"Immagine per {self.product.title}"
\ No newline at end of file
+        return f"Immagine per {self.product.title}"
+
+
+class RelatedProduct(models.Model):
+    """Related products of a product, precomputed by `compute_related_products`"""
+    product = models.ForeignKey(
+        Product,
+        related_name="related_links",
+        on_delete=models.CASCADE,
+        verbose_name="Prodotto"
+    )
+    related = models.ForeignKey(
+        Product,
+        related_name="related_by",
+        on_delete=models.CASCADE,
+        verbose_name="Prodotto correlato"
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name="Posizione")
+    score = models.FloatField(verbose_name="Punteggio")
+
+    class Meta:
+        verbose_name = "Prodotto Correlato"
+        verbose_name_plural = "Prodotti Correlati"
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_related_product'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.title} → {self.related.title}"
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_barcode_table(sender, **kwargs):
+    """Rebuild the scanner lookup table once the change is committed"""
+    from .barcodes import barcode_table
+    transaction.on_commit(barcode_table.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_list(sender, **kwargs):
+    """Drop the cached category list once the change is committed"""
+    transaction.on_commit(lambda: namespace('reference').delete('categories'))
@@ -0,0 +1,238 @@
+"""
+Precomputed related products.
+
+Candidates of a product are the published products sharing at least one
+tag, and the ones of its category closest in price (the best of the
+category among the products sharing no tag). Tags on more products than
+their share of MAX_TAG_CANDIDATES contribute the ones closest in price
+only, so a product scores a bounded number of candidates whatever the
+size of its category and tags. Each one is scored by category, tag overlap
+(Jaccard) and price proximity, and the best RELATED_PRODUCTS_COUNT are
+stored in RelatedProduct, so the detail page reads them with one indexed query.
+
+A run recomputes only the products whose category, tags, price or
+publication changed since the previous one (tracked by
+Product.related_signature), plus the products whose related list
+involves them and the ones left with fewer links than they could have
+(a related product was deleted).
+"""
+
+import bisect
+import hashlib
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count
+from taggit.models import TaggedItem
+
+from .models import Product, RelatedProduct
+
+RELATED_PRODUCTS_COUNT = 8
+
+# Candidates taken from the tags of a product, at most
+MAX_TAG_CANDIDATES = 200
+
+CATEGORY_WEIGHT = 1.0
+TAGS_WEIGHT = 2.0
+PRICE_WEIGHT = 0.5
+
+
+@dataclass
+class RelatedReport:
+    products: int = 0
+    changed: int = 0
+    recomputed: int = 0
+    links: int = 0
+
+
+def signature(category_id, price, tag_ids, published):
+    value = f"{category_id}|{price}|{','.join(map(str, sorted(tag_ids)))}|{published}"
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def price_proximity(a, b):
+    """1 for the same price, towards 0 as prices drift apart."""
+    high = max(a, b)
+    if high <= 0:
+        return 1.0
+    return 1.0 - abs(a - b) / high
+
+
+def score(product, candidate, tags):
+    """Relatedness of two catalog rows (`tags` maps product id to tag id set)."""
+    value = 0.0
+    if product['category_id'] and product['category_id'] == candidate['category_id']:
+        value += CATEGORY_WEIGHT
+    own, other = tags[product['id']], tags[candidate['id']]
+    if own and other:
+        value += TAGS_WEIGHT * len(own & other) / len(own | other)
+    value += PRICE_WEIGHT * price_proximity(product['price'], candidate['price'])
+    return value
+
+
+def closest_in_price(rows, price, count):
+    """
+    Ids of the `count` rows closest to `price` in price_proximity, from
+    (price, id) rows sorted by price: a window around the price.
+    """
+    high = bisect.bisect_left(rows, (price,))
+    low = high - 1
+    ids = []
+    while len(ids) < count and (low >= 0 or high < len(rows)):
+        if high >= len(rows) or (
+            low >= 0 and price_proximity(price, rows[low][0]) >= price_proximity(price, rows[high][0])
+        ):
+            ids.append(rows[low][1])
+            low -= 1
+        else:
+            ids.append(rows[high][1])
+            high += 1
+    return ids
+
+
+class RelatedProductsBuilder:
+    """Load the catalog once and compute related lists in memory."""
+
+    def __init__(self, count=RELATED_PRODUCTS_COUNT):
+        self.count = count
+        self.products = {
+            row['id']: dict(row, price=float(row['price']))
+            for row in Product.objects.values(
+                'id', 'category_id', 'price', 'product_status', 'related_signature'
+            )
+        }
+
+        self.tags = defaultdict(set)
+        content_type = ContentType.objects.get_for_model(Product)
+        for object_id, tag_id in TaggedItem.objects.filter(
+            content_type=content_type
+        ).values_list('object_id', 'tag_id'):
+            if object_id in self.products:
+                self.tags[object_id].add(tag_id)
+
+        # Inverted indexes of the published products
+        self.by_category = defaultdict(set)
+        self.by_tag = defaultdict(set)
+        for product_id, product in self.products.items():
+            if product['product_status'] != 'published':
+                continue
+            if product['category_id']:
+                self.by_category[product['category_id']].add(product_id)
+            for tag_id in self.tags[product_id]:
+                self.by_tag[tag_id].add(product_id)
+
+        # The same, as (price, id) rows sorted by price
+        self.category_prices = {
+            category_id: sorted((self.products[product_id]['price'], product_id) for product_id in ids)
+            for category_id, ids in self.by_category.items()
+        }
+        self.tag_prices = {
+            tag_id: sorted((self.products[product_id]['price'], product_id) for product_id in ids)
+            for tag_id, ids in self.by_tag.items()
+        }
+
+    def signature(self, product_id):
+        product = self.products[product_id]
+        return signature(
+            product['category_id'], product['price'], self.tags[product_id],
+            product['product_status'] == 'published'
+        )
+
+    def changed(self):
+        """Products whose signature differs from the stored one."""
+        return {
+            product_id for product_id, product in self.products.items()
+            if product['related_signature'] != self.signature(product_id)
+        }
+
+    def affected(self, changed):
+        """Changed products and every product whose related list may include them."""
+        affected = set(changed)
+        for product_id in changed:
+            product = self.products[product_id]
+            if product['category_id']:
+                affected |= self.by_category[product['category_id']]
+            for tag_id in self.tags[product_id]:
+                affected |= self.by_tag[tag_id]
+        # Lists pointing to a changed product (e.g. its category or tags were removed)
+        affected.update(RelatedProduct.objects.filter(
+            related_id__in=changed
+        ).values_list('product_id', flat=True))
+        # Lists shortened by deleted products: fewer links than candidates.
+        # Lists short for lack of candidates are left alone.
+        links = dict(RelatedProduct.objects.values('product_id').annotate(
+            links=Count('id')
+        ).order_by().values_list('product_id', 'links'))
+        for product_id in self.products.keys() - affected:
+            stored = links.get(product_id, 0)
+            if stored < self.count and stored < len(self.candidates(product_id)):
+                affected.add(product_id)
+        return affected & self.products.keys()
+
+    def candidates(self, product_id):
+        """Ids of the products scored for `product_id` (bounded, see the module docstring)."""
+        product = self.products[product_id]
+        candidates = set()
+        tags = self.tags[product_id]
+        if tags:
+            per_tag = max(self.count, MAX_TAG_CANDIDATES // len(tags))
+            for tag_id in tags:
+                rows = self.tag_prices.get(tag_id, ())
+                if len(rows) <= per_tag:
+                    candidates.update(other for price, other in rows)
+                else:
+                    candidates.update(closest_in_price(rows, product['price'], per_tag))
+        if product['category_id'] in self.category_prices:
+            # One more: the product itself may be among them
+            candidates.update(closest_in_price(
+                self.category_prices[product['category_id']], product['price'], self.count + 1
+            ))
+        candidates.discard(product_id)
+        return candidates
+
+    def related(self, product_id):
+        """Best related products as (score, id) pairs, highest first."""
+        product = self.products[product_id]
+        return heapq.nlargest(self.count, (
+            (score(product, self.products[other], self.tags), other)
+            for other in self.candidates(product_id)
+        ))
+
+
+def compute_related_products(full=False, count=RELATED_PRODUCTS_COUNT, batch_size=500):
+    """Refresh the RelatedProduct table, only for the affected products unless `full`."""
+    builder = RelatedProductsBuilder(count)
+    report = RelatedReport(products=len(builder.products))
+
+    changed = set(builder.products) if full else builder.changed()
+    report.changed = len(changed)
+    targets = set(builder.products) if full else builder.affected(changed)
+    targets = sorted(targets)
+
+    for start in range(0, len(targets), batch_size):
+        batch = targets[start:start + batch_size]
+        links = []
+        for product_id in batch:
+            for rank, (value, related_id) in enumerate(builder.related(product_id), 1):
+                links.append(RelatedProduct(
+                    product_id=product_id,
+                    related_id=related_id,
+                    rank=rank,
+                    score=round(value, 4)
+                ))
+        signatures = [
+            Product(id=product_id, related_signature=builder.signature(product_id))
+            for product_id in batch if product_id in changed
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=batch).delete()
+            RelatedProduct.objects.bulk_create(links)
+            # bulk_update keeps Product.updated untouched, the page ETags follow the new links
+            Product.objects.bulk_update(signatures, ['related_signature'])
+        report.recomputed += len(batch)
+        report.links += len(links)
+
+    return report
@@ -1,3 +1,185 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .api import SORTS, BadRequest, decode_cursor, encode_cursor
+from .barcodes import InvalidBarcode, barcode_table, lookup
+from .importer import ImageSource, ProductImporter
+from .models import Product, ProductImages
+
+
+def feed(*lines):
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+class ProductImporterTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        return [name for path, dirs, names in os.walk(self.media_root) for name in names]
+
+    def test_row_errors(self):
+        reports = list(ProductImporter(None).run(feed(
+            'titolo;sku;prezzo;peso;giacenza',
+            'Confetti;CONF-1;abc;;',
+            'Scatola;;4,50;;',
+            'Nastro;NAS-1;1,20;1,2,3;',
+            'Tulle;TUL-1;2,00;0,1;molti',
+            'Sacchetto;SAC-1;1.234,50;0,1;12',
+        ), 'listino.csv'))
+
+        self.assertEqual(reports[0].errors, [
+            (2, 'Valore non valido per prezzo: abc'),
+            (3, 'EAN o SKU mancante'),
+            (4, 'Valore non valido per peso: 1,2,3'),
+            (5, 'Valore non valido per quantità: molti'),
+        ])
+        self.assertEqual(reports[0].created, 1)
+        product = Product.objects.get()
+        self.assertEqual((product.sku, str(product.price), product.stock_count), ('SAC-1', '1234.50', 12))
+
+    def test_images_deleted_when_the_batch_is_rolled_back(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as images:
+            images.writestr('foto/confetti.jpg', b'jpeg')
+            images.writestr('foto/confetti-2.jpg', b'jpeg')
+        archive.seek(0)
+        importer = ProductImporter(None, images=ImageSource(archive=archive))
+        lines = ('titolo;sku;prezzo;immagine;immagini', 'Confetti;CONF-1;9,90;confetti.jpg;confetti-2.jpg')
+
+        with mock.patch.object(ProductImages.objects, 'bulk_create', side_effect=IntegrityError('conflitto')):
+            report, = importer.run(feed(*lines), 'listino.csv')
+        self.assertEqual(report.errors, [(None, 'Lotto annullato: conflitto')])
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+        report, = importer.run(feed(*lines), 'listino.csv')
+        self.assertEqual((report.created, report.images), (1, 2))
+        self.assertEqual(sorted(self.stored_files()), ['confetti-2.jpg', 'confetti.jpg'])
+
+
+class BarcodeLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        barcode_table.invalidate()
+
+    def test_lookup(self):
+        product = Product.objects.create(title='Confetti', sku='CONF-1', ean='8001234567897', stock_count=4)
+        builds = barcode_table.builds
+
+        self.assertEqual(lookup(' conf-1 ')['id'], product.pk)
+        self.assertEqual(lookup('8001234567897')['stock_count'], 4)
+        self.assertEqual(lookup(product.pid)['title'], 'Confetti')
+        self.assertIsNone(lookup('ALTRO'))
+        self.assertEqual(barcode_table.builds, builds + 1)
+        with self.assertRaises(InvalidBarcode):
+            lookup('8001234567890')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.stock_count = 3
+            product.save()
+        self.assertEqual(lookup('CONF-1')['stock_count'], 3)
+        self.assertEqual(barcode_table.builds, builds + 2)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor([1, '2025-05-01 10:00:00', 7]), SORTS['default']), [
+            1, '2025-05-01 10:00:00', 7
+        ])
+
+    def test_malformed_cursors_rejected(self):
+        def raw(text):
+            return base64.urlsafe_b64encode(text.encode()).decode()
+
+        for cursor in (
+            '%%%', 'bm9uIGpzb24', raw('{"price": 1}'), raw('[1]'), raw('[1, 2, 3]'),
+            raw('[null, 2]'), raw('[[1], 2]'), raw('[{"a": 1}, 2]'), raw('"12"'),
+        ):
+            with self.subTest(cursor=cursor), self.assertRaises(BadRequest):
+                decode_cursor(cursor, SORTS['price'])
+
+
+class ProductApiTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        for n in range(7):
+            Product.objects.create(
+                title=f'Bomboniera {n}',
+                sku=f'BOM-{n}',
+                price='10.00' if n < 5 else '12.00',
+                old_price='15.00' if n % 2 else '0.00',
+                stock_count=5,
+                product_status='published',
+            )
+        # Same creation date for most of them: ties on every sort but the last column
+        Product.objects.filter(sku__in=['BOM-1', 'BOM-2', 'BOM-3', 'BOM-4']).update(date=now)
+
+    def pages(self, sort, limit=2):
+        pids, cursor = [], None
+        while True:
+            params = {'sort': sort, 'limit': limit, 'fields': 'pid'}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(reverse('api:product-list'), params).json()
+            pids += [product['pid'] for product in data['results']]
+            cursor = data['next']
+            if cursor is None:
+                return pids
+
+    def test_keyset_pages_with_ties(self):
+        products = Product.objects.all()
+        expected = {
+            'price': products.order_by('price', 'id'),
+            '-price': products.order_by('-price', '-id'),
+            'newest': products.order_by('-date', '-id'),
+            'default': products.order_by('-old_price', '-date', '-id'),
+        }
+        for sort, queryset in expected.items():
+            with self.subTest(sort=sort):
+                self.assertEqual(self.pages(sort), list(queryset.values_list('pid', flat=True)))
+
+    def test_bad_cursor(self):
+        cursor = base64.urlsafe_b64encode(b'["not a date", 3]').decode()
+        for value in ('garbage', cursor):
+            response = self.client.get(reverse('api:product-list'), {'sort': 'newest', 'cursor': value})
+            self.assertEqual(response.status_code, 400)
+
+    def test_detail_etag_follows_stock_and_tags(self):
+        product = Product.objects.get(sku='BOM-0')
+        url = reverse('api:product-detail', args=[product.pid])
+
+        def etag():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response['ETag']
+
+        etags = [etag()]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[0]).status_code, 304)
+        Product.objects.filter(pk=product.pk).update(stock_count=4)
+        etags.append(etag())
+        product.tags.add('sposi')
+        etags.append(etag())
+        product.tags.set(['battesimo'])
+        etags.append(etag())
+        self.assertEqual(len(set(etags)), 4)
+        self.assertEqual(self.client.get(url).json()['tags'], ['battesimo'])
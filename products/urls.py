@@ -12,6 +12,8 @@ urlpatterns = [
     # Admin Product URLs
     path('', views.product_list, name='product-list'),
     path('add/', views.product_add, name='product-add'),
+    path('import/', views.product_import, name='product-import'),
+    path('export/', views.product_export, name='product-export'),
     path('edit/<str:pid>/', views.product_edit, name='product-edit'),
     path('delete/<str:pid>/', views.product_delete, name='product-delete'),
     
@@ -1,10 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q
+from django.conf import settings
+from core.caching import namespace
+from django.db.models import Q, F, Max, Count, Sum, OuterRef, Subquery
 from django.core.paginator import Paginator
-from .models import Product, Category, ProductImages
-from .forms import ProductForm, CategoryForm
+from django.template.loader import render_to_string
+from django.views.decorators.http import condition
+from core.cookie_cart import has_cookie_cart
+from core.models import CoPurchase, Review, Wishlist, CART_SESSION_KEY
+from .models import Product, Category, ProductImages, RelatedProduct
+from .forms import ProductForm, CategoryForm, ProductImportForm
+from .importer import FeedError, ImageSource, ProductImporter
+from .exporter import FORMATS, export_queryset, filter_products, parse_fields, stream_export
+
+
+# Lifetime of the cached product detail body (the key changes with the product version)
+PRODUCT_DETAIL_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_DETAIL_CACHE_TIMEOUT', 60 * 60 * 24)
+
+REVIEWS_PER_PAGE = 5
+
+catalog_cache = namespace('catalog')
 
 
 @staff_member_required
@@ -16,24 +33,11 @@ def product_list(request):
     products = Product.objects.all().select_related('category', 'user')
     categories = Category.objects.all()
     
-    # Search functionality
+    # Search, category and status filters
     search_query = request.GET.get('search', '')
-    if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
-    
-    # Category filter
     category_filter = request.GET.get('category', '')
-    if category_filter:
-        products = products.filter(category__cid=category_filter)
-    
-    # Status filter
     status_filter = request.GET.get('status', '')
-    if status_filter:
-        products = products.filter(product_status=status_filter)
+    products = filter_products(products, search_query, category_filter, status_filter)
     
     # Pagination
     paginator = Paginator(products, 20)  # Show 20 products per page
@@ -132,6 +136,82 @@ def product_delete(request, pid):
     return render(request, 'products/product_confirm_delete.html', context)
 
 
+@staff_member_required
+def product_import(request):
+    """
+    Import products from a supplier CSV/XLSX feed
+    Only accessible to staff members
+    """
+    reports = []
+    
+    if request.method == 'POST':
+        form = ProductImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            feed = form.cleaned_data['feed']
+            images_zip = form.cleaned_data['images_zip']
+            importer = ProductImporter(
+                request.user,
+                images=ImageSource(archive=images_zip) if images_zip else None,
+                default_status=form.cleaned_data['product_status'],
+            )
+            try:
+                reports = list(importer.run(feed, feed.name))
+            except FeedError as e:
+                messages.error(request, str(e))
+            else:
+                created = sum(report.created for report in reports)
+                updated = sum(report.updated for report in reports)
+                errors = sum(len(report.errors) for report in reports)
+                messages.success(
+                    request,
+                    f'Importazione completata: {created} prodotti creati, {updated} aggiornati, {errors} errori.'
+                )
+        else:
+            messages.error(request, 'Errore nel caricamento del file. Controlla i campi.')
+    else:
+        form = ProductImportForm()
+    
+    context = {
+        'form': form,
+        'reports': reports,
+        'page_title': 'Importa Prodotti',
+    }
+    
+    return render(request, 'products/product_import.html', context)
+
+
+@staff_member_required
+def product_export(request):
+    """
+    Stream the product catalog as CSV or JSON Lines
+    Only accessible to staff members
+    Accepts the product list filters (search, category, status),
+    `format` (csv or jsonl) and `fields` (comma separated column names)
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest('Formato non supportato')
+    
+    try:
+        fields = parse_fields(request.GET.get('fields', ''))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    products = export_queryset(
+        fields,
+        search=request.GET.get('search', ''),
+        category=request.GET.get('category', ''),
+        status=request.GET.get('status', ''),
+    )
+    
+    response = StreamingHttpResponse(
+        stream_export(products, fields, export_format, url=request.build_absolute_uri),
+        content_type=FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="catalogo.{export_format}"'
+    return response
+
+
 @staff_member_required
 def category_list(request):
     """
@@ -282,10 +362,90 @@ def category_products(request, cid):
     return render(request, 'products/category_products.html', context)
 
 
+def _product_version(request, pid):
+    """
+    Return last modification date and version tag of a published product.
+    The version changes when the product is saved, its images change or an
+    approved review is added, edited or removed (the rating columns are
+    updated without touching `updated`) or the related products are
+    recomputed, and it is computed with a single query memoized on the request.
+    """
+    if not hasattr(request, '_product_version'):
+        reviews = Review.objects.filter(
+            product=OuterRef('pk'),
+            is_approved=True
+        ).order_by().values('product').annotate(last=Max('updated_at')).values('last')
+        # Related list rewritten in bulk without a timestamp: a checksum of ids and ranks
+        related = RelatedProduct.objects.filter(
+            product=OuterRef('pk')
+        ).order_by().values('product').annotate(
+            checksum=Sum(F('related_id') * F('rank'))
+        ).values('checksum')
+        row = Product.objects.filter(
+            pid=pid,
+            product_status='published'
+        ).annotate(
+            images_date=Max('p_images__date'),
+            images_count=Count('p_images'),
+            reviews_date=Subquery(reviews),
+            related=Subquery(related)
+        ).values(
+            'date', 'updated', 'rating_count', 'rating_avg', 'images_date', 'images_count', 'reviews_date',
+            'related'
+        ).first()
+        
+        version = None
+        if row:
+            last_modified = max(filter(None, [row['updated'] or row['date'], row['images_date'], row['reviews_date']]))
+            version = {
+                'last_modified': last_modified,
+                'etag': (
+                    f"{pid}-{int(last_modified.timestamp() * 1000000)}-{row['images_count']}"
+                    f"-{row['rating_count']}-{row['rating_avg']}-{row['related'] or 0}"
+                ),
+            }
+        request._product_version = version
+    
+    return request._product_version
+
+
+def _is_shareable(request):
+    """
+    Check if the page carries no per-user data (anonymous visitor without a cart),
+    so the same response can be revalidated with ETag/Last-Modified.
+    """
+    if getattr(request, 'edge_cacheable', False):
+        return True
+    return (
+        not request.user.is_authenticated
+        and CART_SESSION_KEY not in request.session
+        and not has_cookie_cart(request)
+    )
+
+
+def product_detail_etag(request, pid):
+    """ETag of the product detail page for conditional GET."""
+    if not _is_shareable(request):
+        return None
+    version = _product_version(request, pid)
+    return version['etag'] if version else None
+
+
+def product_detail_last_modified(request, pid):
+    """Last-Modified of the product detail page for conditional GET."""
+    if not _is_shareable(request):
+        return None
+    version = _product_version(request, pid)
+    return version['last_modified'] if version else None
+
+
+@condition(etag_func=product_detail_etag, last_modified_func=product_detail_last_modified)
 def product_detail(request, pid):
     """
     Display product detail page
     Public view - accessible to all users
+    The product body is rendered without per-user data and cached by version,
+    wishlist state and cart badge are added by the page template
     """
     product = get_object_or_404(
         Product.objects.select_related('category', 'user'),
@@ -293,19 +453,56 @@ def product_detail(request, pid):
         product_status='published'
     )
     
-    # Get additional product images
-    product_images = ProductImages.objects.filter(product=product)
+    # Rendered product body, shared by all visitors
+    version = _product_version(request, pid)
+    detail_body = catalog_cache.get_or_set(
+        f"product_detail_body:{pid}:{version['etag']}",
+        lambda: render_to_string('products/partials/product_detail_body.html', {
+            'product': product,
+            # Get additional product images
+            'product_images': ProductImages.objects.filter(product=product),
+        }),
+        PRODUCT_DETAIL_CACHE_TIMEOUT
+    )
     
-    # Get related products from same category
-    related_products = Product.objects.filter(
-        category=product.category,
+    # Related products precomputed by `compute_related_products`
+    related_products = list(Product.objects.filter(
+        related_by__product=product,
         product_status='published'
-    ).exclude(pid=pid)[:4]
+    ).order_by('related_by__rank')[:4])
+    if not related_products:
+        # Not computed yet (new product): same category
+        related_products = Product.objects.filter(
+            category=product.category,
+            product_status='published'
+        ).exclude(pid=pid)[:4]
+    
+    # Approved reviews, newest first; the count is the denormalized rating_count
+    reviews = Review.objects.filter(
+        product=product,
+        is_approved=True
+    ).select_related('user').order_by('-created_at')
+    reviews_paginator = Paginator(reviews, REVIEWS_PER_PAGE)
+    reviews_paginator.count = product.rating_count
+    reviews_page = reviews_paginator.get_page(request.GET.get('reviews_page'))
+    
+    # Frequently bought together, computed by `compute_copurchases`
+    bought_together = CoPurchase.suggestions([product.id])
+    
+    # Per-user data
+    in_wishlist = request.user.is_authenticated and Wishlist.objects.filter(
+        user=request.user,
+        product=product
+    ).exists()
     
     context = {
         'product': product,
-        'product_images': product_images,
+        'detail_body': detail_body,
         'related_products': related_products,
+        'bought_together': bought_together,
+        'reviews': reviews_page,
+        'rating_histogram': product.rating_histogram(),
+        'in_wishlist': in_wishlist,
         'page_title': product.title,
     }
     
@@ -345,7 +542,7 @@ def catalog_view(request):
     page_obj = paginator.get_page(page_number)
     
     # Get all categories for filter
-    categories = Category.objects.all()
+    categories = Category.cached_list()
     
     context = {
         'products': page_obj,
@@ -0,0 +1,79 @@
+"""
+Database configuration, used by settings.DATABASES.
+
+DATABASE_URL selects the database, SQLite in BASE_DIR otherwise. Postgres
+connections come from Django's built-in pool (psycopg_pool) when psycopg 3
+is installed: one pool per process, sized to the threads that can query
+at the same time in it:
+
+    wsgi: WEB_THREADS (gunicorn threads per worker, default 1)
+    asgi: DB_POOL_ASGI_THREADS (default 10), the sync threads the async
+          views run their queries in
+
+plus the background threads (avatar renditions). DB_POOL_MIN_SIZE,
+DB_POOL_MAX_SIZE and DB_POOL_TIMEOUT override the defaults, DB_POOL=off
+disables the pool. With psycopg2, or without the pool, connections are
+persistent instead (CONN_MAX_AGE, not under ASGI). Connections are
+health-checked before use either way.
+
+Keep workers x DB_POOL_MAX_SIZE under the connection limit of the server.
+"""
+
+import importlib.util
+import os
+
+POOL_TIMEOUT = 10  # Seconds a request waits for a free connection
+CONN_MAX_AGE = 600
+ASGI_THREADS = 10
+
+
+def pool_available():
+    return all(importlib.util.find_spec(name) is not None for name in ('psycopg', 'psycopg_pool'))
+
+
+def pool_max_size(server_mode, background_threads=0):
+    """Connections a process can use at once under `server_mode`."""
+    if 'DB_POOL_MAX_SIZE' in os.environ:
+        return int(os.environ['DB_POOL_MAX_SIZE'])
+    if server_mode == 'asgi':
+        threads = int(os.environ.get('DB_POOL_ASGI_THREADS', ASGI_THREADS))
+    else:
+        threads = int(os.environ.get('WEB_THREADS', 1))
+    return threads + background_threads
+
+
+def pool_options(server_mode, background_threads=0):
+    max_size = pool_max_size(server_mode, background_threads)
+    return {
+        'min_size': min(int(os.environ.get('DB_POOL_MIN_SIZE', 1)), max_size),
+        'max_size': max_size,
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', POOL_TIMEOUT)),
+    }
+
+
+def database_config(base_dir, server_mode='wsgi', background_threads=0):
+    """Return DATABASES['default'] for the environment."""
+    persistent = 0 if server_mode == 'asgi' else CONN_MAX_AGE
+    if 'DATABASE_URL' not in os.environ and 'DYNO' not in os.environ:
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': base_dir / 'db.sqlite3',
+            'CONN_MAX_AGE': persistent,
+            'CONN_HEALTH_CHECKS': True,
+        }
+
+    import dj_database_url
+
+    config = dj_database_url.config(default='sqlite:///db.sqlite3', conn_health_checks=True)
+    use_pool = (
+        config['ENGINE'] == 'django.db.backends.postgresql'
+        and os.environ.get('DB_POOL', 'on') != 'off'
+        and pool_available()
+    )
+    if use_pool:
+        # The pool replaces persistent connections (Django refuses both)
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = pool_options(server_mode, background_threads)
+    else:
+        config['CONN_MAX_AGE'] = persistent
+    return config
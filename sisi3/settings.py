@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+
+from .database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -60,8 +63,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.StaticFilesMiddleware',  # WhiteNoise, ASGI-capable
+    'core.middleware.CompressionMiddleware',  # Must stay before anything touching the body
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.EdgeCacheMiddleware',  # Must stay before SessionMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.CookieCartMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -95,21 +102,125 @@ WSGI_APPLICATION = 'sisi3.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Server mode, read by gunicorn.conf.py too
+# 'wsgi': sync gunicorn workers (sisi3.wsgi), WEB_THREADS threads each
+# 'asgi': uvicorn workers under gunicorn (sisi3.asgi), the cart and wishlist
+#   AJAX views run async. Every request runs its queries in a new thread
+#   there: no persistent connections, only the Postgres pool reuses them
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+# Background threads building avatar renditions (accounts.avatars), they
+# take connections from the pool too
+AVATAR_WORKERS = 2
+
+# SQLite by default, DATABASE_URL (Heroku, a local Postgres) otherwise.
+# Postgres with psycopg 3 uses Django's connection pool, see sisi3/database.py
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': database_config(BASE_DIR, SERVER_MODE, background_threads=AVATAR_WORKERS),
+}
+
+
+# Caches
+# Shared cache (L2): Redis when REDIS_URL is set (needs the redis package),
+# otherwise files on disk shared by the workers of this host, and local
+# memory under the test runner. core.caching adds a per-process LRU (L1)
+# in front of it for the namespaces below.
+RUNNING_TESTS = len(sys.argv) > 1 and sys.argv[1] == 'test'
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'sisi',
+        }
+    }
+elif RUNNING_TESTS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR.parent / 'cache'),
+            'KEY_PREFIX': 'sisi',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
     }
+
+# Namespaces of core.caching, timeouts in seconds:
+# timeout: freshness, stale: served while one request recomputes,
+# local_timeout: lifetime in the per-process L1 (0: L2 only, deletes are immediate)
+CACHE_NAMESPACES = {
+    'catalog': {'timeout': 60 * 60 * 24, 'stale': 60 * 5, 'local_timeout': 60 * 5},
+    'cart': {'timeout': 60 * 10, 'stale': 0, 'local_timeout': 0},
+    'reference': {'timeout': 60 * 60, 'stale': 60 * 5, 'local_timeout': 60},
 }
+CACHE_L1_MAX_ENTRIES = 1000
+CACHE_VERSION_CHECK_INTERVAL = 2  # Seconds between checks of a namespace or table version
+
+
+# Edge cache for anonymous storefront pages (core.middleware.EdgeCacheMiddleware)
+# Enable only when a CDN or reverse proxy sits in front of the site
+EDGE_CACHE_ENABLED = os.environ.get('EDGE_CACHE_ENABLED') == 'True'
+EDGE_CACHE_MAX_AGE = 300  # s-maxage in seconds
+EDGE_CACHE_URL_NAMES = [
+    'core:home',
+    'products:catalog',
+    'products:category-products',
+    'products:product-detail',
+]
 
-# Heroku Database Configuration
-if 'DYNO' in os.environ:
-    import dj_database_url
-    DATABASES['default'] = dj_database_url.config(
-        default='sqlite:///db.sqlite3',
-        conn_max_age=600,
-        conn_health_checks=True,
-    )
+
+# Session strategy
+# 'db': database sessions (Django default)
+# 'cached_db': sessions read from the cache, written through to the database
+# 'cookie_cart': cached_db, and guest carts kept in a signed cookie until
+#   checkout or login (core.cookie_cart), so guests get no session at all
+SESSION_STRATEGY = os.environ.get('SESSION_STRATEGY', 'db')
+if SESSION_STRATEGY in ('cached_db', 'cookie_cart'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+COOKIE_CART_ENABLED = SESSION_STRATEGY == 'cookie_cart'
+COOKIE_CART_NAME = 'guest_cart'
+COOKIE_CART_MAX_ITEMS = 20  # Larger carts move to the database
+COOKIE_CART_MAX_AGE = 60 * 60 * 24 * 30  # 30 days
+
+
+# Per-request query budgets (core.middleware.QueryBudgetMiddleware)
+# Over budget requests are logged, under the test runner they raise
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_DEFAULT = 50
+QUERY_BUDGETS = {
+    'core:home': 10,
+    'core:cart': 15,
+    'core:checkout': 20,
+    'core:orders': 15,
+    'products:catalog': 15,
+    'products:search': 15,
+    'products:category-products': 15,
+    'products:product-detail': 15,
+    'ordini:dashboard': 20,
+    'ordini:order-list': 20,
+}
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 5  # Same query shape repeated this many times
+QUERY_BUDGET_RAISE = RUNNING_TESTS
+# Share of the requests recorded in the endpoint statistics: every one with
+# Redis, a sample with the file-based cache, where every write scans the cache directory
+QUERY_STATS_SAMPLE_RATE = 1.0 if os.environ.get('REDIS_URL') else 0.05
+
+# Pricing of carts and orders (core.pricing): shipping zones and bands and
+# VAT classes are edited in the admin, these apply when nothing matches
+PRICING_DEFAULT_COUNTRY = 'IT'  # Carts, before the address is known
+PRICING_DEFAULT_VAT_RATE = '22.00'  # Percent, without a default VatClass
+PRICING_DEFAULT_WEIGHT = '0'  # kg, products without a weight
+PRICING_FALLBACK_SHIPPING = '5.00'
+PRICING_FALLBACK_FREE_SHIPPING_OVER = '50.00'
+
+# Avatar renditions (accounts.avatars), built by background threads after the upload
+AVATAR_RENDITION_SIZES = (300, 96, 48)
+AVATAR_ASYNC = not RUNNING_TESTS  # Inline under the test runner, AVATAR_WORKERS is with DATABASES
 
 
 # Password validation
@@ -150,9 +261,29 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR.parent / 'static']
 STATIC_ROOT = BASE_DIR.parent / 'staticfiles'
 
-# Heroku Static Files Configuration
-if 'DYNO' in os.environ:
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Hashed file names and .gz/.br copies written by collectstatic, on every
+# deployment; WhiteNoise serves hashed files with an immutable Cache-Control.
+# With DEBUG the templates keep the plain names, so collectstatic is not needed
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if RUNNING_TESTS
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+WHITENOISE_MAX_AGE = 0 if DEBUG else 60 * 60  # Unhashed files only
+
+# Compression of dynamic responses (core.middleware.CompressionMiddleware)
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024  # Bytes, smaller bodies are sent as they are
+COMPRESSION_CONTENT_TYPES = ('text/html', 'application/json')
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11, 5 is close to gzip speed with smaller output
+# Brotli for HTML/JSON too: smaller, but without the BREACH mitigation of gzip
+COMPRESSION_BROTLI_DYNAMIC = False
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR.parent / 'media'
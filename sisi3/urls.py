@@ -25,6 +25,7 @@ urlpatterns = [
     path('accounts/', include('accounts.urls')),
     path('products/', include('products.urls')),
     path('ordini/', include('ordini.urls')),
+    path('api/v1/', include('products.api_urls')),
     path('ckeditor5/', include('django_ckeditor_5.urls')),
 ]
 